@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Compare the parse engines of pycscope on a tree of Python source: the time
+each takes to index every file, how many files each indexes exactly as the
+first engine does, and the share of the marked symbols (definitions, calls,
+imports, assignments ...) of the first engine each finds (recall), and of
+its own which are right (precision).
+
+Usage: benchengines.py [-e engine1,engine2,...] [-v] [files or dirs ...]
+"""
+
+from __future__ import print_function
+
+import getopt, os, re, sys, time
+from collections import Counter
+import pycscope
+
+
+def readFiles(basepath, args):
+    """ Return a list of (file name, source) tuples for the Python files
+        found under the given files and directories.
+    """
+    sources = []
+    for fname in pycscope.genFiles(basepath, args, True, []):
+        try:
+            with open(os.path.join(basepath, fname)) as f:
+                sources.append((fname, f.read()))
+        except (IOError, UnicodeDecodeError):
+            continue
+    return sources
+
+
+def runEngine(engine, sources):
+    """ Index the sources with the given engine, returning the time taken
+        and a dictionary of the index of each file (or None for the files
+        which could not be parsed).
+    """
+    pycscope.engine = engine
+    results = {}
+    start = time.time()
+    for fname, source in sources:
+        buff = []
+        try:
+            pycscope.parseSource(source, buff, 0)
+        except Exception:
+            results[fname] = None
+        else:
+            results[fname] = ''.join(buff)
+    return time.time() - start, results
+
+
+def markedSymbols(index):
+    """ Count the marked symbols of the index of a file by (line number,
+        mark, name).
+    """
+    marks = Counter()
+    lineno = None
+    prev = ''
+    for line in index.split('\n'):
+        if not prev:
+            m = lineno_re.match(line)
+            if m is not None:
+                lineno = int(m.group(1))
+        if line.startswith('\t') and not line.startswith('\t@'):
+            marks[(lineno, line[1], line[2:])] += 1
+        prev = line
+    return marks
+
+lineno_re = re.compile(r'^(\d+) ')
+
+
+def compareMarks(reference, results):
+    """ Return the recall and precision of the marked symbols of results,
+        against those of the reference, over the files both indexed.
+    """
+    found = expected = right = 0
+    for fname in reference:
+        if reference[fname] is None or results[fname] is None:
+            continue
+        exp = markedSymbols(reference[fname])
+        res = markedSymbols(results[fname])
+        expected += sum(exp.values())
+        found += sum(res.values())
+        right += sum((exp & res).values())
+    return (float(right) / max(expected, 1), float(right) / max(found, 1))
+
+
+def main(argv):
+    opts, args = getopt.getopt(argv[1:], "e:v")
+    engines = list(pycscope.engines)
+    verbose = False
+    for o, a in opts:
+        if o == "-e":
+            engines = a.split(',')
+        if o == "-v":
+            verbose = True
+    if not args:
+        args = ["."]
+
+    sources = readFiles(os.getcwd(), args)
+    size = sum([ len(source) for fname, source in sources ])
+    print("%d files, %d bytes" % (len(sources), size))
+
+    reference = None
+    for engine in engines:
+        elapsed, results = runEngine(engine, sources)
+        line = "%-6s %8.3fs %8.1f KB/s" % (engine, elapsed, size / 1024.0 / max(elapsed, 1e-6))
+        if reference is None:
+            reference = (elapsed, results)
+        else:
+            same = [ fname for fname, source in sources if results[fname] == reference[1][fname] ]
+            line += "  %5.2fx  %d/%d files identical" % (reference[0] / max(elapsed, 1e-6), len(same), len(sources))
+            line += "  marks %.2f%% recall %.2f%% precision" % tuple([ 100 * r for r in compareMarks(reference[1], results) ])
+            if verbose:
+                for fname, source in sources:
+                    if results[fname] != reference[1][fname]:
+                        line += "\n    differs: %s" % fname
+        failed = len([ fname for fname in results if results[fname] is None ])
+        if failed:
+            line += "  (%d files not parsed)" % failed
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -11,7 +11,12 @@ __author__ = "Peter Portante (peter\x2Ea\x2Eportante\x40gmail\x2Ecom)"
 __copyright__ = "Copyright 2019 Peter Portante.  See LICENSE for details."
 __date__ = "2019/10/17"
 __version__ = "1.2.3"
-__usage__ = """Usage: pycscope.py [-D] [-R] [-S] [-V] [-f reffile] [-e path1[,path2,...]] [-i srclistfile] [files ...]
+__usage__ = """Usage: pycscope.py [-D] [-R] [-S] [-V] [-f reffile] [-e path1[,path2,...]] [-i srclistfile] [-j jobs] [--incremental]
+                   [--engine engine] [--lite] [--gitignore] [--no-default-excludes] [--walk-threads threads]
+                   [--git] [--since rev] [--update file] [--read-ahead files] [--shard-by mode] [--merge]
+                   [--partition K/N] [--assemble] [--find query name] [--serve socket]
+                   [--sqlite dbfile] [--text-index]
+                   [--cache-dir dir [--cache-size size] [--cache-compress]] [--watch [--watch-poll secs]] [files ...]
 
 -D                Dump the (C)oncrete (S)yntax (T)ree generated by the parser for each file
 -R                Recurse directories for files
@@ -19,10 +24,98 @@ __usage__ = """Usage: pycscope.py [-D] [-R] [-S] [-V] [-f reffile] [-e path1[,pa
 -V                Print version and exit
 -f reffile        Use 'reffile' as cross-ref file name instead of 'cscope.out'
 -i srclistfile    Use the contents of 'srclistfile' as the list of source files to scan
--e path1,path2..  Exclude the list of paths from being parsed"""
+-e path1,path2..  Exclude the list of paths from being parsed; glob patterns
+                  without a '/' (e.g. '*_pb2.py') match names at any depth
+--gitignore       Also exclude the files ignored by .gitignore files
+--no-default-excludes
+                  Do not skip version control, cache and virtualenv
+                  directories (.git, __pycache__, .tox ...) when recursing
+--walk-threads threads
+                  List directories with 'threads' threads when recursing, for
+                  trees on network filesystems (the files found are the same)
+--git             Only index the files tracked by git, as found in the index
+                  of the checkout (.git/index), without walking the tree; with
+                  --incremental, files are compared by their git blob SHA
+--since rev       Update 'reffile' for the files git reports as added, changed
+                  or deleted since the revision 'rev', rather than indexing
+                  every file (the files added must be known to git)
+--update file     Update the index of 'file' alone in 'reffile' (may be given
+                  more than once), e.g. when saving it in an editor; only
+                  'file' is parsed, but 'reffile' is still written again as a
+                  whole, so each update takes time in proportion to its size
+--read-ahead files
+                  Read up to 'files' files with a pool of threads ahead of the
+                  one being parsed, overlapping waiting on slow or cold storage
+                  with parsing
+--shard-by mode   Write a database per shard of the files rather than a single
+                  'reffile': per top-level 'package', per directory down to
+                  'depth:N', or per 'size:SIZE' of source; the databases are
+                  written below 'reffile.d', and listed in 'reffile.shards'
+--merge           Merge the databases given (as the files) into 'reffile',
+                  without parsing any file; a file found in several databases
+                  is taken from the last one
+--partition K/N   Only index the K-th of N parts of the files, balanced by size,
+                  to build the database in parts, on several machines
+--assemble        Assemble the partial databases given (as the files) into
+                  'reffile', with the files in the order of a single build
+--find query name Answer a query from 'reffile', printing the lines found as
+                  cscope -L does: the definitions ('def'), references
+                  ('symbol') or assignments ('assign') of a symbol, the calls
+                  made by a function ('callees') or to it ('callers'), the
+                  imports of a module ('include'), a file ('file'), or the
+                  lines holding a string ('text') or matching a regular
+                  expression ('egrep')
+--serve socket    Keep 'reffile' loaded, answering queries on the Unix socket
+                  'socket' as cscope's line-oriented mode (cscope -l) does, and
+                  loading it again whenever it changes
+--sqlite dbfile   Also write the symbols of 'reffile' to the SQLite database
+                  'dbfile', one row per symbol: file, line, mark, symbol and the
+                  function holding it (see pycscope/sqlitedb.py for the schema)
+--text-index      Also write a trigram index of the source of the files to
+                  'reffile.trigrams', so that 'text' and 'egrep' queries only
+                  search the files which may hold a match
+-j jobs           Parse files using 'jobs' worker processes (0 means one per CPU)
+--incremental     Only parse files changed since 'reffile' was last written,
+                  reusing the index of the others (recorded in 'reffile.sections')
+--engine engine   Parse files with 'engine': cst (the concrete syntax tree of the
+                  parser module, the default), ast (the ast and tokenize
+                  modules, the default from Python 3.10), or lite (the tokenize
+                  module alone: faster, but not as accurate)
+--lite            Same as --engine lite
+--cache-dir dir   Cache the index of each file in 'dir', keyed by the file's
+                  contents, so identical sources are never parsed twice
+--cache-size size Evict least recently used entries to keep the cache under
+                  'size' bytes (K, M, G suffixes allowed, default 256M, 0 for no limit)
+--cache-compress  Compress cache entries
+--watch           Keep running, rewriting 'reffile' whenever the files change
+                  (found with inotify on Linux, by polling elsewhere)
+--watch-poll secs Find changes by scanning the files every 'secs' seconds"""
 
 import getopt, sys, os, string, re
-import keyword, parser, symbol, token
+import keyword, token
+try:
+    import parser, symbol
+except ImportError:
+    # Removed in Python 3.10, where only the ast engine is available
+    parser = symbol = None
+import codecs, collections, heapq, itertools, mmap, multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # The backport of os.scandir() for Python 2.7
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from pycscope.cache import FragmentCache
+from pycscope.excludes import Excludes, isIgnored
+from pycscope.invlib import InvertedIndexWriter, invertedNames
 
 
 class Mark(object):
@@ -80,23 +173,57 @@ class Mark(object):
 
 markFuncEnd = Mark(Mark.FUNC_END)
 
+# The formatted form of each valid mark (see Mark.format()), prefixed to
+# the symbols of an IndexLine; no mark is the empty string.
+mark_prefixes = dict([ (mark, "\t" + mark) for mark in (Mark.FILE, Mark.FUNC_DEF, Mark.FUNC_CALL, Mark.FUNC_END,
+                                                         Mark.INCLUDE, Mark.ASSIGN, Mark.CLASS, Mark.GLOBAL, Mark.LOCAL) ])
+mark_prefixes[''] = ''
+
 # Get the list of Python keywords and add a few common builtins
 kwlist = keyword.kwlist
 kwlist.extend(("True", "False", "None"))
 
 strings_as_symbols = False
 
+# Strings holding a valid Python identifier, which are interpreted as
+# symbols with -S
+string_symbol_re = re.compile("^('|\"|'''|\"\"\")([A-Za-z_][A-Za-z_0-9]*)('|\"|'''|\"\"\")$")
+
+# The engine parsing the source: "cst" walks the concrete syntax tree built
+# by the parser module, "ast" uses the ast and tokenize modules (see
+# pycscope.astparse), and "lite" the tokenize module alone (see
+# pycscope.liteparse).
+engines = ("cst", "ast", "lite")
+if parser is not None:
+    engine = "cst"
+else:
+    engine = "ast"
+
+# The number of files read ahead of the one being parsed (see
+# genReadAhead()), none by default.
+readahead = 0
+
+# The trigrams of the source of each file parsed (see
+# pycscope.textindex), collected for --text-index, by file name.
+text_trigrams = None
+
 def main(argv=None):
     """Parse command line args and act accordingly.
     """
-    global strings_as_symbols
+    global strings_as_symbols, engine, readahead, text_trigrams
 
     if argv is None:
         argv = sys.argv
 
     # Parse the command line arguments
     try:
-        opts, args = getopt.getopt(argv[1:], "DRSVe:f:i:", ["exclude="])
+        opts, args = getopt.getopt(argv[1:], "DRSVe:f:i:j:", ["exclude=", "jobs=", "incremental", "engine=", "lite",
+                                                          "cache-dir=", "cache-size=", "cache-compress", "watch",
+                                                          "watch-poll=", "gitignore", "no-default-excludes",
+                                                          "walk-threads=", "git", "since=", "update=",
+                                                          "read-ahead=", "shard-by=", "merge",
+                                                          "partition=", "assemble", "find=",
+                                                          "serve=", "sqlite=", "text-index"])
     except getopt.GetoptError:
         print(__usage__)
         return 2
@@ -105,6 +232,30 @@ def main(argv=None):
     recurse = False
     indexfn = "cscope.out"
     exclude = []
+    gitignore = False
+    defaultexcludes = True
+    walkthreads = 1
+    usegit = False
+    since = None
+    updates = []
+    shardby = None
+    merging = False
+    assembling = False
+    partition = None
+    find = None
+    serve = None
+    sqlitepath = None
+    textindex = False
+    jobs = 1
+    incremental = False
+    # cscope's inverted index (see pycscope.invlib) is not offered as -q
+    # until its layout has been checked with cscope itself
+    inverted = False
+    cachedir = None
+    cachesize = 256 * 1024 * 1024
+    cachecompress = False
+    watching = False
+    poll = None
     for o, a in opts:
         if o == "-D":
             debug = True
@@ -124,36 +275,425 @@ def main(argv=None):
             # Exclude list should contain full path to each file or directory to
             # exclude relative to the current working directory.
             exclude = [ os.path.normpath(relpath) for relpath in a.split(',') ]
+        if o in ("-j", "--jobs"):
+            try:
+                jobs = int(a)
+            except ValueError:
+                jobs = -1
+            if jobs < 0:
+                print(__usage__)
+                return 2
+            if jobs == 0:
+                jobs = multiprocessing.cpu_count()
+        if o == "--incremental":
+            incremental = True
+        if o == "--engine":
+            if a not in engines or (a == "cst" and parser is None):
+                print(__usage__)
+                return 2
+            engine = a
+        if o == "--lite":
+            engine = "lite"
+        if o == "--gitignore":
+            gitignore = True
+        if o == "--no-default-excludes":
+            defaultexcludes = False
+        if o == "--git":
+            usegit = True
+        if o == "--since":
+            since = a
+        if o == "--update":
+            updates.append(a)
+        if o == "--read-ahead":
+            try:
+                readahead = int(a)
+            except ValueError:
+                readahead = -1
+            if readahead < 0:
+                print(__usage__)
+                return 2
+        if o == "--merge":
+            merging = True
+        if o == "--find":
+            if a not in query_kinds:
+                print(__usage__)
+                return 2
+            find = a
+        if o == "--sqlite":
+            sqlitepath = a
+        if o == "--serve":
+            serve = a
+        if o == "--text-index":
+            textindex = True
+        if o == "--assemble":
+            assembling = True
+        if o == "--partition":
+            partition = parsePartition(a)
+            if partition is None:
+                print(__usage__)
+                return 2
+        if o == "--shard-by":
+            shardby = parseShardBy(a)
+            if shardby is None:
+                print(__usage__)
+                return 2
+        if o == "--walk-threads":
+            try:
+                walkthreads = int(a)
+            except ValueError:
+                walkthreads = 0
+            if walkthreads < 1:
+                print(__usage__)
+                return 2
+        if o == "--cache-dir":
+            cachedir = a
+        if o == "--cache-size":
+            cachesize = parseSize(a)
+            if cachesize is None:
+                print(__usage__)
+                return 2
+        if o == "--cache-compress":
+            cachecompress = True
+        if o == "--watch":
+            watching = True
+        if o == "--watch-poll":
+            try:
+                poll = float(a)
+            except ValueError:
+                poll = -1
+            if poll <= 0:
+                print(__usage__)
+                return 2
+
+    if find is not None:
+        if len(args) != 1:
+            print(__usage__)
+            return 2
+        try:
+            db = Database(indexfn)
+        except (EnvironmentError, ValueError) as e:
+            print("pycscope.py: %s" % e)
+            return 2
+        try:
+            found = db.find(find, args[0])
+        except re.error as e:
+            print("pycscope.py: %s: %s" % (args[0], e))
+            return 2
+        for fname, func, lineno, text in found:
+            print("%s %s %d %s" % (fname, func, lineno, text))
+        return 0
+
+    if serve is not None:
+        if args or watching or merging or assembling or (sqlitepath is not None) or textindex:
+            print(__usage__)
+            return 2
+        try:
+            server = QueryServer(os.path.join(os.getcwd(), indexfn), serve)
+        except (EnvironmentError, ValueError) as e:
+            print("pycscope.py: %s" % e)
+            return 2
+        server.run()
+        return 0
+
+    if merging or assembling:
+        if (len(args) == 0) or watching or updates or (since is not None) or (shardby is not None) \
+                or (partition is not None) or textindex:
+            print(__usage__)
+            return 2
+        try:
+            mergeIndex(os.getcwd(), os.path.join(os.getcwd(), indexfn), args, inverted, assembling)
+            if sqlitepath is not None:
+                writeSqlite(os.path.join(os.getcwd(), indexfn), sqlitepath)
+        except (EnvironmentError, ValueError) as e:
+            print("pycscope.py: %s" % e)
+            return 2
+        return 0
 
     # Search current dir by default
     if len(args) == 0:
         args = "."
 
+    exclude = Excludes(exclude, defaultexcludes, gitignore)
+
     # Always works on the path relative to this process's current working
     # directory.
     basepath = os.getcwd()
 
-    # Parse the given list of files/dirs
-    gen = genFiles(basepath, args, recurse, exclude)
+    if cachedir is not None:
+        cache = FragmentCache(os.path.join(basepath, cachedir), cacheSalt(), cachesize, cachecompress)
+    else:
+        cache = None
 
-    indexbuff, fnamesbuff = work(basepath, gen, debug)
+    indexpath = os.path.join(basepath, indexfn)
 
-    # Symbol data for the last file ends with a file mark
-    indexbuff.append("\n%s" % Mark(Mark.FILE))
+    if updates:
+        if watching or (since is not None) or (shardby is not None) or (partition is not None) or textindex:
+            print(__usage__)
+            return 2
+        try:
+            updateIndex(basepath, indexpath, updates, debug, cache)
+            if sqlitepath is not None:
+                writeSqlite(indexpath, sqlitepath)
+        except (EnvironmentError, ValueError) as e:
+            print("pycscope.py: %s" % e)
+            return 2
+        return 0
+
+    if watching:
+        if usegit or (since is not None) or (shardby is not None) or (partition is not None) \
+                or (sqlitepath is not None) or textindex:
+            print(__usage__)
+            return 2
+        watcher = IndexWatcher(basepath, args, recurse, exclude, indexpath, inverted, debug, jobs, cache, poll,
+                               walkthreads)
+        watcher.run()
+        return 0
 
-    if sys.hexversion < 0x03000000:
-        fout = open(os.path.join(basepath, indexfn), 'wb')
+    # Parse the given list of files/dirs
+    keyfunc = None
+    if usegit:
+        try:
+            gitindex = GitIndex(basepath)
+        except (EnvironmentError, ValueError) as e:
+            print("pycscope.py: %s" % e)
+            return 2
+        gen = gitindex.genFiles(args, recurse, exclude)
+        keyfunc = gitindex.key
     else:
-        fout = open(os.path.join(basepath, indexfn), 'w', newline='\n')
+        gen = genFiles(basepath, args, recurse, exclude, threads=walkthreads)
+
+    if partition is not None:
+        if (since is not None) or (shardby is not None):
+            print(__usage__)
+            return 2
+        gen = partitionFiles(basepath, list(gen), partition[0], partition[1])
+
+    if shardby is not None:
+        if (since is not None) or (sqlitepath is not None) or textindex:
+            print(__usage__)
+            return 2
+        writeShards(basepath, indexpath, list(gen), shardby, inverted, debug, jobs, incremental, cache, keyfunc,
+                    args, recurse)
+        if cache is not None:
+            cache.prune()
+        return 0
+
+    reader = None
+    if since is not None:
+        # The index to update must exist, having been built from here
+        try:
+            reader = IndexReader(indexpath)
+            if reader.basepath != basepath:
+                raise ValueError("%s: not built in %s" % (indexfn, basepath))
+            changes = changedFiles(basepath, since)
+        except (EnvironmentError, ValueError) as e:
+            if reader is not None:
+                reader.close()
+            print("pycscope.py: %s" % e)
+            return 2
+    elif incremental:
+        try:
+            reader = IndexReader(indexpath)
+        except (IOError, OSError, ValueError):
+            # No usable index to start from, everything gets parsed
+            pass
 
-    writeIndex(basepath, fout, indexbuff, fnamesbuff)
-    fout.close()
+    if since is not None:
+        sections = genSince(basepath, args, recurse, exclude, debug, jobs, reader, changes, cache)
+    elif incremental:
+        stamps = []
+        sections = genIncremental(basepath, gen, debug, jobs, reader, stamps, cache, keyfunc)
+    else:
+        sections = genIndex(basepath, gen, debug, jobs, cache)
+    if textindex:
+        text_trigrams = {}
+    written = writeDatabase(basepath, indexpath, sections, inverted, reader)
+
+    if textindex:
+        writeTextIndex(basepath, indexpath + trigrams_ext, [ fname for fname, offset, length in written ],
+                       text_trigrams)
+        text_trigrams = None
+
+    if incremental and (since is None):
+        writeSections(indexpath, written, dict(stamps))
+    elif os.path.exists(indexpath + sections_ext):
+        # Those of the database replaced no longer apply
+        os.unlink(indexpath + sections_ext)
+
+    if cache is not None:
+        cache.prune()
+
+    if sqlitepath is not None:
+        try:
+            writeSqlite(indexpath, sqlitepath)
+        except EnvironmentError as e:
+            print("pycscope.py: %s" % e)
+            return 2
 
     return 0
 
 
+def parseSize(val):
+    """ Parse a size given on the command line, in bytes with an optional
+        K, M or G suffix; None is returned for an invalid size.
+    """
+    mult = 1
+    if val[-1:].upper() in size_suffixes:
+        mult = size_suffixes[val[-1:].upper()]
+        val = val[:-1]
+    try:
+        size = int(val) * mult
+    except ValueError:
+        return None
+    if size < 0:
+        return None
+    return size
+
+size_suffixes = { 'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024 }
+
+
+def cacheSalt():
+    """ The settings which affect the index generated for a given source,
+        used along with the source to address entries of the fragment cache.
+    """
+    return "pycscope %s python %s strings_as_symbols %d engine %s" % (__version__, sys.version, strings_as_symbols, engine)
+
+
+def replaceFile(src, dst):
+    """ Rename the src file to dst, replacing dst if it exists.
+    """
+    if sys.hexversion >= 0x03030000:
+        os.replace(src, dst)
+    else:
+        if sys.platform == 'win32' and os.path.exists(dst):
+            os.unlink(dst)
+        os.rename(src, dst)
+
+
+def toBytes(val):
+    """ Index contents are written as UTF-8 encoded bytes.
+    """
+    if isinstance(val, bytes):
+        return val
+    return val.encode('utf-8')
+
+
+class IndexWriter(object):
+    """ Streams an index to a seekable binary file, one file section at a
+        time, as each file is parsed.
+
+        The header records the offset of the trailer, which is only known
+        once all the sections have been written, so a placeholder is
+        written first, and patched by close() along with writing the
+        trailer. The same goes for the number of terms of the inverted
+        index, when an InvertedIndexWriter is given to collect the
+        postings of the symbols of each section.
+    """
+    def __init__(self, basepath, fout, inverted=None):
+        self.basepath = basepath
+        self.fout = fout
+        self.inverted = inverted
+        self.fnames = []
+        self.sections = []
+        header = self.header(0, 0)
+        fout.write(header)
+        self.offset = len(header)
+
+    def header(self, nterms, trailer_offset):
+        """ The header of the index, flagging it as having an inverted
+            index (holding 'nterms' terms) if one is written along with it.
+        """
+        if self.inverted is not None:
+            return toBytes("cscope 15 %s -c -q %010d %010d" % (self.basepath, nterms, trailer_offset))
+        return toBytes("cscope 15 %s -c %010d" % (self.basepath, trailer_offset))
+
+    def write(self, fname, section):
+        """ Write the section of the index for the given file; the section
+            is either a string, bytes, or a list of strings.
+        """
+        if isinstance(section, list):
+            section = ''.join(section)
+        data = toBytes(section)
+        self.fout.write(data)
+        if self.inverted is not None:
+            self.inverted.add(data, self.offset, len(self.fnames))
+        self.sections.append((fname, self.offset, len(data)))
+        self.offset += len(data)
+        self.fnames.append(fname)
+
+    def close(self):
+        """ Finish the index, writing the trailer (and inverted index) and
+            patching the header. The file itself is left open.
+        """
+        fout = self.fout
+
+        # Symbol data for the last file ends with a file mark
+        fout.write(toBytes("\n%s" % Mark(Mark.FILE)))
+        self.offset += 3
+
+        # Write trailer info, which starts after the first newline
+        fnames = toBytes('\n'.join(self.fnames) + '\n')
+        fout.write(b"\n1\n.\n0\n")
+        fout.write(toBytes("%d\n" % len(self.fnames)))
+        fout.write(toBytes("%d\n" % len(fnames)))
+        fout.write(fnames)
+
+        nterms = 0
+        if self.inverted is not None:
+            nterms = self.inverted.close()
+
+        fout.seek(0)
+        fout.write(self.header(nterms, self.offset + 1))
+        fout.seek(0, os.SEEK_END)
+
+
+def writeDatabase(basepath, indexpath, sections, inverted=False, reader=None):
+    """ Write the index of the given (file name, section) tuples to
+        indexpath, along with its inverted index if requested.
+
+        The index is written to a temporary file renamed into place once
+        complete, so the existing index remains usable (and can be read
+        for incremental updates) in the meantime. The IndexReader the
+        sections are read from (or list of them), if any, is closed before
+        the index is replaced.
+
+        Returns the list of (file name, offset, length) tuples of the
+        sections written.
+    """
+    paths = [indexpath]
+    if inverted:
+        paths.extend(invertedNames(indexpath))
+    tmppaths = [ "%s.%d.tmp" % (path, os.getpid()) for path in paths ]
+    fout = open(tmppaths[0], 'wb')
+    try:
+        try:
+            if inverted:
+                writer = IndexWriter(basepath, fout, InvertedIndexWriter(*tmppaths[1:]))
+            else:
+                writer = IndexWriter(basepath, fout)
+            for fname, section in sections:
+                writer.write(fname, section)
+            writer.close()
+        finally:
+            fout.close()
+            if isinstance(reader, list):
+                for r in reader:
+                    r.close()
+            elif reader is not None:
+                reader.close()
+        for tmppath, path in zip(tmppaths, paths):
+            replaceFile(tmppath, path)
+    except:
+        for tmppath in tmppaths:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+        raise
+    return writer.sections
+
+
 def writeIndex(basepath, fout, indexbuff, fnamesbuff):
-    """Write the index buffer to the output file.
+    """Write the index buffer to the output file, all at once (see
+       IndexWriter for writing it as it is generated).
     """
     # Write the header and index
     index = ''.join(indexbuff)
@@ -170,26 +710,595 @@ def writeIndex(basepath, fout, indexbuff, fnamesbuff):
     fout.write(fnames)
 
 
-def work(basepath, gen, debug):
+# Extension of the file kept next to an index written in incremental mode,
+# recording the key of each file indexed (see fileKey()), and the offset and
+# length of its section of the index.
+sections_ext = ".sections"
+
+def sectionsHeader(indexpath):
+    """ The first line of the sections file of the index at indexpath,
+        identifying the settings which affect the contents of the index
+        (-S and the engine), and the index itself, by its size and
+        modification time; sections recorded under different settings, or
+        for another index, cannot be reused. None is returned if the index
+        does not exist.
+    """
+    try:
+        st = os.stat(indexpath)
+    except OSError:
+        return None
+    return "pycscope-sections 3 %s %s %d %s %d %r" % (__version__, sys.version.split()[0], strings_as_symbols, engine,
+                                                      st.st_size, st.st_mtime)
+
+
+def readSections(indexpath):
+    """ Read the sections recorded in the sections file of the index at
+        indexpath, returned as a list of (file name, key, offset, length)
+        tuples, in the order of the index, the key being None if it was
+        not known. An empty list is returned if the file does not exist,
+        or was recorded under different settings or for another index.
+    """
+    try:
+        f = open(indexpath + sections_ext, 'r')
+    except IOError:
+        return []
+
+    sections = []
+    with f:
+        header = sectionsHeader(indexpath)
+        if (header is None) or (f.readline().rstrip('\n') != header):
+            return sections
+        for line in f:
+            key, offset, length, fname = line.rstrip('\n').split('\t', 3)
+            if key == '-':
+                key = None
+            sections.append((fname, key, int(offset), int(length)))
+    return sections
+
+
+def writeSections(indexpath, sections, keys):
+    """ Write the (file name, offset, length) tuples of the sections of the
+        index at indexpath, as returned by writeDatabase(), to its sections
+        file, along with the key of each file, from the keys dictionary.
+    """
+    with open(indexpath + sections_ext, 'w') as f:
+        f.write("%s\n" % sectionsHeader(indexpath))
+        for fname, offset, length in sections:
+            key = keys.get(fname)
+            if key is None:
+                key = '-'
+            f.write("%s\t%d\t%d\t%s\n" % (key, offset, length, fname))
+
+
+class IndexReader(object):
+    """ Read access to the header, trailer and per-file sections of an
+        existing cscope database written by pycscope.
+
+        The database is memory mapped, so sections are only read in when
+        they are actually used. A ValueError is raised if the file is not
+        a database in the expected format.
+    """
+    header_re = re.compile(br'^cscope (\d+) (.*?)((?: -[cT]| -q \d+)*) (\d+)$')
+
+    def __init__(self, indexpath):
+        self.indexpath = indexpath
+        self.f = open(indexpath, 'rb')
+        try:
+            self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # An empty file can't be mapped
+            self.f.close()
+            raise ValueError("%s: not a cscope database" % indexpath)
+        try:
+            self.parse(indexpath)
+        except:
+            self.close()
+            raise
+
+    def parse(self, indexpath):
+        """ Parse the header and trailer of the database.
+        """
+        data = self.data
+        self.index_start = data.find(b'\n')
+        m = self.header_re.match(data[:self.index_start])
+        if m is None:
+            raise ValueError("%s: not a cscope database" % indexpath)
+        self.basepath = self.decode(m.group(2))
+        self.inverted = b'-q' in m.group(3)
+
+        # The index ends with a file mark with no file name, immediately
+        # followed by the trailer.
+        trailer_offset = int(m.group(4))
+        self.index_end = trailer_offset - 4
+        if (self.index_end < self.index_start) or (data[self.index_end:trailer_offset] != b'\n\t@\n'):
+            raise ValueError("%s: bad trailer offset" % indexpath)
+
+        try:
+            trailer = data[trailer_offset:].split(b'\n')
+            idx = int(trailer[0]) + 1
+            idx += int(trailer[idx]) + 1
+            nfiles = int(trailer[idx])
+            self.fnames = [ self.decode(fname) for fname in trailer[idx + 2:idx + 2 + nfiles] ]
+        except (ValueError, IndexError):
+            raise ValueError("%s: bad trailer" % indexpath)
+
+    def decode(self, val):
+        """ File names are handled as strings.
+        """
+        if sys.hexversion < 0x03000000:
+            return val
+        return val.decode('utf-8')
+
+    def sections(self):
+        """ Return a list of (file name, offset, length) tuples, one per
+            file section found in the index, in the order they appear.
+        """
+        data = self.data
+        sections = []
+        offset = self.index_start
+        end = self.index_end + 3
+        while offset < self.index_end:
+            nxt = data.find(b'\n\t@', offset + 3, end)
+            if nxt < 0:
+                raise ValueError("unterminated section at offset %d" % offset)
+            fname = data[offset + 3:data.find(b'\n', offset + 3, nxt + 1)]
+            sections.append((self.decode(fname), offset, nxt - offset))
+            offset = nxt
+        return sections
+
+    def section(self, offset, length):
+        """ Return the contents (bytes) of a section.
+        """
+        return self.data[offset:offset + length]
+
+    def close(self):
+        self.data.close()
+        self.f.close()
+
+
+def updateIndex(basepath, indexpath, fnames, debug=False, cache=None):
+    """ Update the index of the given files in an existing database, built
+        from basepath, parsing them again and splicing their new sections
+        in place of the old ones, without parsing the other files. Files
+        not in the index yet are added at its end, and those which cannot
+        be read are removed from it. The files may be given by absolute
+        paths, or relative to the current directory; a ValueError is
+        raised for those outside of basepath.
+
+        The sections of the index are found from the sections file kept
+        next to the database, when it is up to date, rather than by
+        scanning the index, and the sections file is written along with
+        the database. The database is still written again as a whole, so
+        an update costs in proportion to its size, not that of the files.
+    """
+    relpaths = []
+    for fname in fnames:
+        relpath = os.path.relpath(os.path.abspath(fname), basepath)
+        if (relpath == os.pardir) or relpath.startswith(os.pardir + os.sep) or os.path.isabs(relpath):
+            raise ValueError("%s: not in %s" % (fname, basepath))
+        relpaths.append(relpath)
+
+    reader = IndexReader(indexpath)
+    try:
+        if reader.basepath != basepath:
+            raise ValueError("%s: not built in %s" % (indexpath, basepath))
+        table = readSections(indexpath)
+        if not checkSections(reader, table):
+            table = [ (fname, None, offset, length) for fname, offset, length in reader.sections() ]
+    except:
+        reader.close()
+        raise
+
+    known = dict([ (normalPath(fname), fname) for fname, key, offset, length in table ])
+    update = []
+    added = []
+    for fname in relpaths:
+        path = normalPath(fname)
+        if path in known:
+            update.append(known[path])
+        elif fname not in added:
+            added.append(fname)
+
+    keys = dict([ (fname, key) for fname, key, offset, length in table ])
+    parsed = {}
+    # Files deleted are only removed
+    present = [ fname for fname in update + added if os.path.exists(os.path.join(basepath, fname)) ]
+    for fname, section in genIndex(basepath, present, debug, 1, cache):
+        parsed[fname] = section
+        keys[fname] = fileKey(os.path.join(basepath, fname))
+
+    updating = set(update)
+
+    def genSections():
+        for fname, key, offset, length in table:
+            if fname not in updating:
+                yield fname, reader.section(offset, length)
+            elif fname in parsed:
+                yield fname, parsed[fname]
+        for fname in added:
+            if fname in parsed:
+                yield fname, parsed[fname]
+
+    written = writeDatabase(basepath, indexpath, genSections(), reader.inverted, reader)
+    writeSections(indexpath, written, keys)
+
+
+def mergeIndex(basepath, indexpath, dbpaths, inverted=False, interleave=False):
+    """ Merge the existing databases given into a single one, copying
+        their sections as is, without parsing any file. A file found in
+        more than one database is taken from the last one given (and
+        appears where it is found in it).
+
+        The sections of each database follow those of the previous one,
+        unless interleaving them, as when assembling the partial databases
+        of a partitioned build (see partitionFiles()): the files are then
+        in the order directories are walked (see pathKey()), that of a
+        single build.
+
+        The file names of databases built from another directory than
+        basepath are made relative to basepath. The keys of the files
+        recorded in the sections files of the databases, if any, are
+        recorded for the merged database.
+    """
+    readers = []
+    try:
+        tables = []
+        for dbpath in dbpaths:
+            reader = IndexReader(dbpath)
+            readers.append(reader)
+            table = readSections(dbpath)
+            if not checkSections(reader, table):
+                table = [ (fname, None, offset, length) for fname, offset, length in reader.sections() ]
+            tables.append(table)
+    except:
+        for reader in readers:
+            reader.close()
+        raise
+
+    # The last database holding each file wins
+    winners = {}
+    for i, (reader, table) in enumerate(zip(readers, tables)):
+        for j, (fname, key, offset, length) in enumerate(table):
+            winners[os.path.normpath(os.path.join(reader.basepath, fname))] = (i, j)
+
+    # The (sort key, database, section) of the sections kept, along with
+    # their file name relative to basepath
+    kept = []
+    for i, (reader, table) in enumerate(zip(readers, tables)):
+        entries = []
+        for j, (fname, key, offset, length) in enumerate(table):
+            if winners[os.path.normpath(os.path.join(reader.basepath, fname))] != (i, j):
+                continue
+            if reader.basepath != basepath:
+                fname = os.path.relpath(os.path.join(reader.basepath, fname), basepath)
+            entries.append((interleave and pathKey(fname) or None, i, j, fname))
+        kept.append(entries)
+    if interleave:
+        order = heapq.merge(*kept)
+    else:
+        order = itertools.chain(*kept)
+
+    keys = {}
+
+    def genSections():
+        for sortkey, i, j, fname in order:
+            reader = readers[i]
+            key, offset, length = tables[i][j][1:]
+            section = reader.section(offset, length)
+            if reader.basepath != basepath:
+                # Rewrite the file mark, ending the first line
+                section = toBytes("\n%s%s" % (Mark(Mark.FILE), fname)) + section[section.find(b'\n', 1):]
+            if key is not None:
+                keys[fname] = key
+            yield fname, section
+
+    written = writeDatabase(basepath, indexpath, genSections(), inverted, readers)
+    if keys:
+        writeSections(indexpath, written, keys)
+    elif os.path.exists(indexpath + sections_ext):
+        # Those of the database replaced no longer apply
+        os.unlink(indexpath + sections_ext)
+
+
+def checkSections(reader, table):
+    """ Do the sections read from a sections file (see readSections())
+        describe the sections of the index, as read by the given
+        IndexReader?
+    """
+    if [ fname for fname, key, offset, length in table ] != reader.fnames:
+        return False
+    offset = reader.index_start
+    data = reader.data
+    for fname, key, start, length in table:
+        if (start != offset) or (data[start:start + 3] != b'\n\t@'):
+            return False
+        offset += length
+    return offset == reader.index_end
+
+
+def work(basepath, gen, debug, jobs=1, cache=None):
     """ The actual work of parsing the files.
     """
 
     # Create the buffer to store the output (list of strings)
     indexbuff = []
-    indexbuff_len = 0
     fnamesbuff = []
 
-    for fname in gen:
+    for fname, buff in genIndex(basepath, gen, debug, jobs, cache):
+        indexbuff.extend(buff)
+        fnamesbuff.append(fname)
+
+    return indexbuff, fnamesbuff
+
+
+def genIndex(basepath, gen, debug, jobs=1, cache=None):
+    """ A generator parsing the files provided by the given generator,
+        yielding the name of each file indexed along with the list of
+        strings making up its section of the index (starting with its file
+        mark), in the order the files were provided.
+
+        With readahead set, up to that many files are read ahead of the one
+        being parsed (see genReadAhead()), by each worker process.
+    """
+    if jobs > 1:
+        # Farm the files out to a pool of worker processes, reassembling
+        # their results in the order the generator provided the files so
+        # that the output matches a serial run exactly.
+        pool = multiprocessing.Pool(jobs)
+        try:
+            chunks = ((basepath, chunk, debug, cache, strings_as_symbols, engine, readahead,
+                       text_trigrams is not None)
+                      for chunk in genChunks(basepath, gen))
+            for sections, output, trigrams in pool.imap(workChunk, chunks):
+                sys.stdout.write(output)
+                if trigrams:
+                    text_trigrams.update(trigrams)
+                for section in sections:
+                    yield section
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        pool.join()
+        return
+
+    if readahead > 0:
+        files = genReadAhead(basepath, gen, readahead)
+    else:
+        files = ((fname, None) for fname in gen)
+    for fname, pending in files:
+        indexbuff = []
+        fnamesbuff = []
         try:
-            indexbuff_len = parseFile(basepath, fname, indexbuff, indexbuff_len, fnamesbuff, dump=debug)
+            parseFile(basepath, fname, indexbuff, 0, fnamesbuff, dump=debug, cache=cache, pending=pending)
         except (SyntaxError, AssertionError) as e:
             print("pycscope.py: %s: Line %s: %s" % (e.filename, e.lineno, e))
             pass
         except UnicodeDecodeError as e:
             print("pycscope.py: %s: %s" % (e.filename, e))
             pass
+        if fnamesbuff:
+            yield fname, indexbuff
 
-    return indexbuff, fnamesbuff
+
+# Files are handed to worker processes in chunks of at least chunk_bytes of
+# source, or chunk_files files, whichever comes first, so that the cost of
+# shipping work and results between processes is amortized over small files.
+chunk_bytes = 256 * 1024
+chunk_files = 64
+
+def genChunks(basepath, gen):
+    """ A generator grouping the file names from the given generator into
+        lists (chunks) of files to be handed to a worker process.
+    """
+    chunk = []
+    chunk_len = 0
+    for fname in gen:
+        chunk.append(fname)
+        try:
+            chunk_len += os.path.getsize(os.path.join(basepath, fname))
+        except OSError:
+            # Let the worker report the problem with the file
+            pass
+        if chunk_len >= chunk_bytes or len(chunk) >= chunk_files:
+            yield chunk
+            chunk = []
+            chunk_len = 0
+    if chunk:
+        yield chunk
+
+
+def workChunk(args):
+    """ Parse one chunk of files in a worker process, returning the list of
+        (file name, section) tuples along with any output generated while
+        parsing (error messages and CST dumps), so that the parent can
+        emit it in order, and the trigrams of the files if collected.
+    """
+    global strings_as_symbols, engine, readahead, text_trigrams
+
+    basepath, fnames, debug, cache, strings_as_symbols, engine, readahead, textindex = args
+    text_trigrams = textindex and {} or None
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        sections = list(genIndex(basepath, fnames, debug, cache=cache))
+        return sections, sys.stdout.getvalue(), text_trigrams
+    finally:
+        sys.stdout = stdout
+
+
+def genIncremental(basepath, gen, debug, jobs, reader, stamps, cache=None, keyfunc=None):
+    """ Like genIndex(), but the sections of the given existing index (an
+        IndexReader, or None) for files which have not changed since it was
+        written are yielded as is (bytes) rather than parsing those files
+        again.
+
+        The (file name, key) tuple of each file yielded is appended to the
+        stamps list, to be recorded for the next run. The key of a file is
+        given by fileKey(), or keyfunc if given, called with the file name.
+    """
+    previous = {}
+    if (reader is not None) and (reader.basepath == basepath):
+        keys = dict([ (fname, key) for fname, key, offset, length in readSections(reader.indexpath)
+                      if key is not None ])
+        for fname, offset, length in reader.sections():
+            if fname in keys:
+                previous[fname] = (keys[fname], offset, length)
+
+    fnames = []
+    keys = []
+    reuse = set()
+    for fname in gen:
+        if keyfunc is not None:
+            key = keyfunc(fname)
+        else:
+            key = fileKey(os.path.join(basepath, fname))
+        fnames.append(fname)
+        keys.append(key)
+        if (fname in previous) and (previous[fname][0] == key):
+            reuse.add(fname)
+
+    parsed = genIndex(basepath, [ fname for fname in fnames if fname not in reuse ], debug, jobs, cache)
+    nxt = next(parsed, None)
+    for fname, key in zip(fnames, keys):
+        if fname in reuse:
+            yield fname, reader.section(previous[fname][1], previous[fname][2])
+        elif (nxt is not None) and (nxt[0] == fname):
+            yield nxt
+            nxt = next(parsed, None)
+        else:
+            # The file could not be read, and was reported as such
+            continue
+        stamps.append((fname, key))
+
+
+def genSince(basepath, args, recurse, exclude, debug, jobs, reader, changes, cache=None):
+    """ Like genIncremental(), for the files of the given existing index
+        (an IndexReader) updated by the given changes (see
+        pycscope.gitindex.changedFiles()): the files changed are parsed
+        again, the files deleted are dropped, and the files added, under
+        the given files and directories (as for genFiles()), are parsed and
+        placed in the order a walk would find them.
+    """
+    previous = reader.sections()
+    known = dict([ (normalPath(fname), fname) for fname, offset, length in previous ])
+    parse = set()
+    deleted = set()
+    added = []
+    for status, path in changes:
+        if not isPython(path):
+            continue
+        path = normalPath(path)
+        if status == 'D':
+            deleted.add(path)
+        elif path in known:
+            parse.add(known[path])
+        else:
+            fname = argName(args, recurse, exclude, path)
+            if fname is not None:
+                added.append(fname)
+                parse.add(fname)
+
+    fnames = [ (fname, offset, length) for fname, offset, length in previous if normalPath(fname) not in deleted ]
+    added.sort(key=pathKey)
+    merged = []
+    for fname, offset, length in fnames:
+        while added and (pathKey(added[0]) < pathKey(fname)):
+            merged.append((added.pop(0), 0, 0))
+        merged.append((fname, offset, length))
+    merged.extend([ (fname, 0, 0) for fname in added ])
+
+    parsed = genIndex(basepath, [ fname for fname, offset, length in merged if fname in parse ], debug, jobs, cache)
+    nxt = next(parsed, None)
+    for fname, offset, length in merged:
+        if fname not in parse:
+            yield fname, reader.section(offset, length)
+        elif (nxt is not None) and (nxt[0] == fname):
+            yield nxt
+            nxt = next(parsed, None)
+
+
+def argName(args, recurse, exclude, path):
+    """ The name genFiles() would give the file of the given normalized
+        path (see normalPath()), or None if it would not find it.
+    """
+    checked = {}
+    for name in sorted(args):
+        name_n = os.path.normpath(name)
+        base = normalPath(name_n)
+        if base == path:
+            rest = [os.path.basename(path)]
+            base = os.path.dirname(path)
+            name_n = os.path.dirname(name_n)
+        elif not base:
+            rest = path.split('/')
+        elif path.startswith(base + '/'):
+            rest = path[len(base) + 1:].split('/')
+        else:
+            continue
+        if ((len(rest) > 1) and not recurse) or exclude.isFileExcluded(base, rest, checked):
+            return None
+        return os.path.join(name_n, *rest)
+    return None
+
+
+def pathKey(fname):
+    """ The sort key of a file name giving the order in which directories
+        are walked (see walkDir()).
+    """
+    return normalPath(fname).split('/')
+
+
+def parsePartition(val):
+    """ Parse the partition given on the command line, 'K/N' for the K-th
+        of N parts, returned as a (K, N) tuple; None is returned for an
+        invalid one.
+    """
+    try:
+        part, parts = [ int(num) for num in val.split('/') ]
+    except ValueError:
+        return None
+    if not (1 <= part <= parts):
+        return None
+    return part, parts
+
+
+def partitionFiles(basepath, fnames, part, parts):
+    """ Return the files given (in the same order) falling in the part-th
+        (from 1) of the given number of parts, balanced by the size of the
+        files: each file is assigned in turn, the largest first, to the
+        part holding the fewest bytes so far. The assignment only depends
+        on the names and sizes of the files, so that the workers of a
+        distributed build, listing the same files, each index their own
+        part, and none twice.
+    """
+    sizes = {}
+    for fname in fnames:
+        try:
+            sizes[fname] = os.path.getsize(os.path.join(basepath, fname))
+        except OSError:
+            sizes[fname] = 0
+    loads = [ (0, num) for num in range(1, parts + 1) ]
+    mine = set()
+    for fname in sorted(sizes, key=lambda fname: (-sizes[fname], pathKey(fname))):
+        load, num = heapq.heappop(loads)
+        if num == part:
+            mine.add(fname)
+        heapq.heappush(loads, (load + sizes[fname], num))
+    return [ fname for fname in fnames if fname in mine ]
+
+
+def fileKey(fullpath):
+    """ The key used to decide if a file has changed since it was indexed,
+        based on its modification time and size; None is returned if the
+        file cannot be stat'd.
+    """
+    try:
+        st = os.stat(fullpath)
+    except OSError:
+        return None
+    return "%r:%d" % (st.st_mtime, st.st_size)
 
 
 def isPython(name):
@@ -199,79 +1308,270 @@ def isPython(name):
     return name[-3:] == ".py"
 
 
-def genFiles(basepath, args, recurse, exclude):
+def genFiles(basepath, args, recurse, exclude, dirs=None, threads=1):
     """ A generator for returning all the files that need to be parsed.
         Caller is required to provide synchronization.
+
+        The files and directories excluded are given by an Excludes
+        instance, or a list of paths and patterns (see Excludes). The
+        directories listed are appended to the dirs list, if given.
+
+        When recursing with more than one thread, directories are listed
+        ahead of time by a pool of that many threads, so that the round
+        trips of a network filesystem overlap, while the files are still
+        returned in the same order.
     """
-    for name in sorted(args):
-        name_n = os.path.normpath(name)
-        if name_n in exclude:
-            continue
-        if os.path.isdir(os.path.join(basepath, name_n)):
-            for fname in parseDir(basepath, name_n, recurse, exclude):
-                yield fname
-        elif isPython(name_n):
-            # Only return the file names if it's python source.
-            yield name_n
+    if not isinstance(exclude, Excludes):
+        exclude = Excludes(exclude)
+    pool = None
+    if recurse and (threads > 1):
+        pool = ThreadPool(threads)
+    try:
+        for name in sorted(args):
+            name_n = os.path.normpath(name)
+            path = normalPath(name_n)
+            if os.path.isdir(os.path.join(basepath, name_n)):
+                if exclude.isExcluded(os.path.basename(path), path, True):
+                    continue
+                for fname in walkDir(basepath, name_n, path, recurse, exclude, dirs, [], False, pool):
+                    yield fname
+            elif isPython(name_n) and not exclude.isExcluded(os.path.basename(path), path, False):
+                # Only return the file names if it's python source.
+                if dirs is not None:
+                    dirs.append(os.path.dirname(name_n) or os.curdir)
+                yield name_n
+    finally:
+        if pool is not None:
+            pool.terminate()
 
 
-def parseDir(basepath, relpath, recurse, exclude):
+def parseDir(basepath, relpath, recurse, exclude, dirs=None):
     """ A generator that parses all files in the directory and
         recurses into subdirectories if requested.
         Caller is required to provide synchronization.
     """
+    if not isinstance(exclude, Excludes):
+        exclude = Excludes(exclude)
+    return walkDir(basepath, relpath, normalPath(relpath), recurse, exclude, dirs, [], False)
+
+
+def walkDir(basepath, relpath, path, recurse, exclude, dirs, rules, skip, pool=None, listing=None):
+    """ The generator behind parseDir(), given the normalized path of the
+        directory (see normalPath()), the .gitignore rules applying to it,
+        and whether it may be skipped by default (see Excludes.skipDir()).
+
+        With a pool of threads, the listing of each subdirectory is started
+        as soon as the directory holding it is listed, and handed down to
+        the walk of the subdirectory (an AsyncResult of listDir()).
+    """
     dirpath = os.path.join(basepath, relpath)
-    for name in sorted(os.listdir(dirpath)):
-        name_rp = os.path.join(relpath, name)
-        if name_rp in exclude:
-            continue
-        if os.path.isdir(os.path.join(dirpath, name)):
-            if recurse:
-                for fname in parseDir(basepath, name_rp, recurse, exclude):
-                    yield fname
+    if listing is not None:
+        entries = listing.get()
+    else:
+        entries = listDir(dirpath, recurse)
+    if exclude.defaults or exclude.gitignore:
+        names = [ name for name, isdir in entries ]
+        if skip and exclude.skipDir(os.path.basename(relpath), names):
+            return
+        rules = exclude.dirRules(dirpath, path, names, rules)
+    if dirs is not None:
+        dirs.append(relpath)
+
+    wanted = []
+    for name, isdir in entries:
+        if exclude.rules or rules:
+            sub = path and "%s/%s" % (path, name) or name
+            if exclude.isExcluded(name, sub, isdir) or (rules and isIgnored(rules, name, sub, isdir)):
+                continue
+        if isdir:
+            if recurse and not exclude.skipDir(name):
+                if pool is not None:
+                    wanted.append((name, pool.apply_async(listDir, (os.path.join(dirpath, name), recurse))))
+                else:
+                    wanted.append((name, None))
+        elif isPython(name):
+            wanted.append((name, False))
+
+    for name, sublisting in wanted:
+        if sublisting is False:
+            yield os.path.join(relpath, name)
         else:
-            if isPython(name_rp):
-                yield name_rp
+            sub = path and "%s/%s" % (path, name) or name
+            for fname in walkDir(basepath, os.path.join(relpath, name), sub, recurse, exclude, dirs, rules, True,
+                                 pool, sublisting):
+                yield fname
+
 
+def listDir(dirpath, recurse=True):
+    """ Return the sorted list of (name, is a directory) tuples of the
+        entries of a directory.
 
-def parseFile(basepath, relpath, indexbuff, indexbuff_len, fnamesbuff, dump=False):
+        os.scandir() gives the type of most entries without a stat of
+        each; without it (before Python 3.5), only the entries which
+        matter are stat'd: all of them when recursing, only the Python
+        source files otherwise.
+    """
+    if scandir is not None:
+        entries = [ (entry.name, entry.is_dir()) for entry in scandir(dirpath) ]
+    else:
+        entries = [ (name, (recurse or isPython(name)) and os.path.isdir(os.path.join(dirpath, name)))
+                    for name in os.listdir(dirpath) ]
+    entries.sort()
+    return entries
+
+
+def normalPath(relpath):
+    """ The normalized form of a path relative to the current directory,
+        as matched against excludes: '/' separated, with '' for the
+        current directory itself.
+    """
+    relpath = os.path.normpath(relpath)
+    if relpath == os.curdir:
+        return ''
+    return relpath.replace(os.sep, '/')
+
+
+def parseFile(basepath, relpath, indexbuff, indexbuff_len, fnamesbuff, dump=False, cache=None, pending=None):
     """Parses a source file and puts the resulting index into the buffer.
        Caller is required to provide synchronization.
+
+       When a FragmentCache is given, the index for the file is taken from
+       the cache if it has already seen the same source, and stored in it
+       otherwise.
+
+       The contents of the file are read here, unless they are pending in
+       a read ahead of time (the AsyncResult of readFile(), see
+       genReadAhead()); their trigrams are collected from them when
+       building a text index (see text_trigrams).
     """
-    # Open the file.
     fullpath = os.path.join(basepath, relpath)
     try:
-        f = open(fullpath, 'rU')
+        if pending is not None:
+            filecontents = pending.get()
+        else:
+            filecontents = readFile(fullpath)
     except IOError as e:
-        # Can't open a file, emit message and ignore
+        # Can't read a file, emit message and ignore
         print("pycscope.py: %s" % e)
         return indexbuff_len
-
-    # Get the contents.
-    with f:
-        try:
-            filecontents = f.read()
-        except UnicodeDecodeError as e:
-            e.filename = fullpath
-            raise e
+    except UnicodeDecodeError as e:
+        e.filename = fullpath
+        raise e
 
     # Add the file mark to the index
     fnamesbuff.append(relpath)
     indexbuff.append("\n%s%s\n\n" % (Mark(Mark.FILE), relpath))
     indexbuff_len += 1
 
+    if text_trigrams is not None:
+        text_trigrams[relpath] = fileTrigrams(filecontents)
+
+    if not filecontents:
+        return indexbuff_len
+
+    if (cache is not None) and not dump:
+        key = cache.key(filecontents)
+        fragment = cache.get(key)
+        if fragment is not None:
+            if fragment:
+                indexbuff.append(fragment)
+                indexbuff_len += 1
+            return indexbuff_len
+        buff = []
+    else:
+        buff = indexbuff
+
     # Add path info to any syntax errors in the source files
-    if filecontents:
-        try:
-            indexbuff_len = parseSource(filecontents, indexbuff, indexbuff_len, dump)
-        except (SyntaxError, AssertionError) as e:
-            e.filename = fullpath
-            raise e
+    try:
+        buff_len = parseSource(filecontents, buff, 0, dump)
+    except (SyntaxError, AssertionError) as e:
+        e.filename = fullpath
+        raise e
 
-    return indexbuff_len
+    if buff is not indexbuff:
+        cache.put(key, ''.join(buff))
+        indexbuff.extend(buff)
+    return indexbuff_len + buff_len
+
+# Files of at least mmap_bytes are decoded straight from a mapping of the
+# file, rather than read into a buffer first.
+mmap_bytes = 1024 * 1024
+
+newline_re = re.compile(r'\r\n?')
+
+def readFile(fullpath):
+    """ Return the contents of a source file, its newlines normalized: as
+        bytes on Python 2, where the parsers handle the coding declaration,
+        and decoded (see decodeSource()) on Python 3.
+    """
+    with open(fullpath, 'rb') as f:
+        if sys.hexversion < 0x03000000:
+            contents = f.read()
+        elif os.fstat(f.fileno()).st_size >= mmap_bytes:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                contents = decodeSource(data, fullpath)
+            finally:
+                data.close()
+        else:
+            contents = decodeSource(f.read(), fullpath)
+    if '\r' in contents:
+        contents = newline_re.sub('\n', contents)
+    return contents
+
+def decodeSource(data, fullpath):
+    """ Decode the source of a file (bytes, or a buffer holding them) as
+        UTF-8, unless a BOM or a coding declaration (see PEP 263) says
+        otherwise. A source which cannot be decoded so is decoded as
+        Latin-1, which never fails, rather than being skipped.
+    """
+    encoding = 'utf-8'
+    if data[:3] == codecs.BOM_UTF8:
+        encoding = 'utf-8-sig'
+    else:
+        head = data[:1024]
+        if b'coding' in head:
+            declared = astparse.sourceEncoding(head.decode('latin-1'))
+            if declared is not None:
+                try:
+                    encoding = codecs.lookup(declared).name
+                except LookupError:
+                    pass
+    try:
+        return str(data, encoding)
+    except UnicodeDecodeError as e:
+        print("pycscope.py: %s: %s, decoding it as latin-1" % (fullpath, e))
+        return str(data, 'latin-1')
+
+
+def genReadAhead(basepath, gen, depth):
+    """ A generator reading the files provided by the given generator ahead
+        of their parsing, with a pool of threads, yielding the name of each
+        file along with the AsyncResult of reading it (see readFile()), in
+        the order the files were provided.
+
+        At most depth files are read ahead of the one being parsed, so
+        that the files read do not pile up in memory when parsing is
+        slower than reading.
+    """
+    pool = ThreadPool(min(depth, readahead_threads))
+    try:
+        pending = collections.deque()
+        for fname in gen:
+            pending.append((fname, pool.apply_async(readFile, (os.path.join(basepath, fname),))))
+            if len(pending) > depth:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        pool.terminate()
+
+# The number of threads reading files ahead of time, at most.
+readahead_threads = 4
 
 nodeNames = token.tok_name
-nodeNames.update(symbol.sym_name)
+if symbol is not None:
+    nodeNames.update(symbol.sym_name)
 
 def replaceNodeType(treeList):
     """ Replaces the 0th element in the list with the name
@@ -510,6 +1810,94 @@ class Line(object):
         return NotImplemented
 
 
+class IndexLine(object):
+    """ The source line being indexed, as Line, but without allocating an
+        object for each token: the text of its symbols (preceded by their
+        formatted marks) and non-symbols are kept as strings, merged as
+        they are added. As with Line, the two alternate, so the kind of
+        each is known from the kind of the first.
+
+        Line, Symbol and NonSymbol remain as the documented model of the
+        index (and are tested as such); this is the form used while
+        indexing.
+    """
+    __slots__ = ('lineno', 'items', 'mark', 'first_symbol', 'has_symbol')
+
+    def __init__(self, lineno):
+        self.reset(lineno)
+
+    def reset(self, lineno):
+        """ Start over, empty, as the given source line.
+        """
+        self.lineno = lineno
+        self.items = []
+        self.mark = None            # The mark of the last item, if a symbol
+        self.first_symbol = False
+        self.has_symbol = False
+
+    def addSymbol(self, name, mark=''):
+        """ Add a symbol, appending it to a preceding symbol, which must
+            have the same mark.
+        """
+        assert name and (type(name) == str), "Must have an actual symbol name as a string."
+        if self.mark is None:
+            if not self.items:
+                self.first_symbol = True
+            self.items.append(mark_prefixes[mark] + name)
+            self.mark = mark
+            self.has_symbol = True
+        else:
+            assert self.mark == mark, "Symbols must be marked the same."
+            self.items[-1] += name
+
+    def addNonSymbol(self, text):
+        """ Add non-symbol text, separated by a space from any preceding
+            non-symbol text.
+        """
+        assert text and (type(text) == str), "Must have an actual string."
+        if (self.mark is None) and self.items:
+            self.items[-1] += ' ' + text
+        else:
+            self.items.append(text)
+            self.mark = None
+
+    def addFuncEnd(self):
+        """ Add the mark of the end of a function, an empty symbol which
+            is never merged with a preceding one.
+        """
+        if not self.items:
+            self.first_symbol = True
+        elif self.mark is not None:
+            self.items.append(' ')
+        self.items.append(mark_prefixes[Mark.FUNC_END])
+        self.mark = Mark.FUNC_END
+        self.has_symbol = True
+
+    def format(self):
+        """ Format the line (if it has a symbol) as Line.format() does.
+        """
+        if not self.has_symbol:
+            return ''
+
+        items = self.items
+        if self.first_symbol:
+            buff = ["%d " % self.lineno, items[0]]
+        else:
+            buff = ["%d %s" % (self.lineno, items[0])]
+        symbol = not self.first_symbol
+        for i in range(1, len(items)):
+            s = items[i]
+            if symbol:
+                if buff[-1] != ' ':
+                    buff[-1] += ' '
+            elif s != ' ':
+                s = ' ' + s
+            buff.append(s)
+            symbol = not symbol
+        return "\n".join(buff) + "\n\n"
+    __str__ = format
+
+
 if sys.hexversion < 0x03000000:
     valid_tokens_for_marks = (token.NAME, token.DOT)
     valid_tokens_for_import = (token.DOT,)
@@ -532,52 +1920,74 @@ class Context(object):
         Cscope uses Marks to help it understand what a symbol is for. As the
         CST tree is processed, often we'll look ahead into the CST tree to
         associate a Mark with a Symbol before we have processed that
-        Symbol. The dictionary of Marks encapsulates that state.
+        Symbol. The dictionary of Marks encapsulates that state, keyed by
+        the (line, column) position of the terminals, so that no part of
+        the tree needs to be kept once it has been walked.
     '''
     # Buffer of lines in the Cscope database (individual strings in a list)
     def __init__(self):
         self.buff = []              # The accumlated list of lines with symbols
-        self.line = Line(1)         # The current line being processed
-        self.marks = {}             # Association of CST tuples to a Mark
+        self.line = IndexLine(1)    # The current line being processed
+        self.marks = {}             # Association of terminal positions to a Mark
         self.indent_lvl = 0         # Indentation level, used to track outer fn
         self.func_def_lvl = -1      # Function definition level, to track outer
         self.import_cnt = 0         # Number of import statements to expect
         self.import_name = False    # Handling an import ... statement (not from ... import ...)
-        self.tests = {}             # List of CST test objects tracked for assignment
+        self.tests = {}             # Positions of the CST test nodes tracked for assignment
         self.power_do_assignment = False
+        self.line_offset = 0        # Line number of the CST being walked (see genSuites())
 
     def setMark(self, tup, mark):
-        ''' Add a mark to the dictionary for the given tuple
+        ''' Add a mark to the dictionary for the given terminal tuple
         '''
-        idx = id(tup)
-        assert idx not in self.marks
+        pos = (tup[2], tup[3])
+        assert pos not in self.marks
         assert tup[0] in valid_tokens_for_marks, "Expected one of %s, found %s" % ([token.tok_name[t] for t in valid_tokens_for_marks], tup)
-        self.marks[idx] = mark
+        self.marks[pos] = mark
 
     def getMark(self, tup):
-        ''' Get the mark associated with the given tuple. This is a one shot
-            deal, as we delete the association from the dictionary to prevent
-            unnecessary accumulation of these associations given we never
-            rewalk the tree (one pass only).
+        ''' Get the mark associated with the given terminal tuple, or None.
+            This is a one shot deal, as we delete the association from the
+            dictionary to prevent unnecessary accumulation of these
+            associations given we never rewalk the tree (one pass only).
+        '''
+        return self.marks.pop((tup[2], tup[3]), None)
+
+    def addTest(self, cst):
+        ''' Track a test node holding the target of an assignment
         '''
-        idx = id(tup)
-        assert idx in self.marks
-        mark = self.marks[idx]
-        del(self.marks[idx])
-        return mark
+        self.tests[nodePosition(cst)] = cst[0]
+
+    def isTest(self, cst):
+        ''' Is the given test node one being tracked? This too is a one shot
+            deal.
+        '''
+        if not self.tests:
+            return False
+        node_type = self.tests.pop(nodePosition(cst), None)
+        assert node_type in (None, cst[0]), "%s != %s" % (nodeNames[node_type], nodeNames[cst[0]])
+        return node_type is not None
 
     def commit(self, lineno=None):
         ''' Commit a processed source line to the buffer
         '''
-        line = str(self.line)
+        line = self.line.format()
         if line:
             self.buff.append(line)
         if lineno:
-            self.line = Line(lineno)
+            self.line.reset(lineno)
         else:
             self.line = None
 
 
+def nodePosition(cst):
+    """ The (line, column) position of the first terminal of a CST node,
+        which no other node of the same type shares.
+    """
+    while type(cst[1]) == tuple:
+        cst = cst[1]
+    return (cst[2], cst[3])
+
 def isNamedFuncCall(cst, cst_len):
     """ Figure out if this CST sub-tree represents a named function call;
         that is, one which looks like name(), or name(arg,arg=1).
@@ -617,10 +2027,12 @@ def markTestlist(ctx, cst):
             continue
         if cst[i][0] not in test_or_star_expr:
             break
-        ctx.tests[id(cst[i])] = cst[i]
+        ctx.addTest(cst[i])
 
 
-if sys.hexversion < 0x03000000:
+if symbol is None:
+    pass
+elif sys.hexversion < 0x03000000:
     tse = symbol.testlist
     test_or_star_expr = (symbol.test,)
     if sys.hexversion < 0x02070000:
@@ -635,74 +2047,103 @@ else:
 def processNonTerminal(ctx, cst):
     """ Process a given CST tuple representing a non-terminal symbol
     """
-    # We have a non-terminal "symbol"
-    if cst[0] == symbol.global_stmt:
-        # Handle global declarations
-        for i in range(2, len(cst)):
-            if not i % 2:
-                # Even indices are the names
-                assert cst[i][0] == token.NAME
-                ctx.setMark(cst[i], Mark.GLOBAL)
-    elif cst[0] == symbol.funcdef:
-        if ctx.func_def_lvl == -1:
-            # Handle function definitions. NOTE: we only mark the
-            # outer most function name as a function definition
-            # since the cscope utility can't handle nested
-            # functions. So all nested function definitions will
-            # not be marked as such.
-            ctx.func_def_lvl = ctx.indent_lvl
-            idx = 1
-            if cst[idx][0] == symbol.decorators:
-                # Skip the optional decorators under pre-2.7
-                # FIXME: verify this is the case.
-                idx += 1
-            assert (cst[idx][0] == token.NAME) and (cst[idx][1] == 'def')
+    # Most non-terminals have no handler at all
+    handler = nonterminal_handlers.get(cst[0])
+    if handler is not None:
+        handler(ctx, cst)
+
+# Handlers of the non-terminals of the CST, by symbol number, called with
+# the context and the CST tuple of the non-terminal (see registerHandler())
+nonterminal_handlers = {}
+
+def registerHandler(node_type, handler):
+    """ Register a handler, called with the context and the CST tuple of each
+        non-terminal of the given type (a symbol.* number), to set the marks
+        of its terminals (see Context.setMark()). Handlers registered for a
+        type already handled are called after those registered before them.
+    """
+    previous = nonterminal_handlers.get(node_type)
+    if previous is None:
+        nonterminal_handlers[node_type] = handler
+    else:
+        def chained(ctx, cst):
+            previous(ctx, cst)
+            handler(ctx, cst)
+        nonterminal_handlers[node_type] = chained
+
+def handleGlobalStmt(ctx, cst):
+    # Handle global declarations
+    for i in range(2, len(cst)):
+        if not i % 2:
+            # Even indices are the names
+            assert cst[i][0] == token.NAME
+            ctx.setMark(cst[i], Mark.GLOBAL)
+
+def handleFuncdef(ctx, cst):
+    if ctx.func_def_lvl == -1:
+        # Handle function definitions. NOTE: we only mark the
+        # outer most function name as a function definition
+        # since the cscope utility can't handle nested
+        # functions. So all nested function definitions will
+        # not be marked as such.
+        ctx.func_def_lvl = ctx.indent_lvl
+        idx = 1
+        if cst[idx][0] == symbol.decorators:
+            # Skip the optional decorators under pre-2.7
+            # FIXME: verify this is the case.
             idx += 1
-            ctx.setMark(cst[idx], Mark.FUNC_DEF)
-    elif cst[0] == symbol.decorated \
-            and (cst[1][0] == symbol.decorators) \
-            and (cst[2][0] == symbol.funcdef):
-        # Handle function decorators only.
-        dcsts = cst[1]
-        for i in range(1, len(dcsts)):
-            # Handle each decorator
-            dcst = dcsts[i]
-
-            assert dcst[0] == symbol.decorator
-            assert dcst[1][0] == token.AT
-            assert dcst[2][0] == symbol.dotted_name
-
-            dotted = dcst[2]
-            dotted_len = len(dotted)
-            assert dotted_len >= 2
-            if dotted_len > 2:
-                # When decorators use dotted names, but we don't want to
-                # consider the entire sequence as the function being called
-                # since the functions are not defined that way. Instead, we
-                # only mark the last symbol in the sequence as being a
-                # function call.
+        assert (cst[idx][0] == token.NAME) and (cst[idx][1] == 'def')
+        idx += 1
+        ctx.setMark(cst[idx], Mark.FUNC_DEF)
+
+def handleDecorated(ctx, cst):
+    if (cst[1][0] != symbol.decorators) or (cst[2][0] != symbol.funcdef):
+        return
+    # Handle function decorators only.
+    dcsts = cst[1]
+    for i in range(1, len(dcsts)):
+        # Handle each decorator
+        dcst = dcsts[i]
+
+        assert dcst[0] == symbol.decorator
+        assert dcst[1][0] == token.AT
+        assert dcst[2][0] == symbol.dotted_name
+
+        dotted = dcst[2]
+        dotted_len = len(dotted)
+        assert dotted_len >= 2
+        if dotted_len > 2:
+            # When decorators use dotted names, but we don't want to
+            # consider the entire sequence as the function being called
+            # since the functions are not defined that way. Instead, we
+            # only mark the last symbol in the sequence as being a
+            # function call.
+            ctx.setMark(dotted[-1], Mark.FUNC_CALL)
+        elif dotted_len == 2:
+            # Check for some builtin ones we should ignore
+            assert dotted[-1][0] == token.NAME
+            if dotted[-1][1] not in ('property', 'classmethod'):
                 ctx.setMark(dotted[-1], Mark.FUNC_CALL)
-            elif dotted_len == 2:
-                # Check for some builtin ones we should ignore
-                assert dotted[-1][0] == token.NAME
-                if dotted[-1][1] not in ('property', 'classmethod'):
-                    ctx.setMark(dotted[-1], Mark.FUNC_CALL)
-    elif cst[0] == symbol.import_from:
-        # The next tuple is the "from" string, so grab the following dotted
-        # name tuple, and mark each NAME and DOT terminal in that tuple list
-        # as an include. As they are added to the line they'll be merged into
-        # one big symbol marked as an include.
-        dnidx = 2
-        while cst[dnidx][0] in valid_tokens_for_import:
-            dnidx += 1
-        if cst[dnidx][0] == symbol.dotted_name:
-            for i in range(1, len(cst[dnidx])):
-                ctx.setMark(cst[dnidx][i], Mark.INCLUDE)
-    elif cst[0] == symbol.import_name:
-        # We are dealing with import ... statements, where for dotted name
-        # non-terminals it indicates an include module reference
-        ctx.import_name = True
-    elif cst[0] == symbol.dotted_as_names and ctx.import_name:
+
+def handleImportFrom(ctx, cst):
+    # The next tuple is the "from" string, so grab the following dotted
+    # name tuple, and mark each NAME and DOT terminal in that tuple list
+    # as an include. As they are added to the line they'll be merged into
+    # one big symbol marked as an include.
+    dnidx = 2
+    while cst[dnidx][0] in valid_tokens_for_import:
+        dnidx += 1
+    if cst[dnidx][0] == symbol.dotted_name:
+        for i in range(1, len(cst[dnidx])):
+            ctx.setMark(cst[dnidx][i], Mark.INCLUDE)
+
+def handleImportName(ctx, cst):
+    # We are dealing with import ... statements, where for dotted name
+    # non-terminals it indicates an include module reference
+    ctx.import_name = True
+
+def handleDottedAsNames(ctx, cst):
+    if ctx.import_name:
         # Figure out how many imports are being performed for:
         #
         #     import a as b, b as c, c as d, ...
@@ -710,141 +2151,158 @@ def processNonTerminal(ctx, cst):
         # We use a count so we don't have to walk the tree twice, allowing us
         # to NOT consider the "as foo" as a symbol, only the "dotted" names.
         ctx.import_cnt = len(cst)/2
-    elif cst[0] == symbol.dotted_name:
-        # Handle dotted names for imports
-        if ctx.import_name:
-            assert ctx.import_cnt >= 1
-            # For imports, we want to collect them all together to form one
-            # symbol. To do that, we set each following tuple, which will be
-            # NAME, or NAME DOT NAME, etc. to all have INCLUDE marks. As the
-            # tree walk continues, these symbols sharing the same mark will be
-            # appended to make one continuous name.name.name symbol.,
-            for i in range(1, len(cst)):
-                ctx.setMark(cst[i], Mark.INCLUDE)
-            ctx.import_cnt -= 1
-            if ctx.import_cnt == 0:
-                ctx.import_name = False
-    elif cst[0] == symbol.expr_stmt:
-        # Look for assignment statements
-        l = len(cst)
-        if (l >= 4):
-            assert (cst[1][0] == tse)
-            if (cst[2][0] == symbol.augassign) and (cst[3][0] in (symbol.testlist, symbol.yield_expr)):
-                # testlist or testlist_star_expr, augassign, testlist
-                assert cst[1][1][0] == symbol.test, "%s is not symbol.test" % nodeNames[cst[1][1][0]]
-                ctx.tests[id(cst[1][1])] = cst[1][1]
-            elif (cst[2][0] == token.EQUAL):
-                # testlist or testlist_star_expr, EQUAL, ...
-                markTestlist(ctx, cst[1])
-                for i in range(3, l - 1):
-                    if cst[i][0] == token.EQUAL:
+
+def handleDottedName(ctx, cst):
+    # Handle dotted names for imports
+    if ctx.import_name:
+        assert ctx.import_cnt >= 1
+        # For imports, we want to collect them all together to form one
+        # symbol. To do that, we set each following tuple, which will be
+        # NAME, or NAME DOT NAME, etc. to all have INCLUDE marks. As the
+        # tree walk continues, these symbols sharing the same mark will be
+        # appended to make one continuous name.name.name symbol.,
+        for i in range(1, len(cst)):
+            ctx.setMark(cst[i], Mark.INCLUDE)
+        ctx.import_cnt -= 1
+        if ctx.import_cnt == 0:
+            ctx.import_name = False
+
+def handleExprStmt(ctx, cst):
+    # Look for assignment statements
+    l = len(cst)
+    if (l >= 4):
+        assert (cst[1][0] == tse)
+        if (cst[2][0] == symbol.augassign) and (cst[3][0] in (symbol.testlist, symbol.yield_expr)):
+            # testlist or testlist_star_expr, augassign, testlist
+            assert cst[1][1][0] == symbol.test, "%s is not symbol.test" % nodeNames[cst[1][1][0]]
+            ctx.addTest(cst[1][1])
+        elif (cst[2][0] == token.EQUAL):
+            # testlist or testlist_star_expr, EQUAL, ...
+            markTestlist(ctx, cst[1])
+            for i in range(3, l - 1):
+                if cst[i][0] == token.EQUAL:
+                    continue
+                if cst[i][0] != tse:
+                    break
+                # We have another testlist, EQUAL, ...
+                markTestlist(ctx, cst[i])
+
+def handleTest(ctx, cst):
+    if ctx.isTest(cst):
+        # We happen to have a test CST that is part of an assignment
+        # expression of some sort. It is assumed that deep inside this CST
+        # subtree is a power CST subtree that is (one of) the target(s) of
+        # the assignment to be marked. Since other CST tuples have to be
+        # processed in between, we set a flag for the power symbol
+        # handling to actually perform the marking.
+        assert not ctx.power_do_assignment
+        ctx.power_do_assignment = True
+
+def handleClassdef(ctx, cst):
+    # Handle class declarations.
+    assert (cst[1][0] == token.NAME) and (cst[1][1] == 'class')
+    ctx.setMark(cst[2], Mark.CLASS)
+
+def handlePower(ctx, cst):
+    l_cst = len(cst)
+    if ctx.power_do_assignment:
+        ctx.power_do_assignment = False
+        # power
+        #   atom
+        #     NAME
+        # power
+        #   atom
+        #     (|[
+        #       test
+        #       ...
+        #     )|]
+        if (l_cst == 2) and (cst[1][0] == symbol.atom):
+            if len(cst[1]) == 2 and cst[1][1][0] == token.NAME:
+                ctx.setMark(cst[1][1], Mark.ASSIGN)
+            elif len(cst[1]) == 4 \
+                    and cst[1][1][0] in (token.LPAR, token.LSQB) \
+                    and cst[1][2][0] in testlist_comp \
+                    and cst[1][3][0] in (token.RPAR, token.RSQB):
+                for i in range(1, len(cst[1][2])):
+                    if cst[1][2][i][0] == token.COMMA:
                         continue
-                    if cst[i][0] != tse:
+                    if cst[1][2][i][0] != symbol.test:
                         break
-                    # We have another testlist, EQUAL, ...
-                    markTestlist(ctx, cst[i])
-    elif cst[0] in test_or_star_expr:
-        if id(cst) in ctx.tests:
-            # We happen to have a test CST that is part of an assignment
-            # expression of some sort. It is assumed that deep inside this CST
-            # subtree is a power CST subtree that is (one of) the target(s) of
-            # the assignment to be marked. Since other CST tuples have to be
-            # processed in between, we set a flag for the power symbol
-            # handling to actually perform the marking.
-            assert cst == ctx.tests[id(cst)], "%r(%d) != %r(%d)" % (cst, id(cst), ctx.tests[id(cst)], id(cst))
-            del ctx.tests[id(cst)]
-            assert not ctx.power_do_assignment
-            ctx.power_do_assignment = True
-    elif cst[0] == symbol.classdef:
-        # Handle class declarations.
-        assert (cst[1][0] == token.NAME) and (cst[1][1] == 'class')
-        ctx.setMark(cst[2], Mark.CLASS)
-    elif cst[0] == symbol.power:
-        l_cst = len(cst)
-        if ctx.power_do_assignment:
-            ctx.power_do_assignment = False
-            # power
-            #   atom
-            #     NAME
-            # power
-            #   atom
-            #     (|[
-            #       test
-            #       ...
-            #     )|]
-            if (l_cst == 2) and (cst[1][0] == symbol.atom):
-                if len(cst[1]) == 2 and cst[1][1][0] == token.NAME:
-                    ctx.setMark(cst[1][1], Mark.ASSIGN)
-                elif len(cst[1]) == 4 \
-                        and cst[1][1][0] in (token.LPAR, token.LSQB) \
-                        and cst[1][2][0] in testlist_comp \
-                        and cst[1][3][0] in (token.RPAR, token.RSQB):
-                    for i in range(1, len(cst[1][2])):
-                        if cst[1][2][i][0] == token.COMMA:
-                            continue
-                        if cst[1][2][i][0] != symbol.test:
-                            break
-                        ctx.tests[id(cst[1][2][i])] = cst[1][2][i]
-
-            # power
-            #   atom
-            #     NAME
-            #   trailer
-            #     LSQB
-            #     subscriptlist
-            #     RSQB
-            elif l_cst == 3 \
-                    and cst[1][0] == symbol.atom \
-                    and len(cst[1]) == 2 \
-                    and cst[1][ 1][0] == token.NAME \
-                    and len(cst[2]) >= 4 \
-                    and cst[2][ 0] == symbol.trailer \
-                    and cst[2][ 1][0] == token.LSQB \
-                    and cst[2][-1][0] == token.RSQB:
-                ctx.setMark(cst[1][1], Mark.ASSIGN)
-
-            # power
-            #   atom
-            #   ...
-            #   trailer
-            #     DOT
-            #     NAME
-            elif l_cst >= 3 \
-                    and len(cst[-1]) == 3 \
-                    and cst[-1][0] == symbol.trailer \
-                    and cst[-1][1][0] == token.DOT \
-                    and cst[-1][2][0] == token.NAME:
-                ctx.setMark(cst[-1][2], Mark.ASSIGN)
-
-            # power
-            #   atom
-            #   ...
-            #   trailer
-            #     DOT
-            #     NAME
-            #   trailer
-            #     LSQB
-            #     subscriptlist
-            #     RSQB
-            elif l_cst >= 4 \
-                    and len(cst[-2]) == 3 \
-                    and cst[-2][0] == symbol.trailer \
-                    and cst[-2][1][0] == token.DOT \
-                    and cst[-2][2][0] == token.NAME \
-                    and len(cst[-1]) >= 4 \
-                    and cst[-1][ 0] == symbol.trailer \
-                    and cst[-1][ 1][0] == token.LSQB \
-                    and cst[-1][-1][0] == token.RSQB:
-                ctx.setMark(cst[-2][2], Mark.ASSIGN)
-
-        if isNamedFuncCall(cst, l_cst):
-            # Simple named functional call like: name() or name(a,b=1,c)
-            ctx.setMark(cst[1][1], Mark.FUNC_CALL)
-        for i in range(1, l_cst - 1):
-            if isTrailerFuncCall(cst, i, l_cst):
-                # Handle named function calls like: name.name() or
-                # name.name(a,b=1,c)
-                ctx.setMark(cst[i][2], Mark.FUNC_CALL)
+                    ctx.addTest(cst[1][2][i])
+
+        # power
+        #   atom
+        #     NAME
+        #   trailer
+        #     LSQB
+        #     subscriptlist
+        #     RSQB
+        elif l_cst == 3 \
+                and cst[1][0] == symbol.atom \
+                and len(cst[1]) == 2 \
+                and cst[1][ 1][0] == token.NAME \
+                and len(cst[2]) >= 4 \
+                and cst[2][ 0] == symbol.trailer \
+                and cst[2][ 1][0] == token.LSQB \
+                and cst[2][-1][0] == token.RSQB:
+            ctx.setMark(cst[1][1], Mark.ASSIGN)
+
+        # power
+        #   atom
+        #   ...
+        #   trailer
+        #     DOT
+        #     NAME
+        elif l_cst >= 3 \
+                and len(cst[-1]) == 3 \
+                and cst[-1][0] == symbol.trailer \
+                and cst[-1][1][0] == token.DOT \
+                and cst[-1][2][0] == token.NAME:
+            ctx.setMark(cst[-1][2], Mark.ASSIGN)
+
+        # power
+        #   atom
+        #   ...
+        #   trailer
+        #     DOT
+        #     NAME
+        #   trailer
+        #     LSQB
+        #     subscriptlist
+        #     RSQB
+        elif l_cst >= 4 \
+                and len(cst[-2]) == 3 \
+                and cst[-2][0] == symbol.trailer \
+                and cst[-2][1][0] == token.DOT \
+                and cst[-2][2][0] == token.NAME \
+                and len(cst[-1]) >= 4 \
+                and cst[-1][ 0] == symbol.trailer \
+                and cst[-1][ 1][0] == token.LSQB \
+                and cst[-1][-1][0] == token.RSQB:
+            ctx.setMark(cst[-2][2], Mark.ASSIGN)
+
+    if isNamedFuncCall(cst, l_cst):
+        # Simple named functional call like: name() or name(a,b=1,c)
+        ctx.setMark(cst[1][1], Mark.FUNC_CALL)
+    for i in range(1, l_cst - 1):
+        if isTrailerFuncCall(cst, i, l_cst):
+            # Handle named function calls like: name.name() or
+            # name.name(a,b=1,c)
+            ctx.setMark(cst[i][2], Mark.FUNC_CALL)
+
+if symbol is not None:
+    registerHandler(symbol.global_stmt, handleGlobalStmt)
+    registerHandler(symbol.funcdef, handleFuncdef)
+    registerHandler(symbol.decorated, handleDecorated)
+    registerHandler(symbol.import_from, handleImportFrom)
+    registerHandler(symbol.import_name, handleImportName)
+    registerHandler(symbol.dotted_as_names, handleDottedAsNames)
+    registerHandler(symbol.dotted_name, handleDottedName)
+    registerHandler(symbol.expr_stmt, handleExprStmt)
+    for node_type in test_or_star_expr:
+        registerHandler(node_type, handleTest)
+    registerHandler(symbol.classdef, handleClassdef)
+    registerHandler(symbol.power, handlePower)
 
 def processTerminal(ctx, cst):
     """ Process a given CST tuple representing a terminal symbol
@@ -852,7 +2310,7 @@ def processTerminal(ctx, cst):
     global kwlist, strings_as_symbols
 
     # Remember on what line this terminal symbol ended
-    lineno = int(cst[2])
+    lineno = int(cst[2]) + ctx.line_offset
 
     if cst[0] == token.DEDENT:
         # Indentation is not recorded, but still processed. A
@@ -862,7 +2320,7 @@ def processTerminal(ctx, cst):
         ctx.indent_lvl -= 1
         if ctx.indent_lvl == ctx.func_def_lvl:
             ctx.func_def_lvl = -1
-            ctx.line += Symbol('', Mark.FUNC_END)
+            ctx.line.addFuncEnd()
         return lineno
 
     if (lineno != ctx.line.lineno) and (cst[0] != token.STRING):
@@ -885,54 +2343,58 @@ def processTerminal(ctx, cst):
         # Handle strings: make sure newline's within strings are
         # escaped.
         if strings_as_symbols:
-            m = re.search("^('|\"|'''|\"\"\")([A-Za-z_][A-Za-z_0-9]*)('|\"|'''|\"\"\")$", cst[1])
+            m = string_symbol_re.search(cst[1])
             if m is not None:
                 # We have a string that is a valid Python identifier, emit the
                 # enclosing quotes as non-symbols and the string as a symbol.
-                ctx.line += NonSymbol(m.group(1))
-                ctx.line += Symbol(m.group(2))
-                ctx.line += NonSymbol(m.group(3))
+                ctx.line.addNonSymbol(m.group(1))
+                ctx.line.addSymbol(m.group(2))
+                ctx.line.addNonSymbol(m.group(3))
             else:
-                ctx.line += NonSymbol(cst[1].replace("\n", "\\n"))
+                ctx.line.addNonSymbol(cst[1].replace("\n", "\\n"))
         else:
-            ctx.line += NonSymbol(cst[1].replace("\n", "\\n"))
+            ctx.line.addNonSymbol(cst[1].replace("\n", "\\n"))
     elif cst[0] == token.NAME:
         # Handle terminal names, could be a python keyword or
         # user defined symbol, or part of a dotted name sequence.
+        mark = ctx.marks and ctx.getMark(cst) or None
         if cst[1] in kwlist:
-            if id(cst) in ctx.marks:
+            if mark is not None:
                 # Perhaps print statement used as a function?
-                ctx.line += Symbol(cst[1], ctx.getMark(cst))
+                ctx.line.addSymbol(cst[1], mark)
             else:
                 # Python keywords are treated as non-symbol text
-                ctx.line += NonSymbol(cst[1])
+                ctx.line.addNonSymbol(cst[1])
         else:
             # Not a python keyword, symbol text
-            if id(cst) in ctx.marks:
-                s = Symbol(cst[1], ctx.getMark(cst))
-            else:
-                s = Symbol(cst[1])
-            ctx.line += s
-    elif (cst[0] == token.DOT) and (id(cst) in ctx.marks):
+            ctx.line.addSymbol(cst[1], mark or '')
+    elif (cst[0] == token.DOT) and ctx.marks and ((cst[2], cst[3]) in ctx.marks):
         # Add the "." to the include symbol, as we are
         # building a larger symbol from all the dotted names
-        ctx.line += Symbol(cst[1], ctx.getMark(cst))
+        ctx.line.addSymbol(cst[1], ctx.getMark(cst))
     elif token.ISEOF(cst[0]):
         # End of compilation: consume this token without adding it
         # to the line, committing any line being processed.
         ctx.commit()
     else:
         # All other tokens are simply added to the line
-        ctx.line += NonSymbol(cst[1])
+        ctx.line.addNonSymbol(cst[1])
 
     return lineno
 
 def walkCst(ctx, cst):
-    """ Scan the CST (tuple) for tokens, appending index lines to the buffer.
+    """ Scan the CST for tokens, appending index lines to the buffer. The
+        CST is given as a tuple (with line and column information), or as a
+        parser ST object, whose tuple is built here so that nothing else
+        holds on to it: each subtree is then released once walked.
     """
     indent = 0
     lineno = 1
-    stack = [(cst, indent)]
+    if type(cst) == tuple:
+        stack = [(cst, indent)]
+    else:
+        stack = [(cst.totuple(True, True), indent)]
+    del cst
     try:
         while stack:
             cst, indent = stack.pop()
@@ -946,40 +2408,140 @@ def walkCst(ctx, cst):
 
             indented = False
             for i in range(len(cst)-1, 0, -1):
-                if type(cst[i]) == tuple:
+                child = cst[i]
+                if type(child) == tuple:
+                    # Skip chains of non-terminals with a single child
+                    # (e.g. test, or_test, ..., atom, for a name), unless
+                    # they have a handler.
+                    while (type(child[1]) == tuple) and (len(child) == 2) and (child[0] not in nonterminal_handlers):
+                        child = child[1]
                     # Push it onto the processing stack
                     # Mirrors a recursive solution
                     if not indented:
                         indent += 2
                         indented = True
-                    stack.append((cst[i], indent))
+                    stack.append((child, indent))
     except Exception as e:
         e.lineno = lineno
         raise e
 
+# Sources larger than this are parsed (by the cst engine) in suites of top
+# level statements of about this size, one at a time, to bound the size of
+# the concrete syntax tree held in memory.
+suite_bytes = 256 * 1024
+
+# Lines which can start a top level statement, following a complete one
+toplevel_re = re.compile(r'[^\s#)\]}@]')
+continued_re = re.compile(r'(?:else|elif|except|finally)\b')
+# Lines starting with a string, which the walk adds to the line before it
+# (see processTerminal()), so that a suite cannot start with one
+string_re = re.compile(r'[rRbBuUfF]{0,2}[\'"]')
+
+def genSuites(sourcecode):
+    """ Generate the (line offset, ST) of consecutive suites of top level
+        statements of a (large) source. Statements are split from their
+        lines alone: when that splits one, a suite does not parse, and a
+        SyntaxError is raised. The grammar must be the same for all suites,
+        so sources importing print_function or with a coding declaration
+        are parsed whole.
+    """
+    # Only newlines end lines for the parser, not the form feeds and other
+    # separators splitlines() splits at
+    lines = sourcecode.split('\n')
+    lines = [ line + '\n' for line in lines[:-1] ] + [ lines[-1] ]
+    if ('print_function' in sourcecode) or (astparse.sourceEncoding(sourcecode) is not None):
+        yield (0, parser.suite(sourcecode))
+        return
+    start = 0
+    size = 0
+    for i, line in enumerate(lines):
+        if (size >= suite_bytes) and toplevel_re.match(line) and not continued_re.match(line) \
+                and not string_re.match(line) and not lines[i - 1].startswith('@'):
+            yield (start, parser.suite(''.join(lines[start:i])))
+            start = i
+            size = 0
+        size += len(line)
+    yield (start, parser.suite(''.join(lines[start:])))
+
+def walkSuites(sourcecode):
+    """ Walk the suites of a large source one at a time, returning the
+        context holding its index.
+    """
+    ctx = Context()
+    for offset, cst in genSuites(sourcecode):
+        ctx.line_offset = offset
+        walkCst(ctx, cst)
+        if ctx.line is None:
+            # Only the end of the last suite ends the file
+            ctx.line = IndexLine(offset + 1)
+    return ctx
+
+def dropCoding(sourcecode):
+    """ The parser module of Python 3 decodes a string again as its coding
+        declaration says, so a declaration of anything but UTF-8 is dropped
+        from sources already decoded (see decodeSource()); it is a comment,
+        never indexed, so the line is left holding the comment mark alone.
+    """
+    encoding = astparse.sourceEncoding(sourcecode)
+    if (encoding is None) or (astparse.normalEncoding(encoding) == 'utf-8'):
+        return sourcecode
+    lines = sourcecode.split('\n', 2)
+    for i, line in enumerate(lines[:2]):
+        if astparse.coding_re.match(line):
+            lines[i] = '#'
+            break
+    return '\n'.join(lines)
+
 def parseSource(sourcecode, indexbuff, indexbuff_len, dump=False):
     """Parses python source code and puts the resulting index information into the buffer.
     """
+    if engine == "ast":
+        return astparse.parseSource(sourcecode, indexbuff, indexbuff_len, dump)
+    if engine == "lite":
+        return liteparse.parseSource(sourcecode, indexbuff, indexbuff_len, dump)
+
     if len(sourcecode) == 0:
         return indexbuff_len
 
     # Parse the source to an Concrete Syntax Tree (cst)
-    sourcecode = sourcecode.replace('\r\n', '\n')
+    if '\r' in sourcecode:
+        sourcecode = sourcecode.replace('\r\n', '\n')
     if sourcecode[-1] != '\n':
         # We need to make sure files are terminated by a newline.
         sourcecode += '\n'
-    cst = parser.suite(sourcecode)
+    if (sys.hexversion >= 0x03000000) and ('coding' in sourcecode[:1024]):
+        sourcecode = dropCoding(sourcecode)
+    ctx = None
+    if (len(sourcecode) > suite_bytes) and not dump:
+        try:
+            ctx = walkSuites(sourcecode)
+        except SyntaxError:
+            # Let the source be parsed as a whole, to report the error
+            ctx = None
 
-    if dump:
-        dumpCst(cst)
+    if ctx is None:
+        cst = parser.suite(sourcecode)
 
-    ctx = Context()
+        if dump:
+            dumpCst(cst)
 
-    walkCst(ctx, cst.totuple(True))
+        ctx = Context()
+        walkCst(ctx, cst)
     indexbuff.extend(ctx.buff)
     indexbuff_len += len(ctx.buff)
     return indexbuff_len
 
 
+# The ast and lite engines build on the classes above
+from pycscope import astparse, liteparse
+from pycscope.watch import IndexWatcher
+from pycscope.gitindex import GitIndex, changedFiles
+from pycscope.shards import parseShardBy, writeShards
+from pycscope.query import Database, query_kinds
+from pycscope.server import QueryServer
+from pycscope.sqlitedb import writeSqlite
+from pycscope.textindex import fileTrigrams, trigrams_ext, writeTextIndex
+
+
 if __name__ == "__main__":
     sys.exit(main())
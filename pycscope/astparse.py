@@ -0,0 +1,482 @@
+"""
+PyCscope ast engine
+
+Indexes Python source using the ast module to classify the statements
+whose names need marks (assignments, imports, globals, and decorators of
+functions), and the tokenize module to stream the tokens of the source
+into the index one logical line at a time, without building the concrete
+syntax tree walked by the default engine.
+
+The output is the same as the default engine's: marks are given to the
+same names, following the same rules, applied to the tokens of each
+statement the ast located.
+"""
+
+import ast, re, sys, token, tokenize
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import pycscope
+from pycscope import Mark
+
+
+# Operators ending the target of an augmented assignment
+augassign_ops = frozenset(('+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=',
+                           '<<=', '>>=', '**=', '//=', '@='))
+
+# Decorators which are not marked as function calls
+builtin_decorators = ('property', 'classmethod')
+
+# Token types of Python 3.12 f-strings, which are tokenized into their parts
+fstring_start = getattr(token, 'FSTRING_START', None)
+fstring_end = getattr(token, 'FSTRING_END', None)
+
+
+def parseSource(sourcecode, indexbuff, indexbuff_len, dump=False):
+    """Parses python source code and puts the resulting index information into the buffer.
+    """
+    if len(sourcecode) == 0:
+        return indexbuff_len
+
+    if '\r' in sourcecode:
+        sourcecode = sourcecode.replace('\r\n', '\n')
+    if sourcecode[-1] != '\n':
+        # We need to make sure files are terminated by a newline.
+        sourcecode += '\n'
+    tree = ast.parse(sourcecode)
+
+    if dump:
+        print(ast.dump(tree))
+
+    sourcecode = recodeSource(sourcecode)
+    lines = sourcecode.splitlines(True)
+    anchors = findAnchors(tree, lines)
+    keywords = pycscope.kwlist
+    if isPrintFunction(tree):
+        # print is a name, which can be called, like any other
+        keywords = [ kw for kw in keywords if kw != 'print' ]
+    del tree
+
+    ctx = pycscope.Context()
+    for logical in genLogicalLines(genTokens(sourcecode, lines)):
+        marks = markLogicalLine(ctx, logical, anchors, keywords)
+        for tok, mark in zip(logical, marks):
+            emitToken(ctx, tok, mark)
+
+    indexbuff.extend(ctx.buff)
+    indexbuff_len += len(ctx.buff)
+    return indexbuff_len
+
+
+def recodeSource(sourcecode):
+    """ Return the source as the tokens of the parser module see it: on
+        Python 2, UTF-8 encoded whatever the encoding declared by the
+        source, save for Latin-1 which the tokenizer passes through
+        untouched.
+    """
+    if sys.hexversion < 0x03000000:
+        encoding = sourceEncoding(sourcecode)
+        if encoding is not None and normalEncoding(encoding) not in ('utf-8', 'iso-8859-1'):
+            try:
+                sourcecode = sourcecode.decode(encoding).encode('utf-8')
+            except (LookupError, UnicodeError):
+                pass
+    return sourcecode
+
+def sourceEncoding(sourcecode):
+    """ The encoding declared by a coding comment on the first two lines
+        of the source (see PEP 263), or None.
+    """
+    for line in sourcecode.split('\n', 2)[:2]:
+        m = coding_re.match(line)
+        if m is not None:
+            return m.group(1)
+        if not blank_re.match(line):
+            break
+    return None
+
+def normalEncoding(encoding):
+    """ The name the tokenizer normalizes an encoding to, for the UTF-8
+        and Latin-1 names it recognizes.
+    """
+    name = encoding.lower().replace('_', '-')
+    if name == 'utf-8' or name.startswith('utf-8-'):
+        return 'utf-8'
+    for prefix in ('latin-1', 'iso-8859-1', 'iso-latin-1'):
+        if name == prefix or name.startswith(prefix + '-'):
+            return 'iso-8859-1'
+    return name
+
+coding_re = re.compile(r'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+blank_re = re.compile(r'^[ \t\f]*(?:[#\r\n]|$)')
+
+
+def findAnchors(tree, lines):
+    """ Find the statements with names to mark, returning a dictionary
+        mapping the (line, column) position of the first token of each to
+        its kind: '=' (with the number of targets), 'aug', 'import', 'from'
+        or 'global'. The position of the first token of each decorator of
+        a function is mapped to 'decorator', and the positions of the
+        statements starting with a soft keyword (match, type) and of the
+        patterns following a case soft keyword to 'soft'.
+    """
+    anchors = {}
+    if sys.hexversion >= 0x03000000:
+        def pos(node):
+            # Columns are UTF-8 byte offsets, tokens have character offsets
+            line = lines[node.lineno - 1]
+            col = node.col_offset
+            if len(line) != len(line.encode('utf-8')):
+                col = len(line.encode('utf-8')[:col].decode('utf-8', 'replace'))
+            return (node.lineno, col)
+    else:
+        def pos(node):
+            return (node.lineno, node.col_offset)
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.expr):
+                # Statements are not nested in expressions
+                continue
+            if isinstance(child, ast.Assign):
+                anchors[pos(child)] = ('=', len(child.targets))
+            elif isinstance(child, ast.AugAssign):
+                anchors[pos(child)] = ('aug', 1)
+            elif isinstance(child, ast.Import):
+                anchors[pos(child)] = ('import', 0)
+            elif isinstance(child, ast.ImportFrom):
+                anchors[pos(child)] = ('from', 0)
+            elif isinstance(child, ast.Global):
+                anchors[pos(child)] = ('global', 0)
+            elif isinstance(child, function_defs):
+                for decorator in child.decorator_list:
+                    anchors[pos(decorator)] = ('decorator', 0)
+            elif isinstance(child, soft_keyword_stmts):
+                anchors[pos(child)] = ('soft', 0)
+            elif isinstance(child, match_case):
+                anchors[pos(child.pattern)] = ('soft', 0)
+            stack.append(child)
+    return anchors
+
+def isPrintFunction(tree):
+    """ Does the module import print_function from __future__?
+    """
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and (node.module == '__future__'):
+            if 'print_function' in [ alias.name for alias in node.names ]:
+                return True
+    return False
+
+if sys.hexversion >= 0x03050000:
+    function_defs = (ast.FunctionDef, ast.AsyncFunctionDef)
+else:
+    function_defs = (ast.FunctionDef,)
+
+# Statements introduced by a soft keyword, and the cases of match statements
+soft_keyword_stmts = tuple([ getattr(ast, name) for name in ('Match', 'TypeAlias') if hasattr(ast, name) ])
+match_case = getattr(ast, 'match_case', ())
+
+# The mark of soft keywords, which are indexed as keywords are
+KEYWORD = 'keyword'
+
+
+def genTokens(sourcecode, lines):
+    """ Generate the tokens of the source that make it into the index,
+        leaving out comments and non-logical newlines. Each token is a
+        (type, string, start, end) tuple.
+    """
+    tokens = tokenize.generate_tokens(StringIO(sourcecode).readline)
+    for tok in tokens:
+        tok_type = tok[0]
+        if tok_type in (tokenize.COMMENT, tokenize.NL):
+            continue
+        if tok_type == fstring_start:
+            # Put an f-string back together as one string token
+            start = tok[2]
+            depth = 1
+            for tok in tokens:
+                if tok[0] == fstring_start:
+                    depth += 1
+                elif tok[0] == fstring_end:
+                    depth -= 1
+                    if depth == 0:
+                        break
+            end = tok[3]
+            if start[0] == end[0]:
+                text = lines[start[0] - 1][start[1]:end[1]]
+            else:
+                text = ''.join([lines[start[0] - 1][start[1]:]] + lines[start[0]:end[0] - 1] + [lines[end[0] - 1][:end[1]]])
+            yield (token.STRING, text, start, end)
+            continue
+        yield tok[:4]
+
+
+def genLogicalLines(tokens):
+    """ Group the tokens into lists making up logical lines, ending with
+        their NEWLINE token; INDENT, DEDENT and ENDMARKER tokens come as
+        lists of their own.
+    """
+    logical = []
+    for tok in tokens:
+        logical.append(tok)
+        if tok[0] in (token.NEWLINE, token.INDENT, token.DEDENT, token.ENDMARKER):
+            yield logical
+            logical = []
+    if logical:
+        yield logical
+
+
+def isOp(tok, ops):
+    return (tok[0] == token.OP) and (tok[1] in ops)
+
+
+def matchClose(logical, idx, end):
+    """ Return the index following the bracket closing the one at idx.
+    """
+    depth = 0
+    for i in range(idx, end):
+        if logical[i][0] == token.OP:
+            if logical[i][1] in '([{':
+                depth += 1
+            elif logical[i][1] in ')]}':
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+    return end
+
+
+def splitTop(logical, start, end, ops):
+    """ Return the indices of the tokens in ops, not enclosed in brackets,
+        between start and end.
+    """
+    found = []
+    depth = 0
+    for i in range(start, end):
+        tok = logical[i]
+        if tok[0] == token.OP:
+            if tok[1] in '([{':
+                depth += 1
+            elif tok[1] in ')]}':
+                depth -= 1
+            elif (depth == 0) and (tok[1] in ops):
+                found.append(i)
+    return found
+
+
+def markTargets(logical, start, end, marks, top=True):
+    """ Mark the targets of an assignment, the comma separated expressions
+        between start and end, following the rules the default engine
+        applies to the 'power' node of each.
+    """
+    for stop in splitTop(logical, start, end, (',',)) + [end]:
+        if start < stop:
+            if not markTarget(logical, start, stop, marks, top):
+                break
+        start = stop + 1
+
+
+def markTarget(logical, start, end, marks, top):
+    """ Mark a single target of an assignment; False is returned for a
+        starred target inside brackets, which ends the marking of the
+        targets in those brackets.
+    """
+    if isOp(logical[start], ('*',)):
+        if not top:
+            return False
+        start += 1
+        if start == end:
+            return True
+
+    # The atom
+    tok = logical[start]
+    if isOp(tok, ('(', '[', '{')):
+        atom_end = matchClose(logical, start, end)
+    else:
+        atom_end = start + 1
+        while (tok[0] == token.STRING) and (atom_end < end) and (logical[atom_end][0] == token.STRING):
+            atom_end += 1
+
+    # The trailers, as (kind, index) tuples: the index of the opening
+    # bracket, or of the name following the dot.
+    trailers = []
+    i = atom_end
+    while i < end:
+        if isOp(logical[i], ('(', '[')):
+            trailers.append((logical[i][1], i))
+            i = matchClose(logical, i, end)
+        elif isOp(logical[i], ('.',)) and (i + 1 < end) and (logical[i + 1][0] == token.NAME):
+            trailers.append(('.', i + 1))
+            i += 2
+        else:
+            break
+
+    if not trailers:
+        if tok[0] == token.NAME:
+            # name = ...
+            marks[start] = Mark.ASSIGN
+        elif isOp(tok, ('(', '[')) and (atom_end - start > 2) and not (logical[start + 1][1] == 'yield'):
+            # (a, b) = ... or [a, b] = ...
+            markTargets(logical, start + 1, atom_end - 1, marks, False)
+    elif (len(trailers) == 1) and (tok[0] == token.NAME) and (trailers[0][0] == '['):
+        # name[...] = ...
+        marks[start] = Mark.ASSIGN
+    elif trailers[-1][0] == '.':
+        # ....name = ...
+        marks[trailers[-1][1]] = Mark.ASSIGN
+    elif (len(trailers) >= 2) and (trailers[-2][0] == '.') and (trailers[-1][0] == '['):
+        # ....name[...] = ...
+        marks[trailers[-2][1]] = Mark.ASSIGN
+    return True
+
+
+def markStatement(logical, start, end, kind, marks):
+    """ Mark the names of a statement of the given kind (see findAnchors())
+        found between start and end.
+    """
+    kind, ntargets = kind
+    if kind == '=':
+        eqs = splitTop(logical, start, end, ('=',))[:ntargets]
+        for eq in eqs:
+            markTargets(logical, start, eq, marks)
+            start = eq + 1
+    elif kind == 'aug':
+        ops = splitTop(logical, start, end, augassign_ops)
+        if ops:
+            markTarget(logical, start, ops[0], marks, True)
+    elif kind == 'import':
+        # import a.b.c as d, e
+        i = start + 1
+        while i < end:
+            tok = logical[i]
+            if (tok[0] == token.NAME) and (tok[1] == 'as'):
+                i += 2
+                continue
+            if (tok[0] == token.NAME) or isOp(tok, ('.',)):
+                marks[i] = Mark.INCLUDE
+            i += 1
+    elif kind == 'from':
+        # from ..a.b import c
+        i = start + 1
+        while (i < end) and isOp(logical[i], ('.', '...')):
+            i += 1
+        while (i < end) and not ((logical[i][0] == token.NAME) and (logical[i][1] == 'import')):
+            marks[i] = Mark.INCLUDE
+            i += 1
+    elif kind == 'global':
+        for i in range(start + 1, end):
+            if logical[i][0] == token.NAME:
+                marks[i] = Mark.GLOBAL
+
+
+def markLogicalLine(ctx, logical, anchors, keywords):
+    """ Return the list of marks (or None) of the tokens of a logical line;
+        names in the keywords list are never marked as function calls.
+    """
+    end = len(logical)
+    marks = [None] * end
+    if end == 1:
+        return marks
+
+    # Names which are not function calls even when followed by parentheses
+    nocall = set()
+
+    if isOp(logical[0], ('@',)) and (logical[1][0] == token.NAME):
+        # Decorators: only those of functions are marked, as function
+        # calls, but their dotted names are never calls themselves.
+        names = [1]
+        while (names[-1] + 2 < end) and isOp(logical[names[-1] + 1], ('.',)) and (logical[names[-1] + 2][0] == token.NAME):
+            names.append(names[-1] + 2)
+        nocall.update(names)
+        after = logical[names[-1] + 1]
+        if (anchors.get(logical[1][2], (None,))[0] == 'decorator') and (logical[1][1] not in keywords) \
+                and ((after[0] == token.NEWLINE) or isOp(after, ('(',))):
+            # Only dotted names, called or not, as any other expression
+            # (PEP 614) is not a decorator to the default engine.
+            if (len(names) > 1) or (logical[1][1] not in builtin_decorators):
+                marks[names[-1]] = Mark.FUNC_CALL
+
+    # Simple statements, where more than one can be on a line
+    stmts = splitTop(logical, 0, end, (';',)) + [end - 1]
+    for i in range(end - 1):
+        tok = logical[i]
+        if tok[2] in anchors:
+            kind = anchors[tok[2]]
+            if kind[0] == 'soft':
+                if (i > 0) and (logical[i - 1][0] == token.NAME) and (logical[i - 1][1] == 'case'):
+                    marks[i - 1] = KEYWORD
+                elif (tok[0] == token.NAME) and (tok[1] in ('match', 'type')):
+                    marks[i] = KEYWORD
+            elif kind[0] != 'decorator':
+                while stmts[0] < i:
+                    stmts.pop(0)
+                markStatement(logical, i, stmts[0], kind, marks)
+        if tok[0] != token.NAME:
+            continue
+        if tok[1] == 'def':
+            # Only the outer most function is marked as a function
+            # definition, as with the default engine.
+            nocall.add(i + 1)
+            if ctx.func_def_lvl == -1:
+                ctx.func_def_lvl = ctx.indent_lvl
+                marks[i + 1] = Mark.FUNC_DEF
+        elif tok[1] == 'class':
+            nocall.add(i + 1)
+            marks[i + 1] = Mark.CLASS
+        elif (marks[i] is None) and isOp(logical[i + 1], ('(',)) \
+                and (tok[1] not in keywords) and (i not in nocall):
+            # name(...) or ....name(...)
+            marks[i] = Mark.FUNC_CALL
+    return marks
+
+
+def emitToken(ctx, tok, mark):
+    """ Add a token to the index, as processTerminal() does for a terminal
+        of the concrete syntax tree.
+    """
+    tok_type = tok[0]
+    # Multi-line strings count as being on the line they end on
+    lineno = tok[3][0]
+
+    if tok_type == token.DEDENT:
+        ctx.indent_lvl -= 1
+        if ctx.indent_lvl == ctx.func_def_lvl:
+            ctx.func_def_lvl = -1
+            ctx.line.addFuncEnd()
+        return
+
+    if (lineno != ctx.line.lineno) and (tok_type != token.STRING):
+        ctx.commit(lineno)
+
+    if tok_type == token.NEWLINE:
+        pass
+    elif tok_type == token.INDENT:
+        ctx.indent_lvl += 1
+    elif tok_type == token.STRING:
+        if pycscope.strings_as_symbols:
+            m = pycscope.string_symbol_re.search(tok[1])
+            if m is not None:
+                ctx.line.addNonSymbol(m.group(1))
+                ctx.line.addSymbol(m.group(2))
+                ctx.line.addNonSymbol(m.group(3))
+                return
+        ctx.line.addNonSymbol(tok[1].replace("\n", "\\n"))
+    elif tok_type == token.NAME:
+        if mark is KEYWORD:
+            ctx.line.addNonSymbol(tok[1])
+        elif mark is not None:
+            ctx.line.addSymbol(tok[1], mark)
+        elif tok[1] in pycscope.kwlist:
+            ctx.line.addNonSymbol(tok[1])
+        else:
+            ctx.line.addSymbol(tok[1])
+    elif mark is not None:
+        # The dots of dotted names being included
+        ctx.line.addSymbol(tok[1], mark)
+    elif tok_type == token.ENDMARKER:
+        ctx.commit()
+    else:
+        ctx.line.addNonSymbol(tok[1])
@@ -0,0 +1,135 @@
+"""
+PyCscope fragment cache
+
+A content addressed, on-disk cache of the index fragments generated for
+Python source files, so that files already seen (on another branch, or in
+another checkout) are not parsed again.
+"""
+
+import errno, hashlib, os, sys, tempfile, zlib
+
+
+class FragmentCache(object):
+    """ A directory of cached index fragments, each stored in a file named
+        by the hash of the source it was generated from and of the
+        settings (the "salt") it was generated with.
+
+        The modification time of an entry is updated each time it is used,
+        so that prune() can evict the least recently used entries to keep
+        the cache under its maximum size.
+    """
+    # Entries start with a byte telling whether the rest is compressed
+    RAW = b'r'
+    COMPRESSED = b'z'
+
+    def __init__(self, cachedir, salt, maxsize=0, compress=False):
+        """ Constructor; a maxsize of 0 means the cache is never pruned.
+        """
+        self.cachedir = cachedir
+        self.salt = salt
+        self.maxsize = maxsize
+        self.compress = compress
+
+    def key(self, sourcecode):
+        """ The key of the fragment for the given source code.
+        """
+        h = hashlib.sha1(self.salt.encode('utf-8'))
+        if not isinstance(sourcecode, bytes):
+            sourcecode = sourcecode.encode('utf-8')
+        h.update(sourcecode)
+        return h.hexdigest()
+
+    def path(self, key):
+        """ The path of the file holding the entry for a key.
+        """
+        return os.path.join(self.cachedir, key[:2], key[2:])
+
+    def get(self, key):
+        """ Return the fragment stored for the key, or None if there is
+            none.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except EnvironmentError:
+            return None
+
+        if data[:1] == self.COMPRESSED:
+            try:
+                data = zlib.decompress(data[1:])
+            except zlib.error:
+                return None
+        elif data[:1] == self.RAW:
+            data = data[1:]
+        else:
+            return None
+        if sys.hexversion >= 0x03000000:
+            data = data.decode('utf-8')
+        return data
+
+    def put(self, key, fragment):
+        """ Store the fragment for the key. Entries are written to a
+            temporary file first and renamed into place, so that concurrent
+            writers and readers never see a partial entry.
+        """
+        if not isinstance(fragment, bytes):
+            fragment = fragment.encode('utf-8')
+        if self.compress:
+            data = self.COMPRESSED + zlib.compress(fragment)
+        else:
+            data = self.RAW + fragment
+
+        path = self.path(key)
+        dirpath = os.path.dirname(path)
+        try:
+            fd, tmppath = tempfile.mkstemp(dir=dirpath)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            try:
+                os.makedirs(dirpath)
+            except EnvironmentError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            fd, tmppath = tempfile.mkstemp(dir=dirpath)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmppath, path)
+        except:
+            os.unlink(tmppath)
+            raise
+
+    def prune(self):
+        """ Remove the least recently used entries until the cache is no
+            larger than its maximum size.
+        """
+        if not self.maxsize:
+            return
+
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.cachedir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+                total += st.st_size
+        if total <= self.maxsize:
+            return
+
+        entries.sort()
+        for mtime, path, size in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.maxsize:
+                break
@@ -0,0 +1,197 @@
+"""
+PyCscope excludes
+
+The rules deciding which files and directories of a tree are not indexed:
+the paths and glob patterns given with -e, the directories never worth
+indexing (version control metadata, caches, virtualenvs), and optionally
+the patterns of .gitignore files.
+
+Directories excluded are pruned as a whole, never being listed.
+"""
+
+import os, re
+
+
+# Directories skipped by default when recursing.
+default_dirs = frozenset(('.git', '.hg', '.svn', '__pycache__', '.tox', '.nox', '.venv'))
+
+# A file found in the top directory of a virtualenv, which is skipped by
+# default as well.
+venv_marker = 'pyvenv.cfg'
+
+
+class Rule(object):
+    """ A single glob pattern, as found in a .gitignore file.
+
+        Patterns holding a slash (other than a trailing one) are anchored,
+        matching the path relative to the directory of the .gitignore
+        file; the others match the name of files and directories at any
+        depth. A trailing slash only matches directories, and a leading
+        exclamation mark negates the pattern.
+    """
+    __slots__ = ('regex', 'negate', 'dironly', 'anchored', 'baselen')
+
+    def __init__(self, pattern, base='', anchored=None):
+        """ Constructor, for a pattern found in the directory base (a
+            normalized path relative to the top of the tree, '' being the
+            top itself); anchored can be given to override the default.
+        """
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\'):
+            pattern = pattern[1:]
+        self.dironly = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        if anchored is None:
+            anchored = '/' in pattern
+        self.anchored = anchored
+        self.regex = re.compile(translate(pattern.lstrip('/')))
+        self.baselen = len(base) + 1 if base else 0
+
+    def match(self, name, path, isdir):
+        """ Does the pattern match the entry of the given name, and path
+            (normalized, relative to the top of the tree)?
+        """
+        if self.dironly and not isdir:
+            return False
+        if self.anchored:
+            return self.regex.match(path[self.baselen:]) is not None
+        return self.regex.match(name) is not None
+
+
+def translate(pattern):
+    """ Translate a glob pattern into a regular expression, matching the
+        whole of a path: '*' and '?' do not match a slash, while '**'
+        matches any number of directories.
+    """
+    res = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            res.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and (i + 3 == n):
+            res.append('(?:/.*)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            res.append('.*')
+            i += 2
+            continue
+        i += 1
+        if c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j < 0:
+                res.append('\\[')
+                continue
+            chars = pattern[i:j].replace('\\', '\\\\')
+            if chars[:1] == '!':
+                chars = '^' + chars[1:]
+            res.append('[%s]' % chars)
+            i = j + 1
+        else:
+            res.append(re.escape(c))
+    return '(?s)%s\\Z' % ''.join(res)
+
+
+def hasWildcards(pattern):
+    return ('*' in pattern) or ('?' in pattern) or ('[' in pattern)
+
+
+def readGitignore(path, base):
+    """ Return the list of rules of a .gitignore file found in the
+        directory base, or an empty list if it cannot be read.
+    """
+    try:
+        f = open(path, 'r')
+    except IOError:
+        return []
+    rules = []
+    with f:
+        for line in f:
+            line = line.rstrip('\n').rstrip('\r')
+            if line.endswith(' ') and not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if (not line) or line.startswith('#'):
+                continue
+            rules.append(Rule(line, base))
+    return rules
+
+
+class Excludes(object):
+    """ Decides which entries of a tree are excluded from indexing.
+
+        The patterns given (see pycscope's -e) are paths, relative to the
+        current working directory, excluded along with everything below
+        them, or glob patterns; those without a slash holding wildcards
+        match names at any depth (e.g. '*_pb2.py', 'build*').
+    """
+    def __init__(self, patterns=(), defaults=True, gitignore=False):
+        self.rules = []
+        for pattern in patterns:
+            dironly = pattern.endswith('/')
+            pattern = os.path.normpath(pattern).replace(os.sep, '/')
+            anchored = ('/' in pattern) or not hasWildcards(pattern)
+            self.rules.append(Rule(pattern + ('/' if dironly else ''), anchored=anchored))
+        self.defaults = defaults
+        self.gitignore = gitignore
+
+    def isExcluded(self, name, path, isdir):
+        """ Is the entry of the given name, and path (normalized, relative
+            to the current working directory) excluded by the patterns?
+        """
+        for rule in self.rules:
+            if rule.match(name, path, isdir):
+                return True
+        return False
+
+    def isFileExcluded(self, path, rest, checked):
+        """ Is the file of the given path components, below the directory
+            of the given path, excluded, by itself or by one of the
+            directories holding it (as if found while recursing)? The
+            directories already checked are kept in the checked dictionary.
+        """
+        sub = path
+        for i, name in enumerate(rest):
+            sub = sub and "%s/%s" % (sub, name) or name
+            if i < len(rest) - 1:
+                if sub not in checked:
+                    checked[sub] = self.isExcluded(name, sub, True) or self.skipDir(name)
+                if checked[sub]:
+                    return True
+            elif self.isExcluded(name, sub, False):
+                return True
+        return False
+
+    def skipDir(self, name, names=()):
+        """ Is a directory found while recursing, of the given name and
+            holding the given names (if known yet), skipped by default?
+        """
+        return self.defaults and ((name in default_dirs) or (venv_marker in names))
+
+    def dirRules(self, dirpath, path, names, rules):
+        """ The .gitignore rules applying to the entries of the directory
+            dirpath (whose normalized path is path), holding the given
+            names, given the rules applying to the directory itself.
+        """
+        if self.gitignore and ('.gitignore' in names):
+            return rules + readGitignore(os.path.join(dirpath, '.gitignore'), path)
+        return rules
+
+
+def isIgnored(rules, name, path, isdir):
+    """ Is the entry ignored by the given .gitignore rules? The last rule
+        matching the entry decides.
+    """
+    for rule in reversed(rules):
+        if rule.match(name, path, isdir):
+            return not rule.negate
+    return False
@@ -0,0 +1,227 @@
+"""
+PyCscope git index
+
+Finds the files to index from the index of a git checkout (.git/index),
+read directly rather than running git, so that the files not tracked
+(build output, virtualenvs ...) are never indexed, and the tree is never
+walked.
+
+The blob SHA recorded in the index for each file also serves as its key
+(see pycscope.fileKey()), as long as the file was not changed since it
+was added to the index, so that files whose contents did not change
+(e.g. when switching back and forth between branches) are not parsed
+again.
+"""
+
+import binascii, os, struct, subprocess, sys
+
+import pycscope
+from pycscope.excludes import Excludes
+
+
+class GitIndex(object):
+    """ The regular files tracked in the index of the git checkout holding
+        basepath; an EnvironmentError is raised if there is none, and a
+        ValueError if the index cannot be read.
+    """
+    header = struct.Struct('>4sII')
+    # ctime, mtime (seconds and nanoseconds), dev, ino, mode, uid, gid,
+    # size, blob SHA and flags
+    entry = struct.Struct('>IIIIIIIIII20sH')
+
+    EXTENDED = 0x4000
+    SKIP_WORKTREE = 0x4000
+    NAME_MASK = 0x0fff
+
+    def __init__(self, basepath):
+        self.basepath = basepath
+        self.root, gitdir = findRepository(basepath)
+        self.indexpath = os.path.join(gitdir, 'index')
+        with open(self.indexpath, 'rb') as f:
+            data = f.read()
+            # Files changed in the same second as the index was written
+            # may have changed without their stat data telling
+            self.mtime = int(os.fstat(f.fileno()).st_mtime)
+        self.entries = self.parse(data)
+
+    def parse(self, data):
+        """ Return the entries of the index, as a dictionary mapping the
+            path of each file (relative to the top of the checkout) to a
+            (blob SHA, mtime seconds, mtime nanoseconds, size) tuple.
+        """
+        try:
+            signature, version, count = self.header.unpack_from(data, 0)
+        except struct.error:
+            raise ValueError("%s: not a git index" % self.indexpath)
+        if (signature != b'DIRC') or (version not in (2, 3, 4)):
+            raise ValueError("%s: unsupported git index" % self.indexpath)
+
+        entries = {}
+        offset = self.header.size
+        name = b''
+        try:
+            for i in range(count):
+                start = offset
+                fields = self.entry.unpack_from(data, offset)
+                offset += self.entry.size
+                mode, size, sha, flags = fields[6], fields[9], fields[10], fields[11]
+                extended = 0
+                if (version >= 3) and (flags & self.EXTENDED):
+                    extended = struct.unpack_from('>H', data, offset)[0]
+                    offset += 2
+                if version == 4:
+                    # The name is the previous one, less some bytes at its
+                    # end, followed by the rest, NUL terminated
+                    strip, offset = readVarint(data, offset)
+                    end = data.index(b'\0', offset)
+                    name = name[:len(name) - strip] + data[offset:end]
+                    offset = end + 1
+                else:
+                    length = flags & self.NAME_MASK
+                    if length == self.NAME_MASK:
+                        length = data.index(b'\0', offset) - offset
+                    name = data[offset:offset + length]
+                    # Entries are padded with NULs to a multiple of 8 bytes
+                    offset = start + ((offset + length - start + 8) & ~7)
+                if ((mode & 0o170000) != 0o100000) or (extended & self.SKIP_WORKTREE):
+                    # Not a regular file (symlink, submodule, sparse
+                    # directory), or not checked out
+                    continue
+                path = decodePath(name)
+                if path in entries:
+                    # Another stage of a conflict
+                    continue
+                entries[path] = (str(binascii.hexlify(sha).decode('ascii')), fields[2], fields[3], size)
+        except (struct.error, ValueError):
+            raise ValueError("%s: bad git index" % self.indexpath)
+        return entries
+
+    def repoPath(self, fname):
+        """ The path of a file (relative to basepath) in the index.
+        """
+        path = os.path.relpath(os.path.join(self.basepath, fname), self.root)
+        return path.replace(os.sep, '/')
+
+    def genFiles(self, args, recurse, exclude):
+        """ A generator for the Python files tracked by git under the given
+            files and directories (as for pycscope.genFiles(), and in the
+            same order, but for the files not tracked).
+        """
+        if not isinstance(exclude, Excludes):
+            exclude = Excludes(exclude)
+        for name in sorted(args):
+            name_n = os.path.normpath(name)
+            path = pycscope.normalPath(name_n)
+            prefix = self.repoPath(name_n)
+            if prefix in self.entries:
+                if pycscope.isPython(name_n) and not exclude.isExcluded(os.path.basename(path), path, False):
+                    yield name_n
+                continue
+            if exclude.isExcluded(os.path.basename(path), path, True):
+                continue
+
+            if prefix == '.':
+                prefix = ''
+            else:
+                prefix += '/'
+            found = []
+            for repopath in self.entries:
+                if repopath.startswith(prefix) and pycscope.isPython(repopath):
+                    rest = repopath[len(prefix):].split('/')
+                    if recurse or (len(rest) == 1):
+                        found.append(rest)
+            # Sorted by directory, then name, as directories are walked
+            found.sort()
+
+            excluded = {}
+            for rest in found:
+                if exclude.isFileExcluded(path, rest, excluded):
+                    continue
+                yield os.path.join(name_n, *rest)
+
+    def key(self, fname):
+        """ The key of a file (see pycscope.fileKey()): its blob SHA, if it
+            has not changed since it was added to the index, and otherwise
+            its modification time and size; None if it cannot be stat'd.
+        """
+        fullpath = os.path.join(self.basepath, fname)
+        try:
+            st = os.stat(fullpath)
+        except OSError:
+            return None
+        entry = self.entries.get(self.repoPath(fname))
+        if (entry is not None) and (int(st.st_mtime) == entry[1]) and (int(st.st_mtime) < self.mtime) \
+                and ((st.st_size & 0xffffffff) == entry[3]):
+            nsec = getattr(st, 'st_mtime_ns', None)
+            if (nsec is None) or (entry[2] == 0) or (nsec % 1000000000 == entry[2]):
+                return "git:%s" % entry[0]
+        return "%r:%d" % (st.st_mtime, st.st_size)
+
+
+def changedFiles(basepath, rev):
+    """ Ask git for the files of the checkout holding basepath changed
+        between the revision rev and the working tree, returning a list of
+        (status, path) tuples, where the status is 'D' for a file deleted,
+        and the path is relative to basepath. Renames are reported as the
+        deletion of the old path and the addition of the new one. An
+        EnvironmentError is raised if git cannot tell.
+    """
+    try:
+        proc = subprocess.Popen(['git', 'diff', '--name-status', '--no-renames', '--relative', '-z', rev, '--'],
+                                cwd=basepath, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise OSError(e.errno, "git: %s" % e.strerror)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise IOError("git diff %s: %s" % (rev, err.decode('utf-8', 'replace').strip()))
+
+    # NUL separated status and path pairs
+    fields = out.split(b'\0')
+    changes = []
+    for i in range(0, len(fields) - 1, 2):
+        changes.append((str(fields[i].decode('ascii')), decodePath(fields[i + 1])))
+    return changes
+
+
+def findRepository(path):
+    """ Return the top directory of the git checkout holding path, and its
+        git directory; an EnvironmentError is raised if there is none.
+    """
+    top = os.path.abspath(path)
+    while True:
+        dotgit = os.path.join(top, '.git')
+        if os.path.isdir(dotgit):
+            return top, dotgit
+        if os.path.isfile(dotgit):
+            # A linked worktree, or a submodule
+            with open(dotgit, 'r') as f:
+                line = f.readline().strip()
+            if line.startswith('gitdir:'):
+                return top, os.path.join(top, line[len('gitdir:'):].strip())
+        parent = os.path.dirname(top)
+        if parent == top:
+            raise IOError("%s: not in a git checkout" % path)
+        top = parent
+
+
+def readVarint(data, offset):
+    """ Read the variable length integer at offset, as git encodes the
+        length stripped from the previous name in version 4 indexes.
+        Returns the integer and the offset following it.
+    """
+    c = ord(data[offset:offset + 1])
+    offset += 1
+    val = c & 0x7f
+    while c & 0x80:
+        c = ord(data[offset:offset + 1])
+        offset += 1
+        val = ((val + 1) << 7) | (c & 0x7f)
+    return val, offset
+
+
+def decodePath(name):
+    """ Paths are handled as strings.
+    """
+    if sys.hexversion < 0x03000000:
+        return name
+    return name.decode(sys.getfilesystemencoding(), 'surrogateescape')
@@ -0,0 +1,339 @@
+"""
+PyCscope inverted index
+
+Writes the inverted index cscope uses for quick symbol lookups (its -q
+option), built from the symbol lines of the index sections as they are
+written.  The index is made of two files, named like cscope does:
+
+  - the inverted file (cscope.in.out), a control area followed by blocks
+    of sorted terms and a "superfinger" of the first term of each block,
+    searched by cscope's invfind();
+  - the postings file (cscope.po.out), where the postings of each term
+    (where the term appears in cscope.out) are stored contiguously.
+
+Both are written with the native sizes and byte order of C longs and
+shorts, as cscope reads them straight into its structures.
+
+The layout follows cscope's invlib.c, and is only checked here by reading
+it back (see findTerm()); it has not been checked with cscope itself, nor
+against an index built by cscope, so it is not offered as the -q option
+yet, only written when writeDatabase() is asked to.
+"""
+
+import heapq, os, struct, sys, tempfile
+
+# Size of the control area at the start of the inverted file (BUFSIZ, as on
+# glibc) and of each logical block of terms (2 * BUFSIZ).
+BUFSIZ = 8192
+BLOCKSIZE = 2 * BUFSIZ
+
+# Reference types recorded in postings are the mark characters of the
+# symbols; symbols without a mark are IDENT.
+IDENT = 2
+FCNDEF = ord('$')
+FCNEND = ord('}')
+
+# The length of a term is stored in an unsigned char
+TERMMAX = 255
+
+# PARAM: version, filestat, sizeblk, startbyte, supsize, cntlsize, share
+param_fmt = '@7l'
+# ENTRY: offset of the term in its block, term size, space, number of postings
+entry_fmt = '@hBBl'
+# POSTING: line offset, function offset, and a word holding the 24 bit file
+# index and 8 bit type bit fields
+posting_fmt = '@llL'
+
+LONG_SIZE = struct.calcsize('@l')
+ENTRY_SIZE = struct.calcsize(entry_fmt)
+POSTING_SIZE = struct.calcsize(posting_fmt)
+
+# Postings are held in memory until they take this many bytes, then sorted
+# by term and written to a temporary file, all of which are merged when
+# the index is complete.
+spill_bytes = 64 * 1024 * 1024
+
+
+def invertedNames(indexpath):
+    """ The names of the inverted and postings files for an index, as
+        cscope derives them: cscope.in.out and cscope.po.out for the
+        default cscope.out, otherwise the index file name, truncated to 11
+        characters, with .in and .po appended.
+    """
+    dirname, basename = os.path.split(indexpath)
+    if basename == "cscope.out":
+        return (os.path.join(dirname, "cscope.in.out"), os.path.join(dirname, "cscope.po.out"))
+    path = os.path.join(dirname, basename[:11])
+    return (path + ".in", path + ".po")
+
+
+def packPosting(lineoffset, fcnoffset, fileindex, type):
+    """ Pack a posting as the POSTING structure, with the bit fields laid
+        out the way the compiler allocates them for this byte order.
+    """
+    if sys.byteorder == 'little':
+        word = fileindex | (type << 24)
+    else:
+        bits = 8 * struct.calcsize('@L')
+        word = (fileindex << (bits - 24)) | (type << (bits - 32))
+    return struct.pack(posting_fmt, lineoffset, fcnoffset, word)
+
+
+def unpackPosting(data):
+    """ Return the (line offset, function offset, file index, type) of a
+        packed posting.
+    """
+    lineoffset, fcnoffset, word = struct.unpack(posting_fmt, data)
+    if sys.byteorder == 'little':
+        fileindex, type = word & 0xffffff, (word >> 24) & 0xff
+    else:
+        bits = 8 * struct.calcsize('@L')
+        fileindex, type = word >> (bits - 24), (word >> (bits - 32)) & 0xff
+    return (lineoffset, fcnoffset, fileindex, type)
+
+
+class InvertedIndexWriter(object):
+    """ Collects the postings of the symbols of each section written to an
+        index, and writes the inverted and postings files once the index is
+        complete.
+    """
+    def __init__(self, invpath, postpath):
+        self.invpath = invpath
+        self.postpath = postpath
+        self.postings = {}
+        self.size = 0
+        self.runs = []
+        self.fcnoffset = 0
+
+    def add(self, data, offset, fileindex):
+        """ Add the postings of the symbols of a section of the index, given
+            as bytes, written at the given offset of the index.
+        """
+        # Each section starts with its file mark line followed by an empty
+        # line, then come the source lines with symbols: the line number
+        # (and any text preceding the first symbol), then lines alternating
+        # between a symbol and the text following it, and an empty line.
+        lines = data.split(b'\n')
+        end = len(lines) - 1
+        pos = offset + len(lines[1]) + 3
+        self.fcnoffset = 0
+        i = 3
+        while i < end:
+            lineoffset = pos
+            pos += len(lines[i]) + 1
+            i += 1
+            sym = True
+            while i < end and lines[i]:
+                if sym:
+                    self.addSymbol(lines[i], pos, lineoffset, fileindex)
+                sym = not sym
+                pos += len(lines[i]) + 1
+                i += 1
+            pos += 1
+            i += 1
+
+        if self.size >= spill_bytes:
+            self.spill()
+
+    def addSymbol(self, line, pos, lineoffset, fileindex):
+        """ Add the posting for a symbol line at the given offset.
+        """
+        if line[:1] == b'\t':
+            type = ord(line[1:2])
+            term = line[2:]
+            pos += 2
+        else:
+            type = IDENT
+            term = line
+
+        # Function references are recorded with the offset of the name of
+        # the function they are in, found from its definition up to its end
+        # mark, which has no term of its own.
+        fcnoffset = self.fcnoffset
+        if type == FCNEND:
+            self.fcnoffset = 0
+            return
+        if type == FCNDEF:
+            self.fcnoffset = pos
+
+        if not term or len(term) > TERMMAX:
+            return
+        posting = packPosting(lineoffset, fcnoffset, fileindex, type)
+        try:
+            self.postings[term].append(posting)
+        except KeyError:
+            self.postings[term] = [posting]
+        self.size += POSTING_SIZE
+
+    def spill(self):
+        """ Write the postings collected so far to a temporary file, sorted
+            by term.
+        """
+        run = tempfile.TemporaryFile()
+        for term in sorted(self.postings):
+            postings = self.postings[term]
+            run.write(struct.pack('@ll', len(term), len(postings)))
+            run.write(term)
+            run.write(b''.join(postings))
+        run.seek(0)
+        self.runs.append(run)
+        self.postings = {}
+        self.size = 0
+
+    def genRun(self, idx):
+        """ Generate the (term, run index, postings) of a temporary file,
+            in term order.
+        """
+        run = self.runs[idx]
+        hdr_len = struct.calcsize('@ll')
+        while True:
+            hdr = run.read(hdr_len)
+            if not hdr:
+                break
+            term_len, count = struct.unpack('@ll', hdr)
+            term = run.read(term_len)
+            yield (term, idx, run.read(count * POSTING_SIZE))
+
+    def genTerms(self):
+        """ Generate each term, in order, along with all of its postings
+            (bytes), merging those spilled to temporary files.
+        """
+        if not self.runs:
+            for term in sorted(self.postings):
+                yield (term, b''.join(self.postings[term]))
+            return
+
+        self.spill()
+        # Runs are merged in the order they were written, to keep postings
+        # in the order they appear in the index.
+        merged = heapq.merge(*[ self.genRun(idx) for idx in range(len(self.runs)) ])
+        term, idx, postings = next(merged)
+        parts = [postings]
+        for nterm, idx, postings in merged:
+            if nterm != term:
+                yield (term, b''.join(parts))
+                term = nterm
+                parts = []
+            parts.append(postings)
+        yield (term, b''.join(parts))
+
+    def close(self):
+        """ Write the inverted and postings files, returning the number of
+            terms in the index.
+        """
+        try:
+            with open(self.invpath, 'wb') as finv:
+                with open(self.postpath, 'wb') as fpost:
+                    nterms = self.write(finv, fpost)
+        finally:
+            for run in self.runs:
+                run.close()
+            self.runs = []
+            self.postings = {}
+        return nterms
+
+    def write(self, finv, fpost):
+        """ Write the blocks of terms, the superfinger and the control area.
+        """
+        nterms = 0
+        nextpost = 0
+        fingers = []
+        block = []
+        used = 3 * LONG_SIZE
+        for term, postings in self.genTerms():
+            nterms += 1
+            fpost.write(postings)
+            # Each term takes its entry, and the term, padded to a long,
+            # followed by the offset of its postings.
+            space = ((len(term) + LONG_SIZE - 1) // LONG_SIZE + 1) * LONG_SIZE
+            if block and used + ENTRY_SIZE + space > BLOCKSIZE:
+                fingers.append(block[0][0])
+                self.writeBlock(finv, len(fingers) - 1, block)
+                block = []
+                used = 3 * LONG_SIZE
+            block.append((term, nextpost, len(postings) // POSTING_SIZE, space))
+            used += ENTRY_SIZE + space
+            nextpost += len(postings)
+        fingers.append(block[0][0] if block else b' ')
+        self.writeBlock(finv, len(fingers) - 1, block)
+        numlogblk = len(fingers)
+
+        # Blocks are chained in a loop, which is closed now the number of
+        # blocks is known.
+        finv.seek(BUFSIZ + 2 * LONG_SIZE)
+        finv.write(struct.pack('@l', numlogblk - 1))
+        finv.seek(BUFSIZ + (numlogblk - 1) * BLOCKSIZE + LONG_SIZE)
+        finv.write(struct.pack('@l', 0))
+
+        # The superfinger: the number of blocks, then the offset (from the
+        # start of the superfinger) of the first term of each block, and
+        # the terms themselves.
+        offsets = []
+        offset = (numlogblk + 1) * LONG_SIZE
+        for term in fingers:
+            offsets.append(offset)
+            offset += len(term) + 1
+        supfing = struct.pack('@%dl' % (numlogblk + 1), numlogblk, *offsets)
+        supfing += b''.join([ term + b'\0' for term in fingers ])
+        startbyte = BUFSIZ + numlogblk * BLOCKSIZE
+        finv.seek(startbyte)
+        finv.write(supfing)
+
+        finv.seek(0)
+        finv.write(struct.pack(param_fmt, 1, 0, BLOCKSIZE, startbyte, len(supfing), BUFSIZ, 0))
+        return nterms
+
+    def writeBlock(self, finv, numblk, block):
+        """ Write a logical block: the number of terms, the next and
+            previous block numbers, and the entries for the terms, with the
+            terms and their postings offsets stored from the end of the
+            block towards the entries.
+        """
+        buff = bytearray(BLOCKSIZE)
+        struct.pack_into('@3l', buff, 0, len(block), numblk + 1, numblk - 1)
+        pos = 3 * LONG_SIZE
+        lastinblk = BLOCKSIZE
+        for term, nextpost, count, space in block:
+            lastinblk -= space
+            struct.pack_into(entry_fmt, buff, pos, lastinblk, len(term), 0, count)
+            buff[lastinblk:lastinblk + len(term)] = term
+            struct.pack_into('@l', buff, lastinblk + space - LONG_SIZE, nextpost)
+            pos += ENTRY_SIZE
+        finv.seek(BUFSIZ + numblk * BLOCKSIZE)
+        finv.write(bytes(buff))
+
+
+def findTerm(invpath, postpath, term):
+    """ Look up a term (bytes) the way cscope's invfind() does, returning
+        its postings as a list of (line offset, function offset, file
+        index, type) tuples.
+    """
+    with open(invpath, 'rb') as finv:
+        param = struct.unpack(param_fmt, finv.read(struct.calcsize(param_fmt)))
+        version, filestat, sizeblk, startbyte, supsize, cntlsize, share = param
+        finv.seek(startbyte)
+        supfing = finv.read(supsize)
+
+        # Find the block from the superfinger
+        numlogblk = struct.unpack_from('@l', supfing)[0]
+        offsets = struct.unpack_from('@%dl' % numlogblk, supfing, LONG_SIZE)
+        numblk = 0
+        for i, offset in enumerate(offsets):
+            if supfing[offset:supfing.index(b'\0', offset)] <= term:
+                numblk = i
+            else:
+                break
+        finv.seek(cntlsize + numblk * sizeblk)
+        block = finv.read(sizeblk)
+
+    numitems = struct.unpack_from('@l', block)[0]
+    for i in range(numitems):
+        offset, size, space, post = struct.unpack_from(entry_fmt, block, 3 * LONG_SIZE + i * ENTRY_SIZE)
+        if block[offset:offset + size] == term:
+            ptr = offset + (size + LONG_SIZE - 1) // LONG_SIZE * LONG_SIZE
+            nextpost = struct.unpack_from('@l', block, ptr)[0]
+            with open(postpath, 'rb') as fpost:
+                fpost.seek(nextpost)
+                data = fpost.read(post * POSTING_SIZE)
+            return [ unpackPosting(data[j:j + POSTING_SIZE]) for j in range(0, len(data), POSTING_SIZE) ]
+    return []
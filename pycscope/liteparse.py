@@ -0,0 +1,239 @@
+"""
+PyCscope lite engine
+
+Indexes Python source with a single pass of the tokenize module, for large
+trees of third party code where throughput matters more than exact marks.
+The statements with names to mark are found from the tokens of each
+logical line alone, where the ast engine (see pycscope.astparse) finds
+them from the ast, and the tokens are then marked and indexed by the rules
+of that engine.
+
+For ordinary code the marks are those of the other engines, but the source
+is never checked for syntax errors, and statements the tokens of a line do
+not tell apart (e.g. a subscripted soft keyword, match[x]: int) can be
+marked differently.
+"""
+
+import token, tokenize
+
+import pycscope
+from pycscope.astparse import recodeSource, genTokens, genLogicalLines, markLogicalLine, emitToken, \
+    isOp, matchClose, augassign_ops, KEYWORD
+
+
+# Keywords starting a compound statement, whose header ends with a colon,
+# possibly followed by simple statements on the same line.
+compound_keywords = frozenset(('if', 'elif', 'else', 'while', 'for', 'try', 'except',
+                               'finally', 'with', 'async', 'def', 'class'))
+
+
+def parseSource(sourcecode, indexbuff, indexbuff_len, dump=False):
+    """Parses python source code and puts the resulting index information into the buffer.
+    """
+    if len(sourcecode) == 0:
+        return indexbuff_len
+
+    if '\r' in sourcecode:
+        sourcecode = sourcecode.replace('\r\n', '\n')
+    if sourcecode[-1] != '\n':
+        # We need to make sure files are terminated by a newline.
+        sourcecode += '\n'
+    sourcecode = recodeSource(sourcecode)
+    lines = sourcecode.splitlines(True)
+
+    try:
+        return indexSource(sourcecode, lines, indexbuff, indexbuff_len, dump)
+    except tokenize.TokenError as e:
+        # Unterminated multi-line statements or strings, the only errors
+        # found without the ast module, reported as the other engines do.
+        msg, (lineno, offset) = e.args
+        if 'EOF in multi-line statement' in msg:
+            # Reported past the end of the file, as the tokenize module did
+            # before Python 3.12 (which reports the last line read)
+            lineno = sourcecode.count('\n') + 1
+            offset = 0
+        raise SyntaxError(msg, (None, lineno, offset, None))
+
+
+def indexSource(sourcecode, lines, indexbuff, indexbuff_len, dump):
+    """ Index the logical lines of the source.
+    """
+    keywords = pycscope.kwlist
+    ctx = pycscope.Context()
+    decorators = []
+    for logical in genLogicalLines(genTokens(sourcecode, lines)):
+        if dump:
+            print(logical)
+        if isOp(logical[0], ('@',)) and (len(logical) > 2):
+            # Only the decorators of functions are marked, which is known
+            # once the statement following them is seen.
+            decorators.append(logical)
+            continue
+
+        anchors = findAnchors(logical)
+        if decorators:
+            function = (logical[0][0] == token.NAME) and (logical[0][1] in ('def', 'async'))
+            for decorator in decorators:
+                if function:
+                    marks = markLogicalLine(ctx, decorator, {decorator[1][2]: ('decorator', 0)}, keywords)
+                else:
+                    marks = markLogicalLine(ctx, decorator, {}, keywords)
+                for tok, mark in zip(decorator, marks):
+                    emitToken(ctx, tok, mark)
+            decorators = []
+
+        if isPrintFunction(logical):
+            # print is a name, which can be called, like any other
+            keywords = [ kw for kw in keywords if kw != 'print' ]
+
+        marks = markLogicalLine(ctx, logical, anchors, keywords)
+        unmarkAdjacent(logical, marks)
+        for tok, mark in zip(logical, marks):
+            emitToken(ctx, tok, mark)
+
+    indexbuff.extend(ctx.buff)
+    indexbuff_len += len(ctx.buff)
+    return indexbuff_len
+
+
+def findAnchors(logical):
+    """ Find the statements of a logical line with names to mark, returning
+        a dictionary like the one pycscope.astparse.findAnchors() builds
+        from the ast, for this line only.
+    """
+    anchors = {}
+    end = len(logical) - 1
+    start = 0
+    while start < end:
+        # The simple statements of the line, and those following the
+        # headers of compound statements, are separated by semicolons.
+        stop = start
+        depth = 0
+        while stop < end:
+            tok = logical[stop]
+            if tok[0] == token.OP:
+                if tok[1] in '([{':
+                    depth += 1
+                elif tok[1] in ')]}':
+                    depth -= 1
+                elif (depth == 0) and (tok[1] == ';'):
+                    break
+            stop += 1
+
+        while start < stop:
+            first = logical[start]
+            if first[0] != token.NAME:
+                kind = findAssignment(logical, start, stop)
+                if kind is not None:
+                    anchors[first[2]] = kind
+                break
+            if (first[1] in compound_keywords) and not ((first[1] == 'async') and (logical[start + 1][0] != token.NAME)):
+                # async is only a keyword from Python 3.7
+                start = findColon(logical, start, stop) + 1
+                continue
+            if first[1] in ('import', 'from', 'global'):
+                anchors[first[2]] = (first[1], 0)
+                break
+            if isSoftKeyword(logical, start, stop):
+                if first[1] == 'case':
+                    anchors[logical[start + 1][2]] = ('soft', 0)
+                else:
+                    anchors[first[2]] = ('soft', 0)
+                if first[1] == 'type':
+                    break
+                start = findColon(logical, start, stop) + 1
+                continue
+            kind = findAssignment(logical, start, stop)
+            if kind is not None:
+                anchors[first[2]] = kind
+            break
+        start = stop + 1
+    return anchors
+
+
+def findColon(logical, start, stop):
+    """ Return the index of the colon ending the header of the compound
+        statement between start and stop, skipping those of lambdas.
+    """
+    lambdas = 0
+    i = start
+    while i < stop:
+        tok = logical[i]
+        if isOp(tok, ('(', '[', '{')):
+            i = matchClose(logical, i, stop)
+            continue
+        if (tok[0] == token.NAME) and (tok[1] == 'lambda'):
+            lambdas += 1
+        elif isOp(tok, (':',)):
+            if not lambdas:
+                return i
+            lambdas -= 1
+        i += 1
+    return stop
+
+
+def findAssignment(logical, start, stop):
+    """ Return the kind of assignment (see pycscope.astparse.findAnchors())
+        of the simple statement between start and stop, or None.
+    """
+    targets = 0
+    i = start
+    while i < stop:
+        tok = logical[i]
+        if tok[0] == token.OP:
+            if tok[1] in ('(', '[', '{'):
+                i = matchClose(logical, i, stop)
+                continue
+            if tok[1] == '=':
+                targets += 1
+            elif tok[1] == ':':
+                # An annotated assignment, which is not marked
+                return None
+            elif (tok[1] in augassign_ops) and not targets:
+                return ('aug', 1)
+        elif (tok[0] == token.NAME) and (tok[1] == 'lambda'):
+            # The default values of the parameters of a lambda
+            break
+        i += 1
+    if targets:
+        return ('=', targets)
+    return None
+
+
+def isSoftKeyword(logical, start, stop):
+    """ Does the simple statement between start and stop start with a soft
+        keyword (match, case or type)?
+    """
+    first = logical[start]
+    if (first[1] not in ('match', 'case', 'type')) or (start + 1 >= stop):
+        return False
+    second = logical[start + 1]
+    if first[1] == 'type':
+        # type X = ..., type X[T] = ...
+        return (second[0] == token.NAME) and (start + 2 < stop) and isOp(logical[start + 2], ('=', '['))
+    if second[0] == token.OP:
+        # match (x): is a statement, but match.x, match[x], match = x, or
+        # match(x) alone are expressions
+        if second[1] not in ('(', '-', '*', '{'):
+            return False
+        if (second[1] == '(') and (matchClose(logical, start + 1, stop) >= stop):
+            return False
+    return findColon(logical, start, stop) < stop
+
+
+def unmarkAdjacent(logical, marks):
+    """ Unmark adjacent names, which make up a single symbol of the index,
+        found only in sources which are not valid Python.
+    """
+    for i in range(1, len(logical)):
+        if (logical[i][0] == token.NAME) and (logical[i - 1][0] == token.NAME) and (marks[i] != marks[i - 1]) \
+                and (logical[i][1] not in pycscope.kwlist) and (logical[i - 1][1] not in pycscope.kwlist) \
+                and (KEYWORD not in (marks[i], marks[i - 1])):
+            marks[i - 1] = marks[i] = None
+
+
+def isPrintFunction(logical):
+    """ Does the logical line import print_function from __future__?
+    """
+    return (len(logical) > 3) and (logical[0][1] == 'from') and (logical[1][1] == '__future__') \
+        and ('print_function' in [ tok[1] for tok in logical if tok[0] == token.NAME ])
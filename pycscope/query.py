@@ -0,0 +1,232 @@
+"""
+PyCscope queries
+
+Answers the queries of cscope's line-oriented mode (cscope -L) from a
+database loaded in memory, without running cscope: the database is read
+once into dictionaries keyed by symbol, then by mark, so that each query
+is a few lookups.
+
+The function of each line is found from the spans of the function
+definitions, from their '$' mark to the matching '}' mark; as functions
+nested in others are not marked, their lines are those of the function
+holding them.
+
+Text and egrep queries search the source of the files, only reading
+those which may hold a match when a text index was written along with the
+database (see pycscope.textindex).
+"""
+
+import re, sys
+
+import pycscope
+from pycscope import Mark
+from pycscope.textindex import TextIndex, grep, literalRuns, trigrams_ext
+
+
+# The kinds of queries, in the order cscope -L numbers them (0 to 4, then 6
+# to 9).
+query_kinds = ("symbol", "def", "callees", "callers", "text", "egrep", "file", "include", "assign")
+
+# The marks of definitions.
+def_marks = (Mark.FUNC_DEF, Mark.CLASS, Mark.GLOBAL)
+
+# The function given for lines outside of any, and the function and text
+# given for the files found, as cscope does.
+global_func = "<global>"
+unknown = "<unknown>"
+
+
+class Database(object):
+    """ A cscope database, loaded in memory for queries; an
+        EnvironmentError is raised if it cannot be read, and a ValueError
+        if it is not a database.
+
+        The result of each query is a list of (file name, function, line
+        number, text) tuples, as the lines cscope -L prints.
+    """
+    def __init__(self, indexpath):
+        self.indexpath = indexpath
+        reader = pycscope.IndexReader(indexpath)
+        try:
+            self.basepath = reader.basepath
+            data = reader.data[reader.index_start + 1:reader.index_end + 1]
+        finally:
+            reader.close()
+        if sys.hexversion >= 0x03000000:
+            data = data.decode('utf-8')
+        self.text = data
+        self.fnames = []
+        # The file, line number and offset in text of each line indexed
+        self.files = []
+        self.linenos = []
+        self.offsets = []
+        # The (line, function) tuples of the symbols, by name then mark
+        self.symbols = {}
+        # The (callee, line) tuples of the calls made by each function
+        self.calls = {}
+        # The (line, function) tuples of the includes, by name and by each
+        # of its dotted suffixes
+        self.includes = {}
+        self.parse()
+
+    def parse(self):
+        """ Parse the index, filling the dictionaries of symbols.
+        """
+        symbols = self.symbols
+        calls = self.calls
+        files = self.files
+        linenos = self.linenos
+        offsets = self.offsets
+        fidx = -1
+        stack = []
+        line = -1
+        inline = False
+        symbol = False
+        offset = 0
+        for item in self.text.split('\n'):
+            start = offset
+            offset += len(item) + 1
+            if not item:
+                # The end of a line, or the blank line before a file mark
+                inline = False
+                continue
+            if not inline:
+                if item.startswith('\t' + Mark.FILE):
+                    self.fnames.append(item[2:])
+                    fidx += 1
+                    stack = []
+                    continue
+                inline = True
+                symbol = True
+                line += 1
+                files.append(fidx)
+                linenos.append(int(item.split(' ', 1)[0]))
+                offsets.append(start)
+                continue
+            if not symbol:
+                symbol = True
+                continue
+            symbol = False
+            if item[0] == '\t':
+                mark = item[1]
+                name = item[2:]
+            else:
+                mark = ''
+                name = item
+            if mark == Mark.FUNC_END:
+                if stack:
+                    stack.pop()
+                continue
+            if mark == Mark.FUNC_DEF:
+                stack.append(name)
+            func = stack and stack[-1] or None
+            symbols.setdefault(name, {}).setdefault(mark, []).append((line, func))
+            if (mark == Mark.FUNC_CALL) and (func is not None):
+                calls.setdefault(func, []).append((name, line))
+            elif mark == Mark.INCLUDE:
+                parts = name.split('.')
+                for i in range(len(parts)):
+                    self.includes.setdefault('.'.join(parts[i:]), []).append((line, func))
+
+    def lineText(self, line):
+        """ The text of a line indexed, with its marks removed.
+        """
+        offset = self.offsets[line]
+        end = self.text.find('\n\n', offset)
+        items = self.text[offset:end].split('\n')
+        first = items[0].split(' ', 1)
+        buff = [ len(first) > 1 and first[1] or '' ]
+        for i, item in enumerate(items[1:]):
+            if (i % 2 == 0) and item.startswith('\t'):
+                item = item[2:]
+            buff.append(item)
+        return ''.join(buff).strip()
+
+    def result(self, line, func):
+        return (self.fnames[self.files[line]], func or global_func, self.linenos[line], self.lineText(line))
+
+    def find(self, kind, name):
+        """ Run the query of the given kind (see query_kinds) for name.
+        """
+        return getattr(self, 'find' + kind.capitalize())(name)
+
+    def findSymbol(self, name):
+        """ The lines referencing the symbol.
+        """
+        refs = []
+        for mark, found in self.symbols.get(name, {}).items():
+            refs.extend(found)
+        return [ self.result(line, func) for line, func in sorted(refs, key=firstItem) ]
+
+    def findDef(self, name):
+        """ The definitions of the symbol (functions, classes).
+        """
+        marks = self.symbols.get(name, {})
+        refs = []
+        for mark in def_marks:
+            refs.extend(marks.get(mark, []))
+        return [ self.result(line, name) for line, func in sorted(refs, key=firstItem) ]
+
+    def findCallees(self, name):
+        """ The calls made by the functions of the given name.
+        """
+        return [ self.result(line, callee) for callee, line in self.calls.get(name, []) ]
+
+    def findCallers(self, name):
+        """ The calls made to the function, with the functions making them.
+        """
+        return [ self.result(line, func) for line, func in self.symbols.get(name, {}).get(Mark.FUNC_CALL, []) ]
+
+    def findText(self, name):
+        """ The lines holding the text.
+        """
+        return self.grep(re.escape(name), [ name ])
+
+    def findEgrep(self, name):
+        """ The lines matching the regular expression; a re.error is
+            raised if it is not a valid one.
+        """
+        return self.grep(name, literalRuns(name))
+
+    def grep(self, pattern, literals):
+        """ The lines matching the regular expression, searched for in the
+            files holding the literal strings given, as found in the text
+            index, or in every file if there is none.
+        """
+        regex = re.compile(pattern)
+        try:
+            index = TextIndex(self.indexpath + trigrams_ext)
+        except (EnvironmentError, ValueError):
+            fnames = self.fnames
+        else:
+            try:
+                fnames = index.candidates(literals)
+            finally:
+                index.close()
+        return [ (fname, unknown, lineno, line.strip()) for fname, lineno, line in grep(self.basepath, fnames, regex) ]
+
+    def findFile(self, name):
+        """ The files of the given name, or path (their end).
+        """
+        name = pycscope.normalPath(name)
+        found = []
+        for fname in self.fnames:
+            path = pycscope.normalPath(fname)
+            if (path == name) or path.endswith('/' + name):
+                found.append((fname, unknown, 1, unknown))
+        return found
+
+    def findInclude(self, name):
+        """ The imports of the module, given by its name, or the end of
+            its dotted name.
+        """
+        return [ self.result(line, func) for line, func in sorted(self.includes.get(name, []), key=firstItem) ]
+
+    def findAssign(self, name):
+        """ The assignments to the symbol.
+        """
+        return [ self.result(line, func) for line, func in self.symbols.get(name, {}).get(Mark.ASSIGN, []) ]
+
+
+def firstItem(ref):
+    return ref[0]
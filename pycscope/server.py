@@ -0,0 +1,144 @@
+"""
+PyCscope query server
+
+Keeps a database loaded in memory (see pycscope.query), answering the
+queries of clients connecting to a Unix socket, in the protocol of
+cscope's line-oriented mode (cscope -l), so that editors can query it
+instead of running cscope, which reads the whole database, for each
+lookup.
+
+Each query is a line holding the number of the query (as cscope numbers
+them) immediately followed by its pattern, e.g. '1main' for the
+definition of main; the reply is a 'cscope: N lines' line followed by the
+N lines found, then a '>> ' prompt for the next query. 'r' reloads the
+database, and 'q' ends the session.
+
+The database is loaded again when it changes (it is replaced as a whole
+when written, see pycscope.writeDatabase()), the previous one answering
+queries until the new one is loaded.
+"""
+
+import os, re, stat, sys, threading
+
+if sys.hexversion < 0x03000000:
+    import SocketServer as socketserver
+else:
+    import socketserver
+
+import pycscope
+from pycscope.query import Database
+
+
+# The queries of cscope's line-oriented mode, by number; that for changing
+# text (5) finds nothing.
+query_numbers = { '0': "symbol", '1': "def", '2': "callees", '3': "callers", '4': "text", '6': "egrep",
+                  '7': "file", '8': "include", '9': "assign" }
+
+prompt = b">> "
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Serves queries on the database at indexpath, from the Unix socket
+        at sockpath (replacing a socket left there by an earlier server);
+        an EnvironmentError or a ValueError is raised if the database
+        cannot be loaded.
+    """
+    daemon_threads = True
+
+    def __init__(self, indexpath, sockpath):
+        self.indexpath = indexpath
+        self.sockpath = sockpath
+        self.lock = threading.Lock()
+        self.stamp = self.statIndex()
+        self.db = Database(indexpath)
+        try:
+            if stat.S_ISSOCK(os.stat(sockpath).st_mode):
+                os.unlink(sockpath)
+        except OSError:
+            pass
+        socketserver.UnixStreamServer.__init__(self, sockpath, QueryHandler)
+
+    def statIndex(self):
+        """ The modification time, size and inode of the database, which
+            change when it is written, or None if it cannot be stat'd.
+        """
+        try:
+            st = os.stat(self.indexpath)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def database(self, reload=False):
+        """ The database to query, loaded again first if it changed (or if
+            asked to), unless another thread is loading it already.
+        """
+        stamp = self.statIndex()
+        if (reload or (stamp != self.stamp)) and (stamp is not None) and self.lock.acquire(False):
+            try:
+                try:
+                    db = Database(self.indexpath)
+                except (EnvironmentError, ValueError) as e:
+                    # Keep on with the database loaded
+                    print("pycscope.py: %s" % e)
+                else:
+                    self.db = db
+                self.stamp = stamp
+            finally:
+                self.lock.release()
+        return self.db
+
+    def query(self, line):
+        """ The reply (bytes) to a query, given as a line of cscope's
+            line-oriented mode, without its prompt.
+        """
+        kind = query_numbers.get(line[:1])
+        pattern = line[1:]
+        found = []
+        if kind is not None and pattern:
+            try:
+                found = self.database().find(kind, pattern)
+            except re.error:
+                # An invalid egrep pattern matches nothing
+                pass
+        out = [ "cscope: %d lines\n" % len(found) ]
+        for fname, func, lineno, text in found:
+            out.append("%s %s %d %s\n" % (fname, func, lineno, text))
+        return pycscope.toBytes(''.join(out))
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.sockpath)
+        except OSError:
+            pass
+
+    def run(self):
+        """ Serve queries until interrupted.
+        """
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """ A session of a client, one query per line.
+    """
+    def handle(self):
+        while True:
+            self.wfile.write(prompt)
+            self.wfile.flush()
+            line = self.rfile.readline()
+            if not line:
+                break
+            if sys.hexversion >= 0x03000000:
+                line = line.decode('utf-8', 'replace')
+            line = line.rstrip('\r\n')
+            if line[:1] == 'q':
+                break
+            if line[:1] == 'r':
+                self.server.database(True)
+            elif line[:1].isdigit():
+                self.wfile.write(self.server.query(line))
@@ -0,0 +1,277 @@
+"""
+PyCscope sharded output
+
+Splits the index of a large tree (a monorepo) into several cscope
+databases, one per shard of the files, rather than a single 'reffile', so
+that each can be rebuilt on its own, and searched alone when only one
+area of the tree is being worked on.
+
+Files are sharded by their top-level package, by their directory down to
+a given depth, or in consecutive runs of about a given size of source.
+Each shard database is written in a directory of its own, below
+'reffile.d', so that the names cscope derives for its inverted index (see
+pycscope.invlib.invertedNames()) never collide. The shard databases are
+listed in a manifest, 'reffile.shards', for editors to add them all. A
+run over part of the tree only replaces the shards of that part: the
+shards of earlier runs which it no longer writes (those of another
+sharding, or of packages since removed) are deleted, so that no file is
+found in two shards, while those of the rest of the tree are kept listed.
+"""
+
+import os
+
+import pycscope
+from pycscope.invlib import invertedNames
+
+
+# Directory holding the shard databases, and manifest listing them, as
+# extensions of the index file name.
+shards_ext = ".d"
+manifest_ext = ".shards"
+
+# Name of the shard of the files found at the top of the tree.
+top_shard = "_top"
+
+shard_modes = ("package", "depth", "size")
+
+
+def parseShardBy(val):
+    """ Parse the sharding given on the command line: 'package',
+        'depth:N' or 'size:SIZE' (K, M, G suffixes allowed), returned as a
+        (mode, argument) tuple; None is returned for an invalid one.
+    """
+    mode, sep, arg = val.partition(':')
+    if mode == "package":
+        if sep:
+            return None
+        return mode, None
+    if mode == "depth":
+        try:
+            depth = int(arg)
+        except ValueError:
+            return None
+        if depth < 1:
+            return None
+        return mode, depth
+    if mode == "size":
+        size = pycscope.parseSize(arg) if arg else None
+        if not size:
+            return None
+        return mode, size
+    return None
+
+
+def shardName(dirname):
+    """ The name of the shard of a directory: its path, with dots between
+        its components.
+    """
+    parts = [ part == os.pardir and '__' or part
+              for part in os.path.normpath(dirname).split(os.sep) if part not in ('', os.curdir) ]
+    return '.'.join(parts) or top_shard
+
+
+def groupShards(basepath, fnames, shardby):
+    """ Group the file names given into shards, as given by parseShardBy(),
+        returning a list of (shard name, file names) tuples, sorted by
+        name, the files of each shard keeping their order.
+    """
+    mode, arg = shardby
+    shards = {}
+    if mode == "size":
+        num = 1
+        total = 0
+        for fname in fnames:
+            try:
+                size = os.path.getsize(os.path.join(basepath, fname))
+            except OSError:
+                size = 0
+            if total and (total + size > arg):
+                num += 1
+                total = 0
+            total += size
+            shards.setdefault("%03d" % num, []).append(fname)
+        return sorted(shards.items())
+
+    packages = {}
+    for fname in fnames:
+        dirname = os.path.dirname(os.path.normpath(fname))
+        if mode == "depth":
+            parts = dirname.split(os.sep)
+            shard = os.sep.join(parts[:arg])
+        else:
+            shard = topPackage(basepath, dirname, packages)
+        shards.setdefault(shardName(shard), []).append(fname)
+    return sorted(shards.items())
+
+
+def topPackage(basepath, dirname, packages):
+    """ The directory of the top-level package holding the modules of the
+        directory given, or the directory itself if it is not a package.
+        Whether each directory is a package is kept in the packages
+        dictionary.
+    """
+    top = dirname
+    while dirname and (dirname != os.pardir):
+        if dirname not in packages:
+            packages[dirname] = os.path.isfile(os.path.join(basepath, dirname, '__init__.py'))
+        if not packages[dirname]:
+            break
+        top = dirname
+        dirname = os.path.dirname(dirname)
+    return top
+
+
+def shardPath(indexpath, name):
+    """ The path of the database of the shard of the given name.
+    """
+    return os.path.join(indexpath + shards_ext, name, os.path.basename(indexpath))
+
+
+def writeShards(basepath, indexpath, fnames, shardby, inverted=False, debug=False, jobs=1, incremental=False,
+                cache=None, keyfunc=None, args=(os.curdir,), recurse=True):
+    """ Write a database for each shard of the files given (see
+        groupShards()), and the manifest listing them. In incremental mode,
+        each shard is updated from its existing database (see
+        pycscope.genIncremental()).
+
+        The files given are those found in the paths of args (recursing
+        into directories if asked to); the shards of earlier runs which
+        this run does not write are only deleted when all of their files
+        are found there, or no longer exist (see staleShards()).
+
+        Returns the list of paths of the shard databases written.
+    """
+    paths = []
+    for name, shard in groupShards(basepath, fnames, shardby):
+        path = shardPath(indexpath, name)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+
+        reader = None
+        if incremental:
+            try:
+                reader = pycscope.IndexReader(path)
+            except (IOError, OSError, ValueError):
+                pass
+            stamps = []
+            sections = pycscope.genIncremental(basepath, shard, debug, jobs, reader, stamps, cache, keyfunc)
+        else:
+            sections = pycscope.genIndex(basepath, shard, debug, jobs, cache)
+        written = pycscope.writeDatabase(basepath, path, sections, inverted, reader)
+        if incremental:
+            pycscope.writeSections(path, written, dict(stamps))
+        elif os.path.exists(path + pycscope.sections_ext):
+            os.unlink(path + pycscope.sections_ext)
+        paths.append(path)
+
+    stale = staleShards(basepath, indexpath, paths, args, recurse)
+    writeManifest(indexpath + manifest_ext, paths, stale)
+    pruneShards(stale)
+    return paths
+
+
+def inScope(fname, scope, recurse):
+    """ Whether a file (a normalized path, see pycscope.normalPath()) is
+        found in one of the normalized paths of scope, directly, or below
+        it when recursing.
+    """
+    dirname = fname.rpartition('/')[0]
+    for path in scope:
+        if (fname == path) or (dirname == path):
+            return True
+        if recurse and ((path == '') or fname.startswith(path + '/')):
+            return True
+    return False
+
+
+def staleShards(basepath, indexpath, paths, args, recurse):
+    """ The paths of the shard databases of earlier runs, those listed in
+        the manifest or found below 'reffile.d', other than the given paths
+        written by this run, whose files are all found in the paths of args
+        (and so were sharded again by this run) or no longer exist. The
+        shards of the rest of the tree are left alone.
+    """
+    written = set([ os.path.normpath(path) for path in paths ])
+    dirname = os.path.dirname(indexpath)
+    found = [ os.path.normpath(os.path.join(dirname, shard)) for shard in readManifest(indexpath + manifest_ext) ]
+    try:
+        names = sorted(os.listdir(indexpath + shards_ext))
+    except OSError:
+        names = []
+    for name in names:
+        path = shardPath(indexpath, name)
+        if os.path.isdir(os.path.dirname(path)) and (path not in found):
+            found.append(path)
+
+    scope = [ pycscope.normalPath(os.path.relpath(os.path.join(basepath, arg), basepath)) for arg in args ]
+    stale = []
+    for path in found:
+        if path in written:
+            continue
+        try:
+            reader = pycscope.IndexReader(path)
+        except (IOError, OSError, ValueError):
+            # No usable database left
+            stale.append(path)
+            continue
+        try:
+            fnames = [ fname for fname, offset, length in reader.sections() ]
+        finally:
+            reader.close()
+        if all([ inScope(pycscope.normalPath(fname), scope, recurse)
+                 or not os.path.exists(os.path.join(basepath, fname)) for fname in fnames ]):
+            stale.append(path)
+    return stale
+
+
+def pruneShards(paths):
+    """ Delete the shard databases of the given paths, along with their
+        inverted index and sections file, and their directory once empty.
+    """
+    for path in paths:
+        for fname in (path, path + pycscope.sections_ext) + invertedNames(path):
+            if os.path.exists(fname):
+                os.unlink(fname)
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            # Holding files of someone else's
+            pass
+
+
+def readManifest(path):
+    """ The paths of the shard databases listed in a manifest, relative to
+        its directory, or an empty list if it does not exist.
+    """
+    try:
+        f = open(path, 'r')
+    except IOError:
+        return []
+    with f:
+        return [ line.rstrip('\n') for line in f if line.strip() ]
+
+
+def writeManifest(path, paths, stale=()):
+    """ Write the manifest listing the shard databases of the given paths,
+        one per line, relative to the directory of the manifest, along with
+        those it already lists other than the stale ones. It is written to
+        a temporary file renamed over it, so that it is never seen half
+        written.
+    """
+    dirname = os.path.dirname(path)
+    dropped = set([ os.path.relpath(shard, dirname) for shard in stale ])
+    listed = set([ shard for shard in readManifest(path) if shard not in dropped ])
+    listed.update([ os.path.relpath(shard, dirname) for shard in paths ])
+    tmppath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmppath, 'w') as f:
+            for shard in sorted(listed):
+                f.write("%s\n" % shard)
+        pycscope.replaceFile(tmppath, path)
+    except:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
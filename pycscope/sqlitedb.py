@@ -0,0 +1,112 @@
+"""
+PyCscope SQLite symbol database
+
+Writes the symbols of a cscope database to an SQLite database, one row
+per symbol of each line indexed, so that cross-references can be queried
+with SQL, e.g. all the call sites of f in the files of package p:
+
+    SELECT files.name, symbols.line, symbols.function
+    FROM symbols JOIN files ON files.id = symbols.file
+    WHERE symbols.mark = '`' AND symbols.symbol = 'f' AND files.name LIKE './p/%';
+
+The marks are those of the cscope database (see pycscope.Mark), the empty
+string being a plain reference; the function is the one holding the line
+(see pycscope.query), or NULL outside of any.
+
+The sqlite3 module is only imported when writing a database, as Python
+may be built without it.
+"""
+
+import itertools, os, sys
+
+import pycscope
+from pycscope.query import Database
+
+
+# Rows are inserted batch_rows at a time.
+batch_rows = 10000
+
+schema = (
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE files (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    "CREATE TABLE symbols (file INTEGER NOT NULL REFERENCES files (id), line INTEGER NOT NULL,"
+    " mark TEXT NOT NULL, symbol TEXT NOT NULL, function TEXT)",
+)
+
+indexes = (
+    "CREATE INDEX symbols_symbol ON symbols (symbol)",
+    "CREATE INDEX symbols_mark_symbol ON symbols (mark, symbol)",
+)
+
+
+def genRows(db):
+    """ A generator for the (file id, line number, mark, symbol, function)
+        rows of the symbols of a Database.
+    """
+    files = db.files
+    linenos = db.linenos
+    for name, marks in db.symbols.items():
+        for mark, refs in marks.items():
+            for line, func in refs:
+                yield (files[line], linenos[line], mark, toText(name), func and toText(func))
+
+
+def toText(val):
+    """ Strings are stored as text, decoded from UTF-8 on Python 2.
+    """
+    if sys.hexversion < 0x03000000:
+        return val.decode('utf-8', 'replace')
+    return val
+
+
+def writeSqlite(indexpath, dbpath):
+    """ Write the symbols of the cscope database at indexpath to a new
+        SQLite database at dbpath, replacing any existing one once it is
+        complete. The rows are inserted in batches, each in a transaction
+        of its own, the indexes being created once all are inserted.
+
+        An EnvironmentError is raised if the SQLite database cannot be
+        written (or the sqlite3 module is not available).
+    """
+    try:
+        import sqlite3
+    except ImportError:
+        raise EnvironmentError("%s: the sqlite3 module is not available" % dbpath)
+    db = Database(indexpath)
+    tmppath = "%s.%d.tmp" % (dbpath, os.getpid())
+    if os.path.exists(tmppath):
+        os.unlink(tmppath)
+    try:
+        conn = sqlite3.connect(tmppath)
+        try:
+            # The database only becomes visible once complete
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            for statement in schema:
+                conn.execute(statement)
+            with conn:
+                conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                                 [ ("basepath", toText(db.basepath)), ("version", pycscope.__version__) ])
+                conn.executemany("INSERT INTO files VALUES (?, ?)",
+                                 [ (i, toText(fname)) for i, fname in enumerate(db.fnames) ])
+            rows = genRows(db)
+            while True:
+                batch = list(itertools.islice(rows, batch_rows))
+                if not batch:
+                    break
+                with conn:
+                    conn.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?)", batch)
+            with conn:
+                for statement in indexes:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+        pycscope.replaceFile(tmppath, dbpath)
+    except sqlite3.Error as e:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise EnvironmentError("%s: %s" % (dbpath, e))
+    except:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
@@ -0,0 +1,291 @@
+"""
+PyCscope text index
+
+A trigram index of the source of the files indexed, so that text and
+egrep searches (cscope's queries 4 and 6) only read the files which may
+hold a match, rather than every file.
+
+The trigrams (sequences of 3 bytes of the UTF-8 encoded source) of each
+file are collected as the file is read to be parsed (see
+pycscope.parseFile()), and written to 'reffile.trigrams' along with the
+database: the file names, the sorted trigrams, and for each trigram the
+sorted list (posting list) of the files holding it, as an array of 16 or
+32 bit file numbers.
+
+A search finds the literal strings any match of the pattern must hold,
+and only reads the files holding all of their trigrams, the intersection
+of their posting lists.
+"""
+
+import array, bisect, mmap, os, struct, sys
+
+import pycscope
+
+
+# Extension of the text index, kept next to the database.
+trigrams_ext = ".trigrams"
+
+magic = b"pycstri1"
+
+# Magic, number of files, number of trigrams, size of the file numbers of
+# the posting lists (2 or 4), length of the file names
+header = struct.Struct('<8sIIII')
+
+typecodes = { 2: 'H', 4: 'I' }
+
+
+def fileTrigrams(contents):
+    """ The array of the distinct trigrams of the source of a file, each
+        as a 24 bit integer.
+    """
+    data = pycscope.toBytes(contents)
+    if sys.hexversion < 0x03000000:
+        data = bytearray(data)
+    return array.array('I', [ (a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:])) ])
+
+
+def nativeArray(typecode, size):
+    """ An array of items of the given typecode, holding at least size
+        bytes per item (the size of 'I' depends on the platform).
+    """
+    if array.array(typecode).itemsize >= size:
+        return typecode
+    return 'L'
+
+
+def writeTextIndex(basepath, path, fnames, trigrams):
+    """ Write the text index of the files given, in the order given, from
+        the dictionary of their trigrams (see fileTrigrams()) collected as
+        they were parsed. Files whose trigrams were not collected (those
+        whose index was reused rather than parsed again) are read again.
+    """
+    itemsize = len(fnames) < 0x10000 and 2 or 4
+    typecode = nativeArray(typecodes[itemsize], itemsize)
+    postings = {}
+    for fid, fname in enumerate(fnames):
+        found = trigrams.get(fname)
+        if found is None:
+            try:
+                found = fileTrigrams(pycscope.readFile(os.path.join(basepath, fname)))
+            except (IOError, UnicodeDecodeError):
+                continue
+        for trigram in found:
+            if trigram in postings:
+                postings[trigram].append(fid)
+            else:
+                postings[trigram] = array.array(typecode, [fid])
+
+    keys = array.array(nativeArray('I', 4), sorted(postings))
+    offsets = array.array(keys.typecode, [0])
+    lists = array.array(typecode)
+    for trigram in keys:
+        lists.extend(postings[trigram])
+        offsets.append(len(lists))
+    names = pycscope.toBytes('\n'.join(fnames))
+
+    tmppath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmppath, 'wb') as f:
+            f.write(header.pack(magic, len(fnames), len(keys), itemsize, len(names)))
+            f.write(names)
+            for arr, size in ((keys, 4), (offsets, 4), (lists, itemsize)):
+                f.write(packArray(arr, size))
+        pycscope.replaceFile(tmppath, path)
+    except:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+
+
+def packArray(arr, size):
+    """ The little endian bytes of an array, size bytes per item.
+    """
+    if arr.itemsize != size:
+        arr = array.array(typecodes[size], arr)
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    if sys.hexversion < 0x03000000:
+        return arr.tostring()
+    return arr.tobytes()
+
+
+class TextIndex(object):
+    """ Read access to a text index, memory mapped; an EnvironmentError is
+        raised if it cannot be read, and a ValueError if it is not a text
+        index.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                raise ValueError("%s: not a text index" % path)
+        try:
+            try:
+                sig, nfiles, self.ntrigrams, self.itemsize, namelen = header.unpack_from(self.data, 0)
+            except struct.error:
+                sig = None
+            if (sig != magic) or (self.itemsize not in typecodes):
+                raise ValueError("%s: not a text index" % path)
+            names = self.data[header.size:header.size + namelen]
+            if sys.hexversion >= 0x03000000:
+                names = names.decode('utf-8')
+            self.fnames = names and names.split('\n') or []
+            self.keys_start = header.size + namelen
+            self.offsets_start = self.keys_start + 4 * self.ntrigrams
+            self.lists_start = self.offsets_start + 4 * (self.ntrigrams + 1)
+            if (len(self.fnames) != nfiles) or (len(self.data) < self.lists_start):
+                raise ValueError("%s: bad text index" % path)
+        except:
+            self.data.close()
+            raise
+
+    def key(self, i):
+        return struct.unpack_from('<I', self.data, self.keys_start + 4 * i)[0]
+
+    def postings(self, trigram):
+        """ The sorted list of the numbers of the files holding a trigram.
+        """
+        lo = 0
+        hi = self.ntrigrams
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < trigram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if (lo == self.ntrigrams) or (self.key(lo) != trigram):
+            return []
+        start, end = struct.unpack_from('<II', self.data, self.offsets_start + 4 * lo)
+        size = self.itemsize
+        return list(struct.unpack_from('<%d%s' % (end - start, typecodes[size]), self.data,
+                                       self.lists_start + size * start))
+
+    def candidates(self, literals):
+        """ The names of the files holding all the trigrams of the literal
+            strings given; all the files if there are none.
+        """
+        found = None
+        trigrams = set()
+        for literal in literals:
+            trigrams.update(fileTrigrams(literal))
+        for trigram in trigrams:
+            fids = self.postings(trigram)
+            if found is None:
+                found = fids
+            else:
+                found = intersect(found, fids)
+            if not found:
+                return []
+        if found is None:
+            return list(self.fnames)
+        return [ self.fnames[fid] for fid in found ]
+
+    def close(self):
+        self.data.close()
+
+
+def intersect(a, b):
+    """ The intersection of two sorted lists, the shorter one being looked
+        up in the longer one.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    found = []
+    for item in a:
+        i = bisect.bisect_left(b, item)
+        if (i < len(b)) and (b[i] == item):
+            found.append(item)
+    return found
+
+
+# The inline flags of regular expressions, e.g. '(?i)'.
+flags = "aiLmsux"
+
+def literalRuns(pattern):
+    """ The literal strings any match of the regular expression must hold
+        (those of the regular expression as a whole, not those of its
+        groups), or an empty list if it has alternatives.
+    """
+    runs = []
+    run = ''
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '\\':
+            c = pattern[i:i + 1]
+            i += 1
+            if c and not c.isalnum():
+                run += c
+                continue
+            # A class (\d, \w ...), an assertion or a reference
+            runs.append(run)
+            run = ''
+        elif c in '*?':
+            # The character repeated may be missing
+            runs.append(run[:-1])
+            run = ''
+        elif c == '{':
+            runs.append(run[:-1])
+            run = ''
+            i = pattern.find('}', i) + 1 or n
+        elif c == '[':
+            # Skip the set, a leading ']' being part of it
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while (i < n) and (pattern[i] != ']'):
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+            runs.append(run)
+            run = ''
+        elif c == '(':
+            if (pattern[i:i + 1] == '?') and (pattern[i + 1:i + 2] in flags):
+                # Flags (e.g. ignoring case) apply to the whole pattern
+                return []
+            # Skip the group, which may be optional, or have alternatives
+            depth = 1
+            while (i < n) and depth:
+                if pattern[i] == '\\':
+                    i += 1
+                elif pattern[i] == '(':
+                    depth += 1
+                elif pattern[i] == ')':
+                    depth -= 1
+                i += 1
+            if pattern[i:i + 1] in ('*', '?', '{'):
+                i += 1
+            runs.append(run)
+            run = ''
+        elif c == '|':
+            return []
+        elif c in '.^$+)':
+            runs.append(run)
+            run = ''
+        else:
+            run += c
+    runs.append(run)
+    return [ run for run in runs if len(pycscope.toBytes(run)) >= 3 ]
+
+
+def grep(basepath, fnames, regex):
+    """ Search the files given for the lines matching the compiled regular
+        expression, returning a list of (file name, line number, line)
+        tuples. Each line is searched alone, as anchors and lookarounds
+        match differently in the file as a whole.
+    """
+    found = []
+    for fname in fnames:
+        try:
+            contents = pycscope.readFile(os.path.join(basepath, fname))
+        except (IOError, UnicodeDecodeError):
+            continue
+        for lineno, line in enumerate(contents.split('\n')):
+            if regex.search(line):
+                found.append((fname, lineno + 1, line))
+    return found
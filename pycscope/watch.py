@@ -0,0 +1,373 @@
+"""
+PyCscope watch mode
+
+Keeps the index of a tree of Python source in memory, rewriting the
+database each time files change, so that it is always up to date without
+paying for a full rebuild.
+
+Changes are found with inotify on Linux, and by polling the modification
+time and size of every file elsewhere. The database itself, along with the
+sections file of incremental mode, serves as the snapshot of the index
+held in memory: a restart reuses the sections of the files which have not
+changed since it was written, rather than parsing the tree again.
+"""
+
+import ctypes, ctypes.util, errno, os, select, struct, sys, time
+
+import pycscope
+
+
+# Once a change is seen, the index is only rewritten after no further
+# change is seen for settle_time seconds, so that bursts of changes (a git
+# checkout, a save of several files) are handled together.
+settle_time = 0.5
+
+# Seconds between scans of the tree when polling for changes.
+poll_interval = 1.0
+
+
+class SectionStore(object):
+    """ The sections of the index of each file, held in a single byte
+        buffer, with the offset and length of the section of each file,
+        and its key (see pycscope.fileKey()).
+
+        The section of a file which changes is appended to the buffer, the
+        space of its previous section being reclaimed by compacting the
+        buffer once it is more than half garbage.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.sections = {}
+        self.garbage = 0
+
+    def __contains__(self, fname):
+        return fname in self.sections
+
+    def __len__(self):
+        return len(self.sections)
+
+    def put(self, fname, key, section):
+        """ Store the section (a string, bytes, or a list of strings) of
+            the index of a file, replacing any previous one.
+        """
+        if isinstance(section, list):
+            section = ''.join(section)
+        section = pycscope.toBytes(section)
+        self.remove(fname)
+        self.sections[fname] = (key, len(self.data), len(section))
+        self.data.extend(section)
+
+    def remove(self, fname):
+        """ Forget the section of a file, if there is one.
+        """
+        if fname in self.sections:
+            self.garbage += self.sections.pop(fname)[2]
+            if self.garbage > len(self.data) // 2:
+                self.compact()
+
+    def key(self, fname):
+        """ The key of the file when its section was stored, or None.
+        """
+        if fname in self.sections:
+            return self.sections[fname][0]
+        return None
+
+    def get(self, fname):
+        """ The section of a file, as bytes.
+        """
+        key, offset, length = self.sections[fname]
+        return bytes(self.data[offset:offset + length])
+
+    def compact(self):
+        """ Copy the live sections to a new buffer, dropping the garbage.
+        """
+        data = bytearray()
+        for fname, (key, offset, length) in sorted(self.sections.items(), key=lambda item: item[1][1]):
+            self.sections[fname] = (key, len(data), length)
+            data.extend(self.data[offset:offset + length])
+        self.data = data
+        self.garbage = 0
+
+
+class IndexWatcher(object):
+    """ Maintains the index of the files given (as for pycscope.genFiles()),
+        rewriting the database when they change.
+    """
+    def __init__(self, basepath, args, recurse, exclude, indexpath, inverted=False, debug=False, jobs=1,
+                 cache=None, poll=None, threads=1):
+        self.basepath = basepath
+        self.args = args
+        self.recurse = recurse
+        self.exclude = exclude
+        self.indexpath = indexpath
+        self.inverted = inverted
+        self.debug = debug
+        self.jobs = jobs
+        self.cache = cache
+        self.threads = threads
+        self.store = SectionStore()
+        self.fnames = []
+        self.monitor = None
+        if poll is None:
+            try:
+                self.monitor = InotifyMonitor(basepath)
+            except EnvironmentError:
+                poll = poll_interval
+        if self.monitor is None:
+            self.monitor = PollMonitor(self.scan, poll)
+
+    def fullpath(self, fname):
+        return os.path.normpath(os.path.join(self.basepath, fname))
+
+    def listFiles(self):
+        """ The names of the files to index, also watching the directories
+            holding them for changes.
+        """
+        dirs = []
+        fnames = list(pycscope.genFiles(self.basepath, self.args, self.recurse, self.exclude, dirs, self.threads))
+        self.monitor.watch(dirs)
+        return fnames
+
+    def scan(self):
+        """ The key of each file to index, by full path.
+        """
+        return dict([ (self.fullpath(fname), pycscope.fileKey(self.fullpath(fname)))
+                      for fname in pycscope.genFiles(self.basepath, self.args, self.recurse, self.exclude,
+                                                     threads=self.threads) ])
+
+    def load(self):
+        """ Index all the files, reusing the sections of the existing
+            database for the files which have not changed since it was
+            written, and write the database.
+        """
+        self.fnames = self.listFiles()
+        try:
+            reader = pycscope.IndexReader(self.indexpath)
+        except (IOError, OSError, ValueError):
+            reader = None
+        stamps = []
+        try:
+            sections = list(pycscope.genIncremental(self.basepath, self.fnames, self.debug, self.jobs, reader,
+                                                    stamps, self.cache))
+            for (fname, section), (sfname, key) in zip(sections, stamps):
+                self.store.put(fname, key, section)
+        finally:
+            if reader is not None:
+                reader.close()
+        self.write()
+
+    def update(self, changed=None):
+        """ Index the files added, and those changed (given as a set of
+            full paths, None meaning any file may have changed), forget the
+            files removed, and rewrite the database if anything changed.
+            Returns the number of files indexed again or removed.
+        """
+        self.fnames = self.listFiles()
+        current = set()
+        parse = []
+        keys = {}
+        for fname in self.fnames:
+            if (fname in self.store) and (changed is not None) and (self.fullpath(fname) not in changed):
+                current.add(fname)
+                continue
+            key = pycscope.fileKey(self.fullpath(fname))
+            if key is None:
+                # The file went away since the directory was listed
+                continue
+            current.add(fname)
+            if key != self.store.key(fname):
+                parse.append(fname)
+                keys[fname] = key
+
+        removed = [ fname for fname in self.store.sections if fname not in current ]
+        for fname in removed:
+            self.store.remove(fname)
+
+        parsed = set()
+        for fname, section in pycscope.genIndex(self.basepath, parse, self.debug, self.jobs, self.cache):
+            self.store.put(fname, keys[fname], section)
+            parsed.add(fname)
+        for fname in parse:
+            if fname not in parsed:
+                # The file could not be read, and was reported as such
+                self.store.remove(fname)
+
+        if parse or removed:
+            self.write()
+        return len(parse) + len(removed)
+
+    def write(self):
+        """ Write the database, and the sections file which allows it to be
+            reused when restarting.
+        """
+        fnames = [ fname for fname in self.fnames if fname in self.store ]
+        written = pycscope.writeDatabase(self.basepath, self.indexpath,
+                                         ((fname, self.store.get(fname)) for fname in fnames), self.inverted)
+        pycscope.writeSections(self.indexpath, written,
+                               dict([ (fname, self.store.key(fname)) for fname in fnames ]))
+
+    def wait(self, timeout=None):
+        """ Wait for changes, and until they have settled, returning the set
+            of full paths changed (None if unknown), or an empty set if
+            there were none before the timeout.
+        """
+        changed = self.monitor.wait(timeout)
+        while changed:
+            more = self.monitor.wait(settle_time)
+            if not more:
+                break
+            if (more is None) or (changed is None):
+                changed = None
+            else:
+                changed |= more
+        return changed
+
+    def run(self):
+        """ Keep the database up to date, until interrupted.
+        """
+        self.load()
+        try:
+            while True:
+                changed = self.wait()
+                if changed != set():
+                    self.update(changed)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.monitor.close()
+        if self.cache is not None:
+            self.cache.prune()
+
+
+class PollMonitor(object):
+    """ Finds changes by scanning the tree every interval seconds,
+        comparing the keys of the files (see pycscope.fileKey()).
+    """
+    def __init__(self, scan, interval):
+        self.scan = scan
+        self.interval = interval
+        self.keys = None
+
+    def watch(self, dirs):
+        if self.keys is None:
+            self.keys = self.scan()
+
+    def wait(self, timeout=None):
+        """ Return the set of full paths changed since the last scan, or an
+            empty set if none changed before the timeout.
+        """
+        start = time.time()
+        while True:
+            if timeout is None:
+                time.sleep(self.interval)
+            else:
+                time.sleep(max(min(self.interval, start + timeout - time.time()), 0))
+            keys = self.scan()
+            changed = set([ path for path in set(keys) | set(self.keys) if keys.get(path) != self.keys.get(path) ])
+            self.keys = keys
+            if changed or ((timeout is not None) and (time.time() >= start + timeout)):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor(object):
+    """ Finds changes with the inotify API of Linux, through ctypes; an
+        EnvironmentError is raised where it is not available.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF \
+        | IN_MOVE_SELF
+
+    event_header = struct.Struct('iIII')
+
+    def __init__(self, basepath):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self.add_watch = libc.inotify_add_watch
+            self.rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init()
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.basepath = basepath
+        self.dirs = {}
+
+    def watch(self, dirs):
+        """ Watch the given directories (relative to basepath), in addition
+            to those already watched.
+        """
+        for dirname in dirs:
+            path = os.path.normpath(os.path.join(self.basepath, dirname))
+            if path in self.dirs.values():
+                continue
+            name = path
+            if not isinstance(name, bytes):
+                name = name.encode(sys.getfilesystemencoding())
+            wd = self.add_watch(self.fd, name, self.mask)
+            if wd >= 0:
+                self.dirs[wd] = path
+
+    def wait(self, timeout=None):
+        """ Return the set of full paths changed, None if they are not
+            known (events were lost), or an empty set if none changed
+            before the timeout.
+        """
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not ready:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(data, offset)
+            offset += self.event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            if mask & self.IN_IGNORED:
+                # The directory was removed, or moved away
+                self.dirs.pop(wd, None)
+                continue
+            if wd not in self.dirs:
+                continue
+            if sys.hexversion >= 0x03000000:
+                name = name.decode(sys.getfilesystemencoding())
+            if name and not (mask & self.IN_ISDIR) and not pycscope.isPython(name):
+                # Other files of the directory, like the index itself
+                continue
+            changed.add(os.path.join(self.dirs[wd], name) if name else self.dirs[wd])
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Unit tests for the fragment cache.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+from pycscope.cache import FragmentCache
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmpd = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpd, 'cache')
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmpd)
+
+    def testputget(self,):
+        for compress in (False, True):
+            cache = FragmentCache(self.cachedir, 'salt', compress=compress)
+            key = cache.key("a = 1\n")
+            self.assertEqual(cache.get(key), None)
+            cache.put(key, "1 \n\t=a\n = 1\n\n")
+            self.assertEqual(cache.get(key), "1 \n\t=a\n = 1\n\n")
+            shutil.rmtree(self.cachedir)
+
+    def testsalt(self,):
+        cache = FragmentCache(self.cachedir, 'salt')
+        other = FragmentCache(self.cachedir, 'other salt')
+        self.assertNotEqual(cache.key("a = 1\n"), other.key("a = 1\n"))
+
+    def testprune(self,):
+        cache = FragmentCache(self.cachedir, 'salt', maxsize=250)
+        keys = []
+        for i in range(4):
+            key = cache.key("a = %d\n" % i)
+            cache.put(key, "x" * 99)
+            os.utime(cache.path(key), (1000000000 + i, 1000000000 + i))
+            keys.append(key)
+        # Using the oldest entry makes it the most recently used
+        self.assertEqual(cache.get(keys[0]), "x" * 99)
+        cache.prune()
+        self.assertEqual([ cache.get(key) is not None for key in keys ], [True, False, False, True])
+
+    def testparsefile(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write("a = 1\n")
+        cache = FragmentCache(self.cachedir, pycscope.cacheSalt())
+        buf = []
+        l = pycscope.parseFile(self.tmpd, 'a.py', buf, 0, [], cache=cache)
+        self.assertEqual(l, len(buf))
+        self.assertEqual(''.join(buf), "\n\t@a.py\n\n1 \n\t=a\n = 1\n\n")
+
+        # A hit never looks at the source, so replace the cached fragment
+        # to verify it is the one used.
+        cache.put(cache.key("a = 1\n"), "1 \n\t=b\n = 1\n\n")
+        buf = []
+        l = pycscope.parseFile(self.tmpd, 'a.py', buf, 0, [], cache=cache)
+        self.assertEqual(l, len(buf))
+        self.assertEqual(''.join(buf), "\n\t@a.py\n\n1 \n\t=b\n = 1\n\n")
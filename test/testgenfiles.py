@@ -4,10 +4,12 @@
 
 import unittest
 import os
+import re
 from cStringIO import StringIO
 import tempfile
 import shutil
 import pycscope
+from pycscope.excludes import Excludes, translate
 
 
 class TestGenFiles(unittest.TestCase):
@@ -65,3 +67,99 @@ class TestGenFiles(unittest.TestCase):
             self.assertEquals(fs, ['a.py', 's/c.py'])
         finally:
             shutil.rmtree(tmpd)
+
+
+class TestExcludes(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmpd = tempfile.mkdtemp()
+        for relpath in ('a.py', 'a_pb2.py', 's/c.py', 's/t/e.py', 's/build/g.py', 'build/h.py', 'empty/',
+                        '.git/hooks.py', 's/__pycache__/c.py', '.tox/py27/x.py', 'env/pyvenv.cfg', 'env/lib/y.py'):
+            path = os.path.join(self.tmpd, relpath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            if not relpath.endswith('/'):
+                with open(path, "w") as f:
+                    f.write("x = 1\n")
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmpd)
+
+    def genFiles(self, args, exclude, dirs=None):
+        return list(pycscope.genFiles(self.tmpd, args, True, exclude, dirs))
+
+    def testdefaults(self,):
+        self.assertEquals(self.genFiles(['.'], []),
+                          ['./a.py', './a_pb2.py', './build/h.py', './s/build/g.py', './s/c.py', './s/t/e.py'])
+        self.assertEquals(self.genFiles(['.'], Excludes(defaults=False)),
+                          ['./.git/hooks.py', './.tox/py27/x.py', './a.py', './a_pb2.py', './build/h.py',
+                           './env/lib/y.py', './s/__pycache__/c.py', './s/build/g.py', './s/c.py', './s/t/e.py'])
+        # Directories given explicitly are never skipped
+        self.assertEquals(self.genFiles(['env'], []), ['env/lib/y.py'])
+
+    def testpatterns(self,):
+        # Paths are relative to the current directory, however the
+        # directories are given, while patterns without a slash match at
+        # any depth.
+        self.assertEquals(self.genFiles(['.'], ['s/t', 'build', '*_pb2.py']), ['./a.py', './s/build/g.py', './s/c.py'])
+        self.assertEquals(self.genFiles(['.'], ['buil?/', 'a.py/']), ['./a.py', './a_pb2.py', './s/c.py', './s/t/e.py'])
+        self.assertEquals(self.genFiles(['.'], ['bui*', 's/**/e.py']), ['./a.py', './a_pb2.py', './s/c.py'])
+        self.assertEquals(self.genFiles(['a.py', 's'], ['a.py', 's/*.py']), ['s/build/g.py', 's/t/e.py'])
+
+    def testgitignore(self,):
+        with open(os.path.join(self.tmpd, '.gitignore'), 'w') as f:
+            f.write("# Generated\n*_pb2.py\n/build/\n\n")
+        with open(os.path.join(self.tmpd, 's', '.gitignore'), 'w') as f:
+            f.write("*.py\n!c.py\n")
+        self.assertEquals(self.genFiles(['.'], Excludes(gitignore=True)), ['./a.py', './s/c.py'])
+        self.assertEquals(len(self.genFiles(['.'], Excludes())), 6)
+
+    def testdirs(self,):
+        dirs = []
+        self.genFiles(['.', 's/c.py'], ['s'], dirs)
+        self.assertEquals(dirs, ['.', './build', './empty', 's'])
+
+    def testthreads(self,):
+        with open(os.path.join(self.tmpd, 's', '.gitignore'), 'w') as f:
+            f.write("e.py\n")
+        for exclude in ([], ['build'], Excludes(defaults=False, gitignore=True)):
+            dirs = []
+            tdirs = []
+            fs = self.genFiles(['.', 's'], exclude, dirs)
+            tfs = list(pycscope.genFiles(self.tmpd, ['.', 's'], True, exclude, tdirs, threads=4))
+            self.assertEquals(fs, tfs)
+            self.assertEquals(dirs, tdirs)
+
+    def testtranslate(self,):
+        for pattern, path, match in (('*.py', 'a.py', True), ('*.py', 's/a.py', False), ('**/a.py', 's/t/a.py', True),
+                                     ('**/a.py', 'a.py', True), ('s/**', 's/t/a.py', True), ('[!a]*', 'a.py', False),
+                                     ('[ab].py', 'b.py', True), ('a?py', 'a.py', True), ('a.py', 'aapy', False)):
+            self.assertEquals(re.match(translate(pattern), path) is not None, match, (pattern, path))
+
+
+class TestPartition(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmpd = tempfile.mkdtemp()
+        for relpath in ('a.py', 'b.py', 's/c.py', 's/d.py', 's/t/e.py', 'u/f.py', 's/big.py'):
+            path = os.path.join(self.tmpd, relpath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write("x = 1\n" * (relpath == 's/big.py' and 10 or 1))
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmpd)
+
+    def testpartition(self,):
+        fs = list(pycscope.genFiles(self.tmpd, ['.'], True, []))
+        parts = [ pycscope.partitionFiles(self.tmpd, fs, num, 3) for num in (1, 2, 3) ]
+        # Every file falls in one part, in the order given
+        self.assertEquals(sorted(sum(parts, [])), sorted(fs))
+        for part in parts:
+            self.assertEquals(part, [ fname for fname in fs if fname in part ])
+        # The big file (60 bytes) is alone, and the 6 small ones (6 bytes
+        # each) are split between the other parts
+        self.assertEquals(parts[0], ['./s/big.py'])
+        self.assertEquals([ len(part) for part in parts ], [1, 3, 3])
+        self.assertEquals(pycscope.partitionFiles(self.tmpd, fs, 1, 1), fs)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""Unit tests for finding files from the git index.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import subprocess
+import pycscope
+from pycscope.gitindex import GitIndex, findRepository, readVarint, changedFiles
+
+
+def git(*args):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(('git',) + args, stdout=devnull, stderr=devnull)
+
+
+class TestGitIndex(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = os.path.realpath(tempfile.mkdtemp())
+        os.chdir(self.tmpd)
+        try:
+            git('init', '-q', '.')
+        except (OSError, subprocess.CalledProcessError):
+            os.chdir(self.orig_wd)
+            shutil.rmtree(self.tmpd)
+            raise unittest.SkipTest("git is not available")
+        for relpath in ('a.py', 'b.txt', 's/c.py', 's/t/e.py', 's/build/g.py', 'u.py', 'sa.py'):
+            path = os.path.join(self.tmpd, relpath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write("x = 1\n")
+        # Stat data older than the index, which is then reliable
+        for dirpath, dirnames, filenames in os.walk(self.tmpd):
+            for filename in filenames:
+                os.utime(os.path.join(dirpath, filename), (1000000000, 1000000000))
+        git('add', 'a.py', 'b.txt', 's', 'sa.py')
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def testgenfiles(self,):
+        for version in ('2', '3', '4'):
+            git('update-index', '--index-version', version)
+            index = GitIndex(self.tmpd)
+            # The untracked u.py is not found
+            self.assertEqual(list(index.genFiles(['.'], True, [])),
+                             ['./a.py', './s/build/g.py', './s/c.py', './s/t/e.py', './sa.py'])
+            self.assertEqual(list(index.genFiles(['sa.py', 's', 'u.py'], False, [])), ['s/c.py', 'sa.py'])
+            self.assertEqual(list(index.genFiles(['.'], True, ['bu*', 's/t'])), ['./a.py', './s/c.py', './sa.py'])
+            self.assertEqual(list(index.genFiles(['.'], True, [])),
+                             [ fname for fname in pycscope.genFiles(self.tmpd, ['.'], True, []) if fname != './u.py' ])
+
+    def testsubdir(self,):
+        index = GitIndex(os.path.join(self.tmpd, 's'))
+        self.assertEqual(index.root, self.tmpd)
+        self.assertEqual(list(index.genFiles(['.'], True, [])), ['./build/g.py', './c.py', './t/e.py'])
+
+    def testkey(self,):
+        index = GitIndex(self.tmpd)
+        sha = index.entries['a.py'][0]
+        self.assertEqual(len(sha), 40)
+        self.assertEqual(index.key('a.py'), 'git:%s' % sha)
+        self.assertEqual(index.key('./a.py'), 'git:%s' % sha)
+        # Changed since it was added
+        with open('a.py', 'w') as f:
+            f.write("y = 1\n")
+        self.assertEqual(index.key('a.py'), pycscope.fileKey(os.path.join(self.tmpd, 'a.py')))
+        self.assertEqual(index.key('u.py'), pycscope.fileKey(os.path.join(self.tmpd, 'u.py')))
+        self.assertEqual(index.key('gone.py'), None)
+
+    def testnorepository(self,):
+        shutil.rmtree(os.path.join(self.tmpd, '.git'))
+        self.assertRaises(EnvironmentError, findRepository, self.tmpd)
+
+    def testvarint(self,):
+        for data, val in ((b'\x00', 0), (b'\x7f', 127), (b'\x80\x00', 128), (b'\x81\x7f', 383)):
+            self.assertEqual(readVarint(data + b'x', 0), (val, len(data)))
+
+    def testmain(self,):
+        ret = pycscope.main(['arg0', '-R', '--git', '--incremental', '.'])
+        self.assertEqual(ret, 0)
+        with open('cscope.out', 'r') as f:
+            fnames = f.read().split('\n')[-6:-1]
+        self.assertEqual(fnames, ['./a.py', './s/build/g.py', './s/c.py', './s/t/e.py', './sa.py'])
+        with open('cscope.out.sections', 'r') as f:
+            self.assertTrue(f.readlines()[1].startswith('git:'))
+        shutil.rmtree(os.path.join(self.tmpd, '.git'))
+        self.assertEqual(pycscope.main(['arg0', '--git', '.']), 2)
+
+
+class TestSince(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = os.path.realpath(tempfile.mkdtemp())
+        os.chdir(self.tmpd)
+        try:
+            git('init', '-q', '.')
+        except (OSError, subprocess.CalledProcessError):
+            os.chdir(self.orig_wd)
+            shutil.rmtree(self.tmpd)
+            raise unittest.SkipTest("git is not available")
+        git('config', 'user.name', 'Test')
+        git('config', 'user.email', 'test@example.com')
+        for relpath in ('a.py', 'b.txt', 's/c.py', 's/t/e.py', 'sa.py', 'z.py'):
+            self.write(relpath, "%s = 1\n" % relpath.replace('/', '_').replace('.', '_'))
+        git('add', '.')
+        git('commit', '-q', '-m', 'Initial')
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def write(self, relpath, contents):
+        path = os.path.join(self.tmpd, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(contents)
+
+    def change(self,):
+        self.write('a.py', "def a(): pass\n")
+        self.write('s/b.py', "b = 2\n")
+        self.write('untracked.py', "u = 1\n")
+        git('add', 's/b.py')
+        git('rm', '-q', 's/c.py')
+        git('mv', 'sa.py', 's/t/sb.py')
+        self.write('b.txt', "b\n")
+
+    def testchangedfiles(self,):
+        self.change()
+        self.assertEqual(sorted(changedFiles(self.tmpd, 'HEAD')),
+                         [('A', 's/b.py'), ('A', 's/t/sb.py'), ('D', 's/c.py'), ('D', 'sa.py'), ('M', 'a.py'),
+                          ('M', 'b.txt')])
+        self.assertEqual(changedFiles(os.path.join(self.tmpd, 's'), 'HEAD'),
+                         [('A', 'b.py'), ('D', 'c.py'), ('A', 't/sb.py')])
+        self.assertRaises(EnvironmentError, changedFiles, self.tmpd, 'nosuchrev')
+
+    def testsince(self,):
+        for args in (['.'], ['a.py', 's', 'sa.py']):
+            ret = pycscope.main(['arg0', '-R'] + args)
+            self.assertEqual(ret, 0)
+            self.change()
+            ret = pycscope.main(['arg0', '-R', '-f', 'since.out', '--since', 'HEAD'] + args)
+            self.assertEqual(ret, 2)
+            shutil.copy('cscope.out', 'since.out')
+            ret = pycscope.main(['arg0', '-R', '-f', 'since.out', '--since', 'HEAD'] + args)
+            self.assertEqual(ret, 0)
+            os.unlink('untracked.py')
+            ret = pycscope.main(['arg0', '-R'] + args)
+            self.assertEqual(ret, 0)
+            with open('since.out', 'r') as f:
+                since = f.read()
+            with open('cscope.out', 'r') as f:
+                full = f.read()
+            self.assertEqual(since, full)
+            git('reset', '-q', '--hard')
+            os.unlink('since.out')
+
+    def testsincebadrev(self,):
+        pycscope.main(['arg0', '-R', '.'])
+        self.assertEqual(pycscope.main(['arg0', '-R', '--since', 'nosuchrev', '.']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
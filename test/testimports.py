@@ -175,3 +175,21 @@ class TestImports(unittest.TestCase):
                          " import \n"
                          "xyz\n"
                          "\n" % ellipsis_str)
+
+
+class TestImportsAst(TestImports):
+
+    def setUp(self,):
+        TestImports.setUp(self)
+        self.engine = pycscope.engine
+        pycscope.engine = "ast"
+
+    def tearDown(self,):
+        pycscope.engine = self.engine
+
+
+class TestImportsLite(TestImportsAst):
+
+    def setUp(self,):
+        TestImportsAst.setUp(self)
+        pycscope.engine = "lite"
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Unit tests for the inverted index.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+from pycscope import invlib
+
+
+class TestInvlib(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = tempfile.mkdtemp()
+        os.chdir(self.tmpd)
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def build(self, indexfn):
+        basepath = os.getcwd()
+        sections = pycscope.genIndex(basepath, pycscope.genFiles(basepath, ['.'], False, []), False)
+        pycscope.writeDatabase(basepath, os.path.join(basepath, indexfn), sections, inverted=True)
+
+    def testnames(self,):
+        self.assertEqual(invlib.invertedNames('cscope.out'), ('cscope.in.out', 'cscope.po.out'))
+        self.assertEqual(invlib.invertedNames('/a/pycscope.out'), ('/a/pycscope.ou.in', '/a/pycscope.ou.po'))
+
+    def testposting(self,):
+        p = invlib.packPosting(123456, 789, 4321, ord('`'))
+        self.assertEqual(len(p), invlib.POSTING_SIZE)
+        self.assertEqual(invlib.unpackPosting(p), (123456, 789, 4321, ord('`')))
+
+    def testfindterm(self,):
+        with open('a.py', 'w') as a:
+            a.write('def f():\n    return g(1)\n')
+        with open('b.py', 'w') as b:
+            # Enough terms to need several blocks
+            for i in range(3000):
+                b.write('name%04d = f()\n' % i)
+        self.build('cscope.out')
+        with open('cscope.out', 'rb') as c:
+            data = c.read()
+        self.assertEqual(data[:data.index(b'\n')].split()[3:6], [b'-c', b'-q', b'0000003002'])
+        with open('cscope.in.out', 'rb') as i:
+            i.seek(invlib.BUFSIZ)
+            self.assertTrue(i.read(1) != b'')
+
+        def find(term):
+            # Return the line and function name of each posting, and its file
+            # index and type
+            res = []
+            for lineoffset, fcnoffset, fileindex, type in invlib.findTerm('cscope.in.out', 'cscope.po.out', term):
+                fcn = data[fcnoffset:data.index(b'\n', fcnoffset)] if fcnoffset else None
+                res.append((data[lineoffset:data.index(b'\n', lineoffset)], fcn, fileindex, type))
+            return res
+
+        self.assertEqual(find(b'f')[:3], [(b'1 def ', None, 0, ord('$')), (b'1 ', None, 1, ord('`')), (b'2 ', None, 1, ord('`'))])
+        self.assertEqual(len(find(b'f')), 3001)
+        self.assertEqual(find(b'g'), [(b'2 return ', b'f', 0, ord('`'))])
+        self.assertEqual(find(b'name0000'), [(b'1 ', None, 1, ord('='))])
+        self.assertEqual(find(b'name2999'), [(b'3000 ', None, 1, ord('='))])
+        self.assertEqual(find(b'name'), [])
+        self.assertEqual(find(b'zzz'), [])
+
+    def testspill(self,):
+        with open('a.py', 'w') as a:
+            for i in range(100):
+                a.write('a%d = b%d\n' % (i % 10, i))
+        self.build('memory.out')
+        spill_bytes = invlib.spill_bytes
+        invlib.spill_bytes = 100
+        try:
+            self.build('spilled.out')
+        finally:
+            invlib.spill_bytes = spill_bytes
+        for ext in ('.in', '.po'):
+            with open('memory.out' + ext, 'rb') as m:
+                with open('spilled.out' + ext, 'rb') as s:
+                    self.assertEqual(m.read(), s.read())
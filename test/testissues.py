@@ -5,6 +5,11 @@
 import unittest
 import os
 import pycscope
+try:
+    import parser
+except ImportError:
+    # Removed in Python 3.10
+    parser = None
 
 
 class TestIssues(unittest.TestCase):
@@ -101,6 +106,7 @@ class MyClass(object):
                                  "\n")
 
 
+    @unittest.skipIf(parser is None, "the parser module is not available")
     def testIssue0009(self):
         """ Verify dumpCst works on tuples.
         """
@@ -109,7 +115,7 @@ class MyClass(object):
         except ImportError:
             from io import StringIO
         out = StringIO()
-        import parser, sys
+        import sys
         cst = parser.suite("import sys\na = b\n")
         pycscope.dumpCst(cst.totuple(True), out)
         output = out.getvalue()
@@ -119,3 +125,25 @@ class MyClass(object):
             expected = "['file_input',\n ['stmt',\n  ['simple_stmt',\n   ['small_stmt',\n    ['import_stmt',\n     ['import_name',\n      ['NAME', 'import', 1],\n      ['dotted_as_names',\n       ['dotted_as_name', ['dotted_name', ['NAME', 'sys', 1]]]]]]],\n   ['NEWLINE', '', 1]]],\n ['stmt',\n  ['simple_stmt',\n   ['small_stmt',\n    ['expr_stmt',\n     ['testlist_star_expr',\n      ['test',\n       ['or_test',\n        ['and_test',\n         ['not_test',\n          ['comparison',\n           ['expr',\n            ['xor_expr',\n             ['and_expr',\n              ['shift_expr',\n               ['arith_expr',\n                ['term',\n                 ['factor',\n                  ['power', ['atom', ['NAME', 'a', 2]]]]]]]]]]]]]]]],\n     ['EQUAL', '=', 2],\n     ['testlist_star_expr',\n      ['test',\n       ['or_test',\n        ['and_test',\n         ['not_test',\n          ['comparison',\n           ['expr',\n            ['xor_expr',\n             ['and_expr',\n              ['shift_expr',\n               ['arith_expr',\n                ['term',\n                 ['factor',\n                  ['power', ['atom', ['NAME', 'b', 2]]]]]]]]]]]]]]]]]],\n   ['NEWLINE', '', 2]]],\n ['NEWLINE', '', 2],\n ['ENDMARKER', '', 2]]\n"
         print(repr(output))
         self.assertEqual(output, expected)
+
+
+class TestIssuesAst(TestIssues):
+
+    def setUp(self,):
+        TestIssues.setUp(self)
+        self.engine = pycscope.engine
+        pycscope.engine = "ast"
+
+    def tearDown(self,):
+        pycscope.engine = self.engine
+
+    @unittest.skip("dumpCst() dumps the trees of the parser module, not used by the ast and lite engines")
+    def testIssue0009(self):
+        pass
+
+
+class TestIssuesLite(TestIssuesAst):
+
+    def setUp(self,):
+        TestIssuesAst.setUp(self)
+        pycscope.engine = "lite"
@@ -15,6 +15,7 @@ class TestMain(unittest.TestCase):
         self.orig_wd = os.getcwd()
         self.tmpd = tempfile.mkdtemp()
         os.chdir(self.tmpd)
+        self.engine = pycscope.engine
 
     def tearDown(self,):
         os.chdir(self.orig_wd)
@@ -22,6 +23,8 @@ class TestMain(unittest.TestCase):
         shutil.rmtree(self.tmpd)
         self.tmpd = None
         pycscope.strings_as_symbols = False
+        pycscope.engine = self.engine
+        pycscope.readahead = 0
 
     def testmainopterr(self,):
         ret = pycscope.main()
@@ -110,3 +113,259 @@ class TestMain(unittest.TestCase):
         # Finally, reconstruct the expected contents.
         econtents = 'cscope 15 %s -c %010d%s%s' % (fpath, len(fpath) + 25 + len(eindexbuff), eindexbuff, etrailerbuff)
         assert econtents == contents, "Expected %r, got %r" % (econtents, contents)
+
+    def testmaindashj(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('a = 1\n')
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('def b():\n    return a()\n')
+        ret = pycscope.main(['arg0', '-f', 'serial.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '-j', '2', '-f', 'parallel.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'serial.out'), 'rb') as s:
+            serial = s.read()
+        with open(os.path.join(self.tmpd, 'parallel.out'), 'rb') as p:
+            parallel = p.read()
+        assert serial == parallel, "Expected %r, got %r" % (serial, parallel)
+
+    def testmaindashjbad(self,):
+        ret = pycscope.main(['arg0', '-j', 'x'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = os.listdir(self.tmpd)
+        assert [] == ret, "Expected [], got %r" % ret
+
+    def testmainlite(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('import b\n\nclass A(object):\n    def a(self):\n        self.x = b.f()\n')
+        ret = pycscope.main(['arg0', '-f', 'default.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '--lite', '-f', 'lite.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'default.out'), 'rb') as d:
+            default = d.read()
+        with open(os.path.join(self.tmpd, 'lite.out'), 'rb') as l:
+            lite = l.read()
+        assert default == lite, "Expected %r, got %r" % (default, lite)
+
+    def testmainenginebad(self,):
+        ret = pycscope.main(['arg0', '--engine', 'x'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = os.listdir(self.tmpd)
+        assert [] == ret, "Expected [], got %r" % ret
+
+    def testmainwatchpollbad(self,):
+        ret = pycscope.main(['arg0', '--watch', '--watch-poll', '0'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = os.listdir(self.tmpd)
+        assert [] == ret, "Expected [], got %r" % ret
+
+    def testmainwalkthreadsbad(self,):
+        ret = pycscope.main(['arg0', '--walk-threads', '0'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = os.listdir(self.tmpd)
+        assert [] == ret, "Expected [], got %r" % ret
+
+    def testmainreadahead(self,):
+        ret = pycscope.main(['arg0', '--read-ahead', 'x'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('a = 1\n')
+        ret = pycscope.main(['arg0', '-f', 'default.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '--read-ahead', '4', '-f', 'readahead.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'default.out'), 'rb') as d:
+            default = d.read()
+        with open(os.path.join(self.tmpd, 'readahead.out'), 'rb') as r:
+            readahead = r.read()
+        assert default == readahead, "Expected %r, got %r" % (default, readahead)
+
+    def testmainincremental(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('a = 1\n')
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('b = 2\n')
+        os.utime(os.path.join(self.tmpd, 'b.py'), (1000000000, 1000000000))
+        ret = pycscope.main(['arg0', '--incremental', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = sorted(os.listdir(self.tmpd))
+        expf = ['a.py', 'b.py', 'cscope.out', 'cscope.out.sections']
+        assert expf == ret, "Expected %r, got %r" % (expf, ret)
+
+        # Change the size of a.py, and the contents of b.py without changing
+        # its size or modification time, so that only a.py is parsed again.
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('aa = 1\n')
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('c = 2\n')
+        os.utime(os.path.join(self.tmpd, 'b.py'), (1000000000, 1000000000))
+        with open(os.path.join(self.tmpd, 'c.py'), 'w') as c:
+            c.write('c = 3\n')
+        ret = pycscope.main(['arg0', '--incremental', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'cscope.out'), 'r') as c:
+            contents = c.read()
+        eindexbuff = '\n\t@./a.py\n\n1 \n\t=aa\n = 1\n\n\n\t@./b.py\n\n1 \n\t=b\n = 2\n\n\n\t@./c.py\n\n1 \n\t=c\n = 3\n\n\n\t@'
+        etrailerbuff = '\n1\n.\n0\n3\n21\n./a.py\n./b.py\n./c.py\n'
+        fpath = os.path.realpath(self.tmpd)
+        econtents = 'cscope 15 %s -c %010d%s%s' % (fpath, len(fpath) + 25 + len(eindexbuff), eindexbuff, etrailerbuff)
+        assert econtents == contents, "Expected %r, got %r" % (econtents, contents)
+
+    def testmainincrementalstale(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('a = "s"\n')
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('b = "t"\n')
+        ret = pycscope.main(['arg0', '-f', 'fresh.out', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '--incremental', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        # Another database written over it, then an incremental build again
+        # does not reuse the sections recorded for the first one
+        ret = pycscope.main(['arg0', '-S', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = sorted(os.listdir(self.tmpd))
+        expf = ['a.py', 'b.py', 'cscope.out', 'fresh.out']
+        assert expf == ret, "Expected %r, got %r" % (expf, ret)
+        # -S is left set by main(), each run being a process of its own
+        pycscope.strings_as_symbols = False
+        ret = pycscope.main(['arg0', '--incremental', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'fresh.out'), 'r') as f:
+            fresh = f.read()
+        with open(os.path.join(self.tmpd, 'cscope.out'), 'r') as c:
+            contents = c.read()
+        assert fresh == contents, "Expected %r, got %r" % (fresh, contents)
+
+        # Nor those recorded for a database since replaced by other means
+        ret = pycscope.main(['arg0', '--incremental', '-S', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'cscope.out.sections'), 'r') as f:
+            recorded = f.read()
+        ret = pycscope.main(['arg0', '-S', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'cscope.out.sections'), 'w') as f:
+            f.write(recorded)
+        assert [] == pycscope.readSections(os.path.join(self.tmpd, 'cscope.out'))
+
+    def testmainupdate(self,):
+        for fname in ('a.py', 'b.py', 'c.py'):
+            with open(os.path.join(self.tmpd, fname), 'w') as f:
+                f.write('%s = 1\n' % fname[0])
+        ret = pycscope.main(['arg0', '--update', 'a.py'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = pycscope.main(['arg0', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('def bb(): pass\n')
+        os.unlink(os.path.join(self.tmpd, 'c.py'))
+        with open(os.path.join(self.tmpd, 'd.py'), 'w') as d:
+            d.write('d = 1\n')
+        # Without a sections file, then with the one written; b.py by its
+        # absolute path, as an editor would give it
+        ret = pycscope.main(['arg0', '--update', os.path.join(os.getcwd(), 'b.py'), '--update', './c.py'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '--update', os.path.join(os.getcwd(), 'd.py')])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        # Not in the directory the database was built from
+        ret = pycscope.main(['arg0', '--update', os.path.join(os.path.dirname(os.getcwd()), 'd.py')])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        with open(os.path.join(self.tmpd, 'cscope.out'), 'r') as c:
+            contents = c.read()
+        eindexbuff = '\n\t@./a.py\n\n1 \n\t=a\n = 1\n\n\n\t@./b.py\n\n1 def \n\t$bb\n ( ) : pass\n\n' \
+                     '\n\t@d.py\n\n1 \n\t=d\n = 1\n\n\n\t@'
+        etrailerbuff = '\n1\n.\n0\n3\n19\n./a.py\n./b.py\nd.py\n'
+        fpath = os.path.realpath(self.tmpd)
+        econtents = 'cscope 15 %s -c %010d%s%s' % (fpath, len(fpath) + 25 + len(eindexbuff), eindexbuff, etrailerbuff)
+        assert econtents == contents, "Expected %r, got %r" % (econtents, contents)
+
+        sections = pycscope.readSections(os.path.join(self.tmpd, 'cscope.out'))
+        ret = [ (fname, key is not None) for fname, key, offset, length in sections ]
+        eret = [('./a.py', False), ('./b.py', True), ('d.py', True)]
+        assert eret == ret, "Expected %r, got %r" % (eret, ret)
+
+        # A sections file out of date is not used
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('aa = 1\n')
+        ret = pycscope.main(['arg0', '.'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        reader = pycscope.IndexReader(os.path.join(self.tmpd, 'cscope.out'))
+        try:
+            assert not pycscope.checkSections(reader, sections), "Expected the sections not to match"
+        finally:
+            reader.close()
+        ret = pycscope.main(['arg0', '--update', 'd.py'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+
+    def testmainmerge(self,):
+        os.mkdir(os.path.join(self.tmpd, 'sub'))
+        for fname in ('a.py', 'b.py', 'sub/c.py'):
+            with open(os.path.join(self.tmpd, fname), 'w') as f:
+                f.write('%s = 1\n' % os.path.basename(fname)[0])
+        ret = pycscope.main(['arg0', '--merge'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = pycscope.main(['arg0', '--incremental', '-f', 'a.out', 'a.py', 'b.py'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'b.py'), 'w') as b:
+            b.write('bb = 2\n')
+        ret = pycscope.main(['arg0', '-f', 'b.out', 'b.py'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        # Built from another directory
+        os.chdir(os.path.join(self.tmpd, 'sub'))
+        ret = pycscope.main(['arg0', '-f', 'c.out', 'c.py'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        os.chdir(self.tmpd)
+
+        ret = pycscope.main(['arg0', '--merge', 'a.out', 'b.out', 'sub/c.out', 'nosuch.out'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = pycscope.main(['arg0', '--merge', 'a.out', 'b.out', 'sub/c.out'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'cscope.out'), 'r') as c:
+            contents = c.read()
+        eindexbuff = '\n\t@a.py\n\n1 \n\t=a\n = 1\n\n\n\t@b.py\n\n1 \n\t=bb\n = 2\n\n' \
+                     '\n\t@sub/c.py\n\n1 \n\t=c\n = 1\n\n\n\t@'
+        etrailerbuff = '\n1\n.\n0\n3\n19\na.py\nb.py\nsub/c.py\n'
+        fpath = os.path.realpath(self.tmpd)
+        econtents = 'cscope 15 %s -c %010d%s%s' % (fpath, len(fpath) + 25 + len(eindexbuff), eindexbuff, etrailerbuff)
+        assert econtents == contents, "Expected %r, got %r" % (econtents, contents)
+
+        # The keys of a.out are kept
+        sections = pycscope.readSections(os.path.join(self.tmpd, 'cscope.out'))
+        ret = [ (fname, key is not None) for fname, key, offset, length in sections ]
+        eret = [('a.py', True), ('b.py', False), ('sub/c.py', False)]
+        assert eret == ret, "Expected %r, got %r" % (eret, ret)
+
+    def testmainpartition(self,):
+        for num in range(10):
+            path = os.path.join(self.tmpd, 'p%d' % (num % 3), 'm%d.py' % num)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.mkdir(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('def f%d(): pass\n' % num * (num + 1))
+        for val in ('0/2', '3/2', '1', '1/x'):
+            ret = pycscope.main(['arg0', '-R', '--partition', val])
+            assert 2 == ret, "Expected 2, got %r" % ret
+        ret = pycscope.main(['arg0', '-R', '-f', 'full.out'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        for num in (1, 2, 3):
+            ret = pycscope.main(['arg0', '-R', '--partition', '%d/3' % num, '-f', 'part%d.out' % num])
+            assert 0 == ret, "Expected 0, got %r" % ret
+        ret = pycscope.main(['arg0', '--assemble', 'part1.out', 'part2.out', 'part3.out'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        with open(os.path.join(self.tmpd, 'full.out'), 'rb') as f:
+            full = f.read()
+        with open(os.path.join(self.tmpd, 'cscope.out'), 'rb') as f:
+            assembled = f.read()
+        assert full == assembled, "Expected %r, got %r" % (full, assembled)
+
+    def testmaindashq(self,):
+        with open(os.path.join(self.tmpd, 'a.py'), 'w') as a:
+            a.write('a = 1\n')
+        # The inverted index is not offered until checked with cscope
+        ret = pycscope.main(['arg0', '-q', '.'])
+        assert 2 == ret, "Expected 2, got %r" % ret
+        ret = sorted(os.listdir(self.tmpd))
+        expf = ['a.py']
+        assert expf == ret, "Expected %r, got %r" % (expf, ret)
@@ -5,7 +5,9 @@
 import unittest
 import os
 import pycscope
+import shutil
 import sys
+import tempfile
 
 if sys.hexversion < 0x03000000:
     ellipsis_str = ". . ."
@@ -35,3 +37,53 @@ class TestParseFile(unittest.TestCase):
             self.assertEquals(os.path.join(cwd, fn), e.filename)
         else:
             self.fail("Expected a syntax error.")
+
+
+class TestReadFile(unittest.TestCase):
+
+    def setUp(self,):
+        self.dir = tempfile.mkdtemp()
+        self.buf = []
+        self.fnbuf = []
+
+    def tearDown(self,):
+        shutil.rmtree(self.dir)
+        pycscope.mmap_bytes = 1024 * 1024
+
+    def write(self, fn, data):
+        with open(os.path.join(self.dir, fn), 'wb') as f:
+            f.write(data)
+        return os.path.join(self.dir, fn)
+
+    def testnewlines(self,):
+        fn = self.write("newlines.py", b"def f():\r\n    pass\rx = 1\r\n\r\n")
+        self.assertEqual(pycscope.readFile(fn), "def f():\n    pass\nx = 1\n\n")
+
+    def testcoding(self,):
+        fn = self.write("coding.py", b"#!/usr/bin/env python\n# -*- coding: latin-1 -*-\ns = '\xe9t\xe9'\n")
+        if sys.hexversion >= 0x03000000:
+            self.assertEqual(pycscope.readFile(fn), u"#!/usr/bin/env python\n# -*- coding: latin-1 -*-\ns = '\xe9t\xe9'\n")
+        l = pycscope.parseFile(self.dir, "coding.py", self.buf, 0, self.fnbuf)
+        self.assertEqual(self.fnbuf, ["coding.py"])
+        if sys.hexversion >= 0x03000000:
+            self.assertTrue(u" = '\xe9t\xe9'\n" in "".join(self.buf))
+
+    def testbom(self,):
+        fn = self.write("bom.py", b"\xef\xbb\xbfs = '\xc3\xa9'\n")
+        if sys.hexversion >= 0x03000000:
+            self.assertEqual(pycscope.readFile(fn), u"s = '\xe9'\n")
+
+    def testundeclared(self,):
+        fn = self.write("undeclared.py", b"s = '\xe9'\n")
+        if sys.hexversion >= 0x03000000:
+            self.assertEqual(pycscope.readFile(fn), u"s = '\xe9'\n")
+        l = pycscope.parseFile(self.dir, "undeclared.py", self.buf, 0, self.fnbuf)
+        self.assertEqual(self.fnbuf, ["undeclared.py"])
+
+    def testmmap(self,):
+        fn = self.write("mapped.py", b"# coding: utf-8\r\ns = '\xc3\xa9'\r\n")
+        pycscope.mmap_bytes = 1
+        if sys.hexversion >= 0x03000000:
+            self.assertEqual(pycscope.readFile(fn), u"# coding: utf-8\ns = '\xe9'\n")
+        else:
+            self.assertEqual(pycscope.readFile(fn), "# coding: utf-8\ns = '\xc3\xa9'\n")
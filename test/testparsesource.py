@@ -2,13 +2,33 @@
 """ Unit tests for parsing Python source into cscope index
 """
 
-import unittest, parser, errno
+import sys, unittest, token, errno
+try:
+    import parser, symbol
+except ImportError:
+    # Removed in Python 3.10, along with the cst engine; only the ast and
+    # lite engines are verified there
+    parser = symbol = None
 try:
     from cStringIO import StringIO
 except ImportError:
     from io import StringIO
 import pycscope
-from pycscope import parseSource, Line, Symbol, NonSymbol, Mark, dumpCst
+from pycscope import parseSource, Line, IndexLine, Symbol, NonSymbol, Mark, dumpCst
+
+needs_parser = unittest.skipIf(parser is None, "the parser module is not available")
+
+
+def cstDump(src):
+    """ The dump of the concrete syntax tree of a source, for the messages
+        of failures, when the parser module can build it.
+    """
+    if parser is None:
+        return "(not available)\n"
+    try:
+        return dumpCst(parser.suite(src), StringIO()).getvalue()
+    except SyntaxError as e:
+        return "(%s)\n" % e
 
 
 class TestMark(unittest.TestCase):
@@ -268,6 +288,53 @@ class TestLine(unittest.TestCase):
             self.fail("Expected a TypeError exception.")
 
 
+class TestIndexLine(unittest.TestCase):
+    """ Verify the IndexLine class formats lines as the Line class does.
+    """
+
+    def verify(self, lineno, items):
+        l = Line(lineno)
+        il = IndexLine(lineno)
+        for item in items:
+            if item is None:
+                l += Symbol('', Mark.FUNC_END)
+                il.addFuncEnd()
+            elif type(item) == tuple:
+                l += Symbol(*item)
+                il.addSymbol(*item)
+            else:
+                l += NonSymbol(item)
+                il.addNonSymbol(item)
+        self.assertEqual(l.format(), il.format())
+
+    def testEmpty(self,):
+        self.verify(1, [])
+        self.verify(1, ["def", "("])
+
+    def testAdd(self,):
+        self.verify(113, [("x", Mark.GLOBAL), "=", "5"])
+        self.verify(117, ["def", ("x", Mark.GLOBAL), "(", ("y", Mark.INCLUDE), ")"])
+        self.verify(2, [("a", Mark.INCLUDE), (".", Mark.INCLUDE), ("b", Mark.INCLUDE), "as", ("c",)])
+
+    def testFuncEnd(self,):
+        self.verify(3, [None])
+        self.verify(3, ["return", ("x",), None])
+        self.verify(3, ["return", ("x",), ")", None])
+
+    def testMarkedDifferently(self,):
+        il = IndexLine(1)
+        il.addSymbol("a", Mark.ASSIGN)
+        self.assertRaises(AssertionError, il.addSymbol, "b", Mark.FUNC_CALL)
+
+    def testReset(self,):
+        il = IndexLine(1)
+        il.addSymbol("a")
+        il.reset(5)
+        self.assertEqual(5, il.lineno)
+        self.assertEqual('', il.format())
+
+
+@needs_parser
 class TestDumpCst(unittest.TestCase):
 
     def testGoodStream(self,):
@@ -319,6 +386,10 @@ class TestDumpCst(unittest.TestCase):
 class TestParseSource(unittest.TestCase):
 
     def setUp(self,):
+        if parser is None:
+            # The cst engine is not available (the subclasses below do not
+            # need it)
+            raise unittest.SkipTest("the parser module is not available")
         self.buf = []
         pycscope.strings_as_symbols = False
 
@@ -348,7 +419,7 @@ class TestParseSource(unittest.TestCase):
             self.fail("Internal AssertionError Encountered: %s\n"
                       "Concrete Syntax Tree:\n"
                       "%s\n"
-                      % (ae, dumpCst(parser.suite(srcStr),StringIO()).getvalue()))
+                      % (ae, cstDump(srcStr)))
         self.assertEqual(l, len(self.buf))
         output = "".join(self.buf)
         self.assertEqual(output, expStr,
@@ -357,7 +428,7 @@ class TestParseSource(unittest.TestCase):
                          "    exp: %r\n"
                          "Concrete Syntax Tree:\n"
                          "%s\n"
-                         % (output, expStr, dumpCst(parser.suite(srcStr),StringIO()).getvalue()))
+                         % (output, expStr, cstDump(srcStr)))
 
     def testEmptyCode(self,):
         # Verify we can handle an empty file.
@@ -1531,3 +1602,203 @@ class TestParseSource(unittest.TestCase):
                      '\t$print',
                      ' ( ) : return 0',
                      ''])
+
+
+@needs_parser
+class TestRegisterHandler(unittest.TestCase):
+    """ Verify handlers can be added for the non-terminals of the CST.
+    """
+
+    def setUp(self,):
+        self.handlers = dict(pycscope.nonterminal_handlers)
+
+    def tearDown(self,):
+        pycscope.nonterminal_handlers.clear()
+        pycscope.nonterminal_handlers.update(self.handlers)
+
+    def testParameters(self,):
+        # Mark the names of parameters as local definitions
+        def handleParameter(ctx, cst):
+            if cst[1][0] == token.NAME:
+                ctx.setMark(cst[1], Mark.LOCAL)
+        pycscope.registerHandler(getattr(symbol, 'fpdef', None) or symbol.tfpdef, handleParameter)
+        buf = []
+        parseSource("def f(a, b):\n    pass\n", buf, 0)
+        self.assertEqual("".join(buf).split("\n")[:8],
+                         ["1 def ", "\t$f", " ( ", "\tla", " , ", "\tlb", " ) :", ""])
+
+    def testChained(self,):
+        calls = []
+        pycscope.registerHandler(symbol.classdef, lambda ctx, cst: calls.append(cst[2][1]))
+        buf = []
+        parseSource("class A:\n    pass\n", buf, 0)
+        self.assertEqual(calls, ["A"])
+        self.assertEqual("".join(buf).split("\n")[:3], ["1 class ", "\tcA", " :"])
+
+
+@needs_parser
+class TestParseSuites(unittest.TestCase):
+    """ Verify large sources parsed a suite of statements at a time are
+        indexed as when parsed whole.
+    """
+
+    source = "\n".join(["import os",
+                         "",
+                         "@decorator",
+                         "def f(a):",
+                         "    return os.path.join(a)",
+                         "",
+                         "# comment",
+                         "if f(1):",
+                         "    x = 1",
+                         "else:",
+                         "    x = 2",
+                         "class C(object):",
+                         "    def m(self):",
+                         "        self.a, (b, c) = d[1] = g()",
+                         ""])
+
+    def setUp(self,):
+        self.suite_bytes = pycscope.suite_bytes
+
+    def tearDown(self,):
+        pycscope.suite_bytes = self.suite_bytes
+
+    def testSuites(self,):
+        whole = []
+        parseSource(self.source, whole, 0)
+        pycscope.suite_bytes = 1
+        suites = list(pycscope.genSuites(self.source))
+        self.assertEqual([ offset for offset, st in suites ], [0, 7, 11])
+        buf = []
+        parseSource(self.source, buf, 0)
+        self.assertEqual(buf, whole)
+
+    def testBoundaries(self,):
+        # A string starting a statement is added to the line before it, even
+        # after the end of a function, and form feeds do not end lines.
+        for source in ('x = 1\n"abc".join(y)\nw = 2\n',
+                       'def f():\n    pass\n\n\n"""doc\n"""\nz = 1\n',
+                       'a = 1\n\f\nb = 2\nc = 3\n'):
+            pycscope.suite_bytes = self.suite_bytes
+            whole = []
+            parseSource(source, whole, 0)
+            pycscope.suite_bytes = 1
+            self.assertTrue(len(list(pycscope.genSuites(source))) > 1)
+            buf = []
+            parseSource(source, buf, 0)
+            self.assertEqual(buf, whole)
+
+    def testSplitStatement(self,):
+        # Lines looking like top level statements, in a string, split it
+        # across suites which do not parse, so the source is parsed whole.
+        source = self.source + "s = \"\"\"\ny = 3\n\"\"\"\nz = (1,\n2)\n"
+        whole = []
+        parseSource(source, whole, 0)
+        pycscope.suite_bytes = 1
+        self.assertRaises(SyntaxError, list, pycscope.genSuites(source))
+        buf = []
+        parseSource(source, buf, 0)
+        self.assertEqual(buf, whole)
+
+    def testSyntaxError(self,):
+        pycscope.suite_bytes = 1
+        try:
+            parseSource(self.source + "a a\n", [], 0)
+        except SyntaxError as e:
+            assert e.lineno == 15
+        else:
+            self.fail("Expected a syntax error")
+
+
+class TestParseSourceAst(TestParseSource):
+    """ Verify the ast engine generates the same output.
+    """
+
+    def setUp(self,):
+        self.buf = []
+        pycscope.strings_as_symbols = False
+        self.engine = pycscope.engine
+        pycscope.engine = "ast"
+
+    def tearDown(self,):
+        TestParseSource.tearDown(self)
+        pycscope.engine = self.engine
+
+    def testFuncCallSimpleWithArgs(self,):
+        # The ast module rejects positional arguments following keyword
+        # arguments, which the grammar alone accepts.
+        self.assertRaises(SyntaxError, parseSource, "main(a,b=45,c)\n", self.buf, 0)
+
+    @unittest.skipIf(sys.hexversion < 0x030A0000, "match statements need Python 3.10")
+    def testMatchSoftKeywords(self,):
+        self.verify(["match(x)",
+                     "match x:",
+                     "    case A(b=c):",
+                     "        pass"],
+                    ["1 ",
+                     "\t`match",
+                     " ( ",
+                     "x",
+                     " )",
+                     "",
+                     "2 match ",
+                     "x",
+                     " :",
+                     "",
+                     "3 case ",
+                     "\t`A",
+                     " ( ",
+                     "b",
+                     " = ",
+                     "c",
+                     " ) :",
+                     ""])
+
+    @unittest.skipIf(sys.hexversion < 0x03090000, "decorator expressions need Python 3.9")
+    def testDecoratorExpression(self,):
+        self.verify(["@lambda f: null(f)",
+                     "def f(x): pass"],
+                    ["1 @ lambda ",
+                     "f",
+                     " : ",
+                     "\t`null",
+                     " ( ",
+                     "f",
+                     " )",
+                     "",
+                     "2 def ",
+                     "\t$f",
+                     " ( ",
+                     "x",
+                     " ) : pass",
+                     ""])
+
+
+class TestParseSourceLite(TestParseSourceAst):
+    """ Verify the lite engine generates the same output.
+    """
+
+    def setUp(self,):
+        TestParseSourceAst.setUp(self)
+        pycscope.engine = "lite"
+
+    def testFuncCallSimpleWithArgs(self,):
+        # Without the ast module, sources are not checked beyond their
+        # tokens.
+        TestParseSource.testFuncCallSimpleWithArgs(self)
+
+    def testSyntaxErrors(self,):
+        # Without the ast module, sources are not checked beyond their
+        # tokens, but are still indexed.
+        l = parseSource("a a (foo)", self.buf, 0)
+        self.assertEqual(l, len(self.buf))
+        self.assertEqual("".join(self.buf), "1 \naa\n ( \nfoo\n )\n\n")
+
+    def testTokenErrors(self,):
+        try:
+            parseSource("a = (1,\n", self.buf, 0)
+        except SyntaxError as e:
+            assert e.lineno == 2
+        else:
+            self.fail("Expected a syntax error")
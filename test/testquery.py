@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Unit tests for queries.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+from pycscope.query import Database
+
+
+source = '''import os
+from a.b import c
+
+class K(object):
+    def m(self, x):
+        y = os.path.join(x)
+        def inner():
+            return g()
+        return f(y)
+
+def f(z):
+    g(z)
+    z = 1
+'''
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = tempfile.mkdtemp()
+        os.chdir(self.tmpd)
+        os.mkdir('pkg')
+        with open(os.path.join('pkg', 'q.py'), 'w') as f:
+            f.write(source)
+        with open('r.py', 'w') as f:
+            f.write('import pkg.q\npkg.q.f(1)\n')
+        ret = pycscope.main(['arg0', '-R'])
+        assert 0 == ret, "Expected 0, got %r" % ret
+        self.db = Database('cscope.out')
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def testdef(self,):
+        self.assertEqual(self.db.find('def', 'f'), [('./pkg/q.py', 'f', 11, 'def f ( z ) :')])
+        self.assertEqual(self.db.find('def', 'K'), [('./pkg/q.py', 'K', 4, 'class K ( object ) :')])
+        self.assertEqual(self.db.find('def', 'nosuch'), [])
+
+    def testcalls(self,):
+        # Nested functions are not marked, their calls are those of m()
+        self.assertEqual(self.db.find('callees', 'm'),
+                         [('./pkg/q.py', 'join', 6, 'y = os . path . join ( x )'),
+                          ('./pkg/q.py', 'g', 8, 'return g ( )'),
+                          ('./pkg/q.py', 'f', 9, 'return f ( y )')])
+        self.assertEqual(self.db.find('callees', 'inner'), [])
+        self.assertEqual(self.db.find('callers', 'f'),
+                         [('./pkg/q.py', 'm', 9, 'return f ( y )'),
+                          ('./r.py', '<global>', 2, 'pkg . q . f ( 1 )')])
+        self.assertEqual(self.db.find('callers', 'g'),
+                         [('./pkg/q.py', 'm', 8, 'return g ( )'),
+                          ('./pkg/q.py', 'f', 12, 'g ( z )')])
+
+    def testsymbol(self,):
+        self.assertEqual(self.db.find('symbol', 'z'),
+                         [('./pkg/q.py', 'f', 11, 'def f ( z ) :'),
+                          ('./pkg/q.py', 'f', 12, 'g ( z )'),
+                          ('./pkg/q.py', 'f', 13, 'z = 1')])
+        self.assertEqual(self.db.find('assign', 'z'), [('./pkg/q.py', 'f', 13, 'z = 1')])
+
+    def testinclude(self,):
+        self.assertEqual(self.db.find('include', 'os'), [('./pkg/q.py', '<global>', 1, 'import os')])
+        self.assertEqual(self.db.find('include', 'b'), [('./pkg/q.py', '<global>', 2, 'from a.b import c')])
+        self.assertEqual(self.db.find('include', 'q'), [('./r.py', '<global>', 1, 'import pkg.q')])
+
+    def testfile(self,):
+        self.assertEqual(self.db.find('file', 'q.py'), [('./pkg/q.py', '<unknown>', 1, '<unknown>')])
+        self.assertEqual(self.db.find('file', 'pkg/q.py'), [('./pkg/q.py', '<unknown>', 1, '<unknown>')])
+        self.assertEqual(self.db.find('file', 'g/q.py'), [])
+
+    def testmain(self,):
+        self.assertEqual(pycscope.main(['arg0', '--find', 'def', 'f']), 0)
+        self.assertEqual(pycscope.main(['arg0', '--find', 'defs', 'f']), 2)
+        self.assertEqual(pycscope.main(['arg0', '--find', 'def']), 2)
+        self.assertEqual(pycscope.main(['arg0', '--find', 'def', '-f', 'nosuch.out', 'f']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
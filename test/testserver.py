@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Unit tests for the query server.
+"""
+
+import unittest
+import os
+import socket
+import tempfile
+import shutil
+import threading
+import pycscope
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def setUp(self,):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise unittest.SkipTest("Unix sockets are not available")
+        self.orig_wd = os.getcwd()
+        self.tmpd = tempfile.mkdtemp()
+        os.chdir(self.tmpd)
+        self.write('a.py', 'def f():\n    g()\n')
+        self.sockpath = os.path.join(self.tmpd, 'sock')
+        self.server = pycscope.QueryServer(os.path.join(self.tmpd, 'cscope.out'), self.sockpath)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conn.connect(self.sockpath)
+        self.f = self.conn.makefile('rb')
+
+    def tearDown(self,):
+        self.f.close()
+        self.conn.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def write(self, fname, contents):
+        with open(fname, 'w') as f:
+            f.write(contents)
+        ret = pycscope.main(['arg0', fname])
+        assert 0 == ret, "Expected 0, got %r" % ret
+
+    def query(self, line):
+        """ Send a query, returning the lines of the reply.
+        """
+        self.assertEqual(self.f.read(3), b">> ")
+        self.conn.sendall(line.encode('utf-8') + b"\n")
+        header = self.f.readline().decode('utf-8')
+        self.assertTrue(header.startswith("cscope: "), header)
+        return [ self.f.readline().decode('utf-8').rstrip('\n') for i in range(int(header.split()[1])) ]
+
+    def testqueries(self,):
+        self.assertEqual(self.query("1f"), ["a.py f 1 def f ( ) :"])
+        self.assertEqual(self.query("3g"), ["a.py f 2 g ( )"])
+        self.assertEqual(self.query("2f"), ["a.py g 2 g ( )"])
+        self.assertEqual(self.query("7a.py"), ["a.py <unknown> 1 <unknown>"])
+        self.assertEqual(self.query("1nosuch"), [])
+        self.assertEqual(self.query("4g()"), ["a.py <unknown> 2 g()"])
+        self.assertEqual(self.query("6^def [e-g]"), ["a.py <unknown> 1 def f():"])
+        self.assertEqual(self.query("6a(b"), [])
+
+    def testreload(self,):
+        self.assertEqual(self.query("1h"), [])
+        self.write('a.py', 'def h():\n    pass\n')
+        self.assertEqual(self.query("1h"), ["a.py h 1 def h ( ) :"])
+        self.assertEqual(self.query("1f"), [])
+
+    def testquit(self,):
+        self.assertEqual(self.f.read(3), b">> ")
+        self.conn.sendall(b"q\n")
+        self.assertEqual(self.f.read(), b"")
+
+    def testmain(self,):
+        self.assertEqual(pycscope.main(['arg0', '--serve', self.sockpath, 'a.py']), 2)
+        self.assertEqual(pycscope.main(['arg0', '-f', 'nosuch.out', '--serve', self.sockpath]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
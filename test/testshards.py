@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Unit tests for sharded index output.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+from pycscope.shards import parseShardBy, groupShards, shardPath, readManifest, writeShards
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = os.path.realpath(tempfile.mkdtemp())
+        os.chdir(self.tmpd)
+        for relpath in ('top.py', 'app/__init__.py', 'app/core/__init__.py', 'app/core/x.py', 'scripts/run.py',
+                        'scripts/tools/y.py', 'lib/pkg/__init__.py', 'lib/pkg/m.py'):
+            self.write(relpath, "x = 1\n")
+        self.fnames = list(pycscope.genFiles(self.tmpd, ['.'], True, []))
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def write(self, relpath, contents):
+        path = os.path.join(self.tmpd, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(contents)
+
+    def testparse(self,):
+        self.assertEqual(parseShardBy("package"), ("package", None))
+        self.assertEqual(parseShardBy("depth:2"), ("depth", 2))
+        self.assertEqual(parseShardBy("size:4K"), ("size", 4096))
+        for val in ("package:1", "depth", "depth:0", "depth:x", "size", "size:0", "size:1X", "files"):
+            self.assertEqual(parseShardBy(val), None, val)
+
+    def testpackage(self,):
+        shards = groupShards(self.tmpd, self.fnames, ("package", None))
+        self.assertEqual(shards, [('_top', ['./top.py']),
+                                  ('app', ['./app/__init__.py', './app/core/__init__.py', './app/core/x.py']),
+                                  ('lib.pkg', ['./lib/pkg/__init__.py', './lib/pkg/m.py']),
+                                  ('scripts', ['./scripts/run.py']),
+                                  ('scripts.tools', ['./scripts/tools/y.py'])])
+
+    def testdepth(self,):
+        shards = groupShards(self.tmpd, self.fnames, ("depth", 1))
+        self.assertEqual([ name for name, fnames in shards ], ['_top', 'app', 'lib', 'scripts'])
+        shards = groupShards(self.tmpd, self.fnames, ("depth", 2))
+        self.assertEqual([ name for name, fnames in shards ],
+                         ['_top', 'app', 'app.core', 'lib.pkg', 'scripts', 'scripts.tools'])
+
+    def testsize(self,):
+        # Every file holds 6 bytes
+        shards = groupShards(self.tmpd, self.fnames, ("size", 12))
+        self.assertEqual([ len(fnames) for name, fnames in shards ], [2, 2, 2, 2])
+        self.assertEqual([ fname for name, fnames in shards for fname in fnames ], self.fnames)
+        shards = groupShards(self.tmpd, self.fnames, ("size", 1))
+        self.assertEqual(len(shards), len(self.fnames))
+
+    def testmain(self,):
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+        self.assertFalse(os.path.exists('cscope.out'))
+        indexpath = os.path.join(self.tmpd, 'cscope.out')
+        self.assertEqual(readManifest('cscope.out.shards'),
+                         sorted([ os.path.join('cscope.out.d', name, 'cscope.out')
+                                  for name in ('_top', 'app', 'lib.pkg', 'scripts', 'scripts.tools') ]))
+        reader = pycscope.IndexReader(shardPath(indexpath, 'lib.pkg'))
+        try:
+            self.assertEqual([ fname for fname, offset, length in reader.sections() ],
+                             ['./lib/pkg/__init__.py', './lib/pkg/m.py'])
+        finally:
+            reader.close()
+
+        # A run over part of the tree keeps the shards of the rest
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package', 'lib'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(readManifest('cscope.out.shards'),
+                         sorted([ os.path.join('cscope.out.d', name, 'cscope.out')
+                                  for name in ('_top', 'app', 'lib.pkg', 'scripts', 'scripts.tools') ]))
+        self.assertEqual(sorted(os.listdir('cscope.out.d')), ['_top', 'app', 'lib.pkg', 'scripts', 'scripts.tools'])
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+
+        # The shards of a package removed are deleted
+        shutil.rmtree('app')
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(readManifest('cscope.out.shards'),
+                         sorted([ os.path.join('cscope.out.d', name, 'cscope.out')
+                                  for name in ('_top', 'lib.pkg', 'scripts', 'scripts.tools') ]))
+        self.assertEqual(sorted(os.listdir('cscope.out.d')), ['_top', 'lib.pkg', 'scripts', 'scripts.tools'])
+
+    def testreshard(self,):
+        writeShards(self.tmpd, os.path.join(self.tmpd, 'cscope.out'), self.fnames, ("package", None),
+                    inverted=True, incremental=True)
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'size:1'])
+        self.assertEqual(ret, 0)
+        names = [ "%03d" % num for num in range(1, len(self.fnames) + 1) ]
+        self.assertEqual(readManifest('cscope.out.shards'),
+                         [ os.path.join('cscope.out.d', name, 'cscope.out') for name in names ])
+        # Each file is found in a single shard
+        self.assertEqual(sorted(os.listdir('cscope.out.d')), names)
+
+    def testreshardpart(self,):
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+        # Only the shards of the files of the run are replaced
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'depth:1', 'scripts'])
+        self.assertEqual(ret, 0)
+        names = ['_top', 'app', 'lib.pkg', 'scripts']
+        self.assertEqual(readManifest('cscope.out.shards'),
+                         [ os.path.join('cscope.out.d', name, 'cscope.out') for name in names ])
+        self.assertEqual(sorted(os.listdir('cscope.out.d')), names)
+        reader = pycscope.IndexReader(shardPath(os.path.join(self.tmpd, 'cscope.out'), 'scripts'))
+        try:
+            self.assertEqual([ fname for fname, offset, length in reader.sections() ],
+                             ['scripts/run.py', 'scripts/tools/y.py'])
+        finally:
+            reader.close()
+
+    def testinverted(self,):
+        writeShards(self.tmpd, os.path.join(self.tmpd, 'cscope.out'), self.fnames, ("depth", 1), inverted=True)
+        for name in ('_top', 'app', 'lib', 'scripts'):
+            ret = sorted(os.listdir(os.path.join('cscope.out.d', name)))
+            self.assertEqual(ret, ['cscope.in.out', 'cscope.out', 'cscope.po.out'])
+
+    def testincremental(self,):
+        ret = pycscope.main(['arg0', '-R', '--incremental', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+        indexpath = os.path.join(self.tmpd, 'cscope.out')
+        with open(shardPath(indexpath, 'app'), 'rb') as f:
+            before = f.read()
+        self.write('lib/pkg/m.py', "yy = 2\n")
+        ret = pycscope.main(['arg0', '-R', '--incremental', '--shard-by', 'package'])
+        self.assertEqual(ret, 0)
+        with open(shardPath(indexpath, 'app'), 'rb') as f:
+            self.assertEqual(f.read(), before)
+        sections = pycscope.readSections(shardPath(indexpath, 'lib.pkg'))
+        self.assertEqual([ fname for fname, key, offset, length in sections ],
+                         ['./lib/pkg/__init__.py', './lib/pkg/m.py'])
+        with open(shardPath(indexpath, 'lib.pkg'), 'rb') as f:
+            self.assertTrue(b"yy" in f.read())
+
+    def testbad(self,):
+        ret = pycscope.main(['arg0', '--shard-by', 'files'])
+        self.assertEqual(ret, 2)
+        ret = pycscope.main(['arg0', '--shard-by', 'package', '--watch'])
+        self.assertEqual(ret, 2)
+        self.assertFalse(os.path.exists('cscope.out.shards'))
+
+
+if __name__ == '__main__':
+    unittest.main()
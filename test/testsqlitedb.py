@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Unit tests for the SQLite symbol database.
+"""
+
+import unittest
+import os
+import sqlite3
+import sys
+import tempfile
+import shutil
+import pycscope
+from pycscope import sqlitedb
+
+
+class TestSqlite(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = os.path.realpath(tempfile.mkdtemp())
+        os.chdir(self.tmpd)
+        os.mkdir('p')
+        with open(os.path.join('p', 'a.py'), 'w') as f:
+            f.write('import os\n\ndef f(x):\n    y = g(x)\n    return y\n')
+        with open('b.py', 'w') as f:
+            f.write('from p.a import f\nf(1)\n')
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def rows(self, sql, *args):
+        conn = sqlite3.connect('index.db')
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    def testsymbols(self,):
+        ret = pycscope.main(['arg0', '-R', '--sqlite', 'index.db'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(sorted(os.listdir(self.tmpd)), ['b.py', 'cscope.out', 'index.db', 'p'])
+        self.assertEqual(self.rows("SELECT * FROM files ORDER BY id"), [(0, './b.py'), (1, './p/a.py')])
+        self.assertEqual(self.rows("SELECT value FROM meta WHERE key = 'basepath'"), [(self.tmpd,)])
+        self.assertEqual(self.rows("SELECT file, line, mark, function FROM symbols WHERE symbol = 'f'"
+                                   " ORDER BY file, line, mark"),
+                         [(0, 1, '', None), (0, 2, '`', None), (1, 3, '$', 'f')])
+        self.assertEqual(self.rows("SELECT line, mark, function FROM symbols WHERE symbol = 'y' ORDER BY line, mark"),
+                         [(4, '=', 'f'), (5, '', 'f')])
+        # All the call sites of g in package p
+        self.assertEqual(self.rows("SELECT files.name, symbols.line, symbols.function"
+                                   " FROM symbols JOIN files ON files.id = symbols.file"
+                                   " WHERE symbols.mark = ? AND symbols.symbol = ? AND files.name LIKE './p/%'",
+                                   '`', 'g'),
+                         [('./p/a.py', 4, 'f')])
+        self.assertEqual(sorted(self.rows("SELECT name FROM sqlite_master WHERE type = 'index'"
+                                          " AND name LIKE 'symbols_%'")),
+                         [('symbols_mark_symbol',), ('symbols_symbol',)])
+
+    def testbatches(self,):
+        ret = pycscope.main(['arg0', '-R'])
+        self.assertEqual(ret, 0)
+        sqlitedb.writeSqlite('cscope.out', 'index.db')
+        count = self.rows("SELECT COUNT(*) FROM symbols")[0][0]
+        rows = self.rows("SELECT * FROM symbols ORDER BY file, line, mark, symbol")
+        # Written again, over the previous one, a row at a time
+        batch_rows = sqlitedb.batch_rows
+        sqlitedb.batch_rows = 1
+        try:
+            sqlitedb.writeSqlite('cscope.out', 'index.db')
+        finally:
+            sqlitedb.batch_rows = batch_rows
+        self.assertEqual(self.rows("SELECT * FROM symbols ORDER BY file, line, mark, symbol"), rows)
+        self.assertEqual(len(rows), count)
+        self.assertEqual(sorted(os.listdir(self.tmpd)), ['b.py', 'cscope.out', 'index.db', 'p'])
+
+    def testbad(self,):
+        ret = pycscope.main(['arg0', '-R', '--sqlite', os.path.join('nosuchdir', 'index.db')])
+        self.assertEqual(ret, 2)
+        ret = pycscope.main(['arg0', '-R', '--shard-by', 'package', '--sqlite', 'index.db'])
+        self.assertEqual(ret, 2)
+        self.assertFalse(os.path.exists('index.db'))
+
+    def testnosqlite3(self,):
+        # Python built without the sqlite3 module
+        saved = sys.modules['sqlite3']
+        sys.modules['sqlite3'] = None
+        try:
+            ret = pycscope.main(['arg0', '-R', '--sqlite', 'index.db'])
+        finally:
+            sys.modules['sqlite3'] = saved
+        self.assertEqual(ret, 2)
+        self.assertEqual(sorted(os.listdir(self.tmpd)), ['b.py', 'cscope.out', 'p'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Unit tests for the trigram text index.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+from pycscope import textindex
+from pycscope.textindex import TextIndex, fileTrigrams, literalRuns
+
+
+class TestLiteralRuns(unittest.TestCase):
+
+    def testliterals(self,):
+        self.assertEqual(literalRuns("socket.gethostbyname"), ["socket", "gethostbyname"])
+        self.assertEqual(literalRuns(r"socket\.gethostbyname"), ["socket.gethostbyname"])
+        self.assertEqual(literalRuns(r"^class \w+Error\("), ["class ", "Error("])
+        self.assertEqual(literalRuns("colou?r [a-z]+ name"), ["colo", " name"])
+        self.assertEqual(literalRuns("abcd*e{2,3}fgh"), ["abc", "fgh"])
+        self.assertEqual(literalRuns("def (foo|bar)_baz"), ["def ", "_baz"])
+        self.assertEqual(literalRuns("[]abc] xyz"), [" xyz"])
+        self.assertEqual(literalRuns("foo|bar"), [])
+        self.assertEqual(literalRuns("a.b"), [])
+        self.assertEqual(literalRuns("(?i)socket"), [])
+        self.assertEqual(literalRuns("(?:abc)?defg"), ["defg"])
+
+
+class TestTextIndex(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = tempfile.mkdtemp()
+        os.chdir(self.tmpd)
+        os.mkdir('p')
+        self.write(os.path.join('p', 'a.py'), 'import socket\n\ndef f(host):\n    return socket.gethostbyname(host)\n')
+        self.write('./b.py', 'class NotFoundError(Exception):\n    pass\n\nraise NotFoundError("no host")\n')
+        self.write('./c.py', 'x = 1\n')
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+
+    def write(self, fname, contents):
+        with open(fname, 'w') as f:
+            f.write(contents)
+
+    def find(self, kind, pattern):
+        return pycscope.Database('cscope.out').find(kind, pattern)
+
+    def testtrigrams(self,):
+        self.assertEqual(sorted(fileTrigrams('abcab')), [0x616263, 0x626361, 0x636162])
+        self.assertEqual(len(fileTrigrams('ab')), 0)
+
+    def testindex(self,):
+        ret = pycscope.main(['arg0', '-R', '--text-index'])
+        self.assertEqual(ret, 0)
+        index = TextIndex('cscope.out.trigrams')
+        try:
+            self.assertEqual(index.fnames, ['./b.py', './c.py', './p/a.py'])
+            self.assertEqual(index.candidates(["socket"]), ['./p/a.py'])
+            self.assertEqual(index.candidates(["host"]), ['./b.py', './p/a.py'])
+            self.assertEqual(index.candidates(["host", "Error"]), ['./b.py'])
+            self.assertEqual(index.candidates(["nosuch"]), [])
+            self.assertEqual(index.candidates([]), ['./b.py', './c.py', './p/a.py'])
+        finally:
+            index.close()
+
+    def testqueries(self,):
+        ret = pycscope.main(['arg0', '-R', '--text-index'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(self.find('text', 'socket.gethostbyname('),
+                         [('./p/a.py', '<unknown>', 4, 'return socket.gethostbyname(host)')])
+        self.assertEqual(self.find('text', 'socket.'), self.find('egrep', r'socket\.'))
+        self.assertEqual(self.find('egrep', r'^class \w+Error\('),
+                         [('./b.py', '<unknown>', 1, 'class NotFoundError(Exception):')])
+        self.assertEqual(self.find('egrep', 'x = 1|pass'),
+                         [('./b.py', '<unknown>', 2, 'pass'), ('./c.py', '<unknown>', 1, 'x = 1')])
+        self.assertEqual(self.find('text', 'nosuch'), [])
+        # Anchored at the start and end of lines in the middle of a file
+        self.assertEqual(self.find('egrep', '^def f'), [('./p/a.py', '<unknown>', 3, 'def f(host):')])
+        self.assertEqual(self.find('egrep', r'host\)$'),
+                         [('./p/a.py', '<unknown>', 4, 'return socket.gethostbyname(host)')])
+        # The same lines are found searching every file
+        found = self.find('egrep', 'host')
+        os.unlink('cscope.out.trigrams')
+        self.assertEqual(self.find('egrep', 'host'), found)
+        self.assertEqual(len(found), 3)
+
+    def testjobs(self,):
+        ret = pycscope.main(['arg0', '-R', '--text-index'])
+        self.assertEqual(ret, 0)
+        with open('cscope.out.trigrams', 'rb') as f:
+            serial = f.read()
+        ret = pycscope.main(['arg0', '-R', '-j', '2', '--text-index'])
+        self.assertEqual(ret, 0)
+        with open('cscope.out.trigrams', 'rb') as f:
+            self.assertEqual(f.read(), serial)
+
+    def testincremental(self,):
+        ret = pycscope.main(['arg0', '-R', '--incremental', '--text-index'])
+        self.assertEqual(ret, 0)
+        self.write('./c.py', 'x = "gethostbyname"\n')
+        ret = pycscope.main(['arg0', '-R', '--incremental', '--text-index'])
+        self.assertEqual(ret, 0)
+        self.assertEqual([ found[0] for found in self.find('text', 'gethostbyname') ], ['./c.py', './p/a.py'])
+
+    def testlarge(self,):
+        # More files than 16 bit file numbers can hold
+        fnames = [ "f%d.py" % i for i in range(0x10000 + 1) ]
+        trigrams = dict([ (fname, fileTrigrams(fname == fnames[-1] and "last" or "")) for fname in fnames ])
+        textindex.writeTextIndex(self.tmpd, 'text.trigrams', fnames, trigrams)
+        index = TextIndex('text.trigrams')
+        try:
+            self.assertEqual(index.itemsize, 4)
+            self.assertEqual(index.candidates(["last"]), [fnames[-1]])
+        finally:
+            index.close()
+
+    def testbad(self,):
+        self.write('cscope.out.trigrams', 'not an index')
+        self.assertRaises(ValueError, TextIndex, 'cscope.out.trigrams')
+        ret = pycscope.main(['arg0', '-R'])
+        self.assertEqual(ret, 0)
+        # An unusable text index is ignored
+        self.assertEqual(len(self.find('text', 'host')), 3)
+        self.assertEqual(pycscope.main(['arg0', '--find', 'egrep', 'a(b']), 2)
+        self.assertEqual(pycscope.main(['arg0', '-R', '--shard-by', 'package', '--text-index']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
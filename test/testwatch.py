@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Unit tests for watch mode.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import pycscope
+import pycscope.watch
+from pycscope.watch import SectionStore, IndexWatcher, InotifyMonitor
+
+
+class TestSectionStore(unittest.TestCase):
+
+    def testputget(self,):
+        store = SectionStore()
+        store.put('a.py', 'ka', ['\n\t@a.py\n\n', '1 \n\t=a\n = 1\n\n'])
+        store.put('b.py', 'kb', b'\n\t@b.py\n\n')
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get('a.py'), b'\n\t@a.py\n\n1 \n\t=a\n = 1\n\n')
+        self.assertEqual(store.get('b.py'), b'\n\t@b.py\n\n')
+        self.assertEqual(store.key('a.py'), 'ka')
+        self.assertEqual(store.key('c.py'), None)
+
+    def testcompact(self,):
+        store = SectionStore()
+        store.put('a.py', 'ka', 'a' * 10)
+        store.put('b.py', 'kb', 'b' * 10)
+        store.put('a.py', 'ka2', 'A' * 5)
+        self.assertEqual(store.garbage, 10)
+        self.assertEqual(len(store.data), 25)
+        store.remove('b.py')
+        # More than half of the buffer was garbage
+        self.assertEqual(store.garbage, 0)
+        self.assertEqual(bytes(store.data), b'AAAAA')
+        self.assertEqual(store.get('a.py'), b'AAAAA')
+        self.assertFalse('b.py' in store)
+
+
+class TestIndexWatcher(unittest.TestCase):
+
+    def setUp(self,):
+        self.orig_wd = os.getcwd()
+        self.tmpd = os.path.realpath(tempfile.mkdtemp())
+        os.chdir(self.tmpd)
+        os.mkdir('sub')
+        self.write('a.py', 'a = 1\n')
+        self.write('sub/b.py', 'b = 2\n')
+        self.indexpath = os.path.join(self.tmpd, 'cscope.out')
+        self.settle_time = pycscope.watch.settle_time
+        pycscope.watch.settle_time = 0.05
+
+    def tearDown(self,):
+        os.chdir(self.orig_wd)
+        shutil.rmtree(self.tmpd)
+        pycscope.watch.settle_time = self.settle_time
+
+    def write(self, fname, contents):
+        with open(os.path.join(self.tmpd, fname), 'w') as f:
+            f.write(contents)
+
+    def index(self,):
+        with open(self.indexpath, 'r') as f:
+            return f.read().split('\n\t@\n')[0]
+
+    def watcher(self, poll=0.01):
+        return IndexWatcher(self.tmpd, ['.'], True, [], self.indexpath, poll=poll)
+
+    def testupdate(self,):
+        watcher = self.watcher()
+        watcher.load()
+        self.assertTrue(self.index().endswith('\n\t@./a.py\n\n1 \n\t=a\n = 1\n\n\n\t@./sub/b.py\n\n1 \n\t=b\n = 2\n\n'))
+        self.assertEqual(watcher.update(), 0)
+
+        self.write('a.py', 'aa = 1\n')
+        self.write('c.py', 'c = 3\n')
+        os.unlink('sub/b.py')
+        self.assertEqual(watcher.update(), 3)
+        self.assertTrue(self.index().endswith('\n\t@./a.py\n\n1 \n\t=aa\n = 1\n\n\n\t@./c.py\n\n1 \n\t=c\n = 3\n\n'))
+        with open(self.indexpath + pycscope.sections_ext, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+        watcher.close()
+
+    def testupdatechanged(self,):
+        watcher = self.watcher()
+        watcher.load()
+        self.write('a.py', 'aa = 1\n')
+        self.write('sub/b.py', 'bb = 2\n')
+        # Only the files known to have changed are looked at
+        self.assertEqual(watcher.update(set([os.path.join(self.tmpd, 'sub', 'b.py')])), 1)
+        self.assertTrue('\t=a\n' in self.index())
+        self.assertTrue('\t=bb\n' in self.index())
+        watcher.close()
+
+    def testrestart(self,):
+        os.utime('a.py', (1000000000, 1000000000))
+        watcher = self.watcher()
+        watcher.load()
+        watcher.close()
+        # Change a.py without changing its size or modification time, so
+        # that its section is reused from the database when restarting.
+        self.write('a.py', 'b = 1\n')
+        os.utime('a.py', (1000000000, 1000000000))
+        watcher = self.watcher()
+        watcher.load()
+        self.assertTrue('\t=a\n' in self.index())
+        watcher.close()
+
+    def testpoll(self,):
+        watcher = self.watcher()
+        watcher.load()
+        self.assertEqual(watcher.wait(0.05), set())
+        self.write('c.py', 'c = 3\n')
+        self.assertEqual(watcher.wait(), set([os.path.join(self.tmpd, 'c.py')]))
+        watcher.close()
+
+    def testinotify(self,):
+        try:
+            InotifyMonitor(self.tmpd).close()
+        except EnvironmentError:
+            raise unittest.SkipTest("inotify is not available")
+        watcher = self.watcher(None)
+        self.assertTrue(isinstance(watcher.monitor, InotifyMonitor))
+        watcher.load()
+        self.assertEqual(watcher.wait(0.05), set())
+        self.write('sub/b.py', 'bb = 2\n')
+        self.write('sub/notes.txt', 'ignored\n')
+        self.assertEqual(watcher.wait(), set([os.path.join(self.tmpd, 'sub', 'b.py')]))
+        os.mkdir('sub/new')
+        self.assertEqual(watcher.wait(), set([os.path.join(self.tmpd, 'sub', 'new')]))
+        watcher.update(set([os.path.join(self.tmpd, 'sub', 'new')]))
+        # New directories are watched once seen
+        self.write('sub/new/d.py', 'd = 4\n')
+        self.assertEqual(watcher.wait(), set([os.path.join(self.tmpd, 'sub', 'new', 'd.py')]))
+        watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
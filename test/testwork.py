@@ -30,3 +30,56 @@ class TestWork(unittest.TestCase):
             self.assertEquals(fbuf, ['a', 's', 'b'])
         finally:
             shutil.rmtree(tmpd)
+
+    def testworkjobs(self,):
+        tmpd = tempfile.mkdtemp()
+        try:
+            # Create enough files to span several chunks, with one that is
+            # syntactically incorrect in the middle.
+            names = []
+            for i in range(200):
+                name = 'f%03d' % i
+                with open(os.path.join(tmpd, name), "w") as f:
+                    if i == 100:
+                        f.write("a a (b)\n")
+                    else:
+                        f.write("%s = %d\n" % (name, i))
+                names.append(name)
+
+            # Actual test, the parallel results must match the serial ones
+            ibuf, fbuf = pycscope.work(tmpd, names, False)
+            pibuf, pfbuf = pycscope.work(tmpd, names, False, 4)
+            self.assertEquals(''.join(pibuf), ''.join(ibuf))
+            self.assertEquals(pfbuf, fbuf)
+        finally:
+            shutil.rmtree(tmpd)
+
+    def testworkreadahead(self,):
+        tmpd = tempfile.mkdtemp()
+        try:
+            names = []
+            for i in range(50):
+                name = 'f%03d' % i
+                with open(os.path.join(tmpd, name), "w") as f:
+                    if i == 25:
+                        f.write("a a (b)\n")
+                    else:
+                        f.write("%s = %d\n" % (name, i))
+                names.append(name)
+            # A file which cannot be read is reported, and skipped
+            names.insert(10, 'missing')
+
+            ibuf, fbuf = pycscope.work(tmpd, names, False)
+            for readahead in (1, 8):
+                pycscope.readahead = readahead
+                try:
+                    rabuf = pycscope.work(tmpd, names, False)
+                    rajbuf = pycscope.work(tmpd, names, False, 2)
+                finally:
+                    pycscope.readahead = 0
+                self.assertEquals(rabuf, (ibuf, fbuf))
+                self.assertEquals(''.join(rajbuf[0]), ''.join(ibuf))
+                self.assertEquals(rajbuf[1], fbuf)
+            self.assertEquals(len(fbuf), 50)
+        finally:
+            shutil.rmtree(tmpd)
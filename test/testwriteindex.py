@@ -4,6 +4,7 @@
 
 import unittest
 from cStringIO import StringIO
+from io import BytesIO
 import pycscope
 
 
@@ -13,3 +14,22 @@ class TestWriteIndex(unittest.TestCase):
         fout = StringIO()
         pycscope.writeIndex("/tmp/foo/bar", fout, ['mockline1','mockline2'], ["fname1","fname2"])
         self.assertEquals("cscope 15 /tmp/foo/bar -c 0000000055mockline1mockline2\n1\n.\n0\n2\n14\nfname1\nfname2\n", fout.getvalue())
+
+
+class TestIndexWriter(unittest.TestCase):
+
+    def testwriter(self,):
+        fout = BytesIO()
+        writer = pycscope.IndexWriter("/tmp/foo/bar", fout)
+        writer.write("fname1", "mockline1")
+        writer.write("fname2", ["mock", "line2"])
+        writer.close()
+        self.assertEquals(b"cscope 15 /tmp/foo/bar -c 0000000058mockline1mockline2\n\t@\n1\n.\n0\n2\n14\nfname1\nfname2\n", fout.getvalue())
+
+    def testwriterutf8(self,):
+        # Offsets and sizes are in bytes, not characters
+        fout = BytesIO()
+        writer = pycscope.IndexWriter(u"/tmp/f\u00f6\u00f6", fout)
+        writer.write(u"\u00e9.py", u"\n\t@\u00e9.py\n\n")
+        writer.close()
+        self.assertEquals(u"cscope 15 /tmp/f\u00f6\u00f6 -c 0000000048\n\t@\u00e9.py\n\n\n\t@\n1\n.\n0\n1\n6\n\u00e9.py\n".encode('utf-8'), fout.getvalue())